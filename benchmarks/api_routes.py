@@ -0,0 +1,610 @@
+"""Load and latency benchmark for every route of room_bp, product_bp and user_bp
+
+Builds a synthetic dataset at a configurable scale, then drives each route
+in-process through the Flask test client and against a local multi-worker
+gunicorn server, reporting throughput, p50/p95/p99 latency and SQL queries
+per request. Datasets are generated from a seed and cached under
+benchmarks/.data; every mode runs against a fresh copy, so writes made by
+one run never leak into the next.
+
+Run with:
+    python benchmarks/api_routes.py
+    python benchmarks/api_routes.py --mode inprocess --users 50 --requests 100
+    python benchmarks/api_routes.py --save-baseline
+    python benchmarks/api_routes.py --check --threshold 0.25
+
+--check compares against benchmarks/baselines/api_routes.json and exits 1
+if a route's p95 latency rose or its throughput fell by more than the
+threshold, or if it now issues more queries per request. Timings only
+compare on the machine and scale they were recorded with, so record the
+baseline with --save-baseline where the check runs; baselines are not
+committed.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(BENCH_DIR, os.pardir))
+sys.path.insert(0, project_root)
+
+DATA_DIR = os.path.join(BENCH_DIR, '.data')
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baselines', 'api_routes.json')
+
+# Keep scan blobs, spooled clicks and the catalog version out of src/database
+os.makedirs(DATA_DIR, exist_ok=True)
+os.environ.setdefault('SCAN_BLOB_DIR', os.path.join(DATA_DIR, 'blobs'))
+os.environ.setdefault('CLICK_SPOOL_PATH', os.path.join(DATA_DIR, 'click_spool.ndjson'))
+os.environ.setdefault('CATALOG_VERSION_PATH', os.path.join(DATA_DIR, 'catalog.version'))
+
+from sqlalchemy import event, insert
+from src.main import create_app
+from src.models.user import db, User
+from src.models.room import Room, RoomItem, OrganizationSuggestion
+from src.models.product import Product, AffiliateClick
+from src.services.account_export import export_lines
+from src.services.blob_store import scan_store
+from src.services.click_rollups import backfill_click_rollups
+from src.services.jobs import job_queue
+from src.services.suggestion_jobs import load_rooms, replace_suggestions
+from src.services.suggestions import suggest_for_rooms
+from src.utils.raw_json import encode_json
+
+ITEM_CATEGORIES = ['furniture', 'storage', 'lighting', 'clothing', 'books', 'electronics', 'decor', 'kitchenware']
+PRODUCT_CATEGORIES = ['storage', 'furniture', 'lighting', 'decor', 'organization']
+MERCHANTS = ['IKEA', 'Wayfair', 'Amazon', 'Target', 'The Container Store']
+WORDS = ['shelf', 'bin', 'basket', 'lamp', 'drawer', 'rack', 'cabinet', 'hook', 'ottoman', 'organizer']
+SCAN_TEMPLATES = 8
+
+# ---------------------------------------------------------------------------
+# App
+
+_queries = threading.local()
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    _queries.count = getattr(_queries, 'count', 0) + 1
+
+def make_app(database_uri):
+    """The API as deployed, with room_bp, product_bp and user_bp, counting SQL statements per request"""
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': database_uri,
+        'BLUEPRINTS': ['src.routes.room', 'src.routes.product', 'src.routes.user']
+    })
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', _count_query)
+
+    @app.before_request
+    def reset_query_count():
+        _queries.count = 0
+
+    @app.after_request
+    def report_query_count(response):
+        # Statements run while a streamed body is generated are not included
+        response.headers['X-Query-Count'] = str(getattr(_queries, 'count', 0))
+        return response
+
+    return app
+
+def server_app():
+    """Entry point for the gunicorn workers of the server mode"""
+    return make_app(os.environ['BENCH_DATABASE_URI'])
+
+# ---------------------------------------------------------------------------
+# Dataset
+
+def dataset_key(args):
+    # Clicks are spread over the days before the build, so a dataset is rebuilt daily
+    return (f'u{args.users}-r{args.rooms_per_user}-i{args.items_per_room}-p{args.products}'
+            f'-c{args.clicks}-n{args.warmup + args.requests}-s{args.seed}-{datetime.utcnow():%Y%m%d}')
+
+def build_dataset(args):
+    """Generate (or reuse) the cached dataset for `args`, returning its directory"""
+    directory = os.path.join(DATA_DIR, dataset_key(args))
+    if os.path.exists(os.path.join(directory, 'manifest.json')):
+        return directory
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    started = time.perf_counter()
+
+    rng = random.Random(args.seed)
+    spare = args.warmup + args.requests  # rows consumed by one mode's DELETE requests
+    app = make_app(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(User), [
+            {'id': user_id, 'username': f'user{user_id}', 'email': f'user{user_id}@example.com'}
+            for user_id in range(1, args.users + spare + 2)
+        ])
+        # The last user owns the spare rooms and receives imports; the users before it are deleted
+        owner_id = args.users + spare + 1
+
+        scan_refs = [scan_store.put(encode_json(_make_scan(rng))) for _ in range(SCAN_TEMPLATES)]
+        rooms, items = [], []
+        room_count = args.users * args.rooms_per_user
+        for index in range(room_count):
+            room_id = index + 1
+            width, length = rng.uniform(3, 8), rng.uniform(3, 8)
+            rooms.append({
+                'id': room_id,
+                'name': f'Room {room_id}',
+                'user_id': index // args.rooms_per_user + 1,
+                'dimensions': encode_json({'width': round(width, 2), 'height': 2.7, 'length': round(length, 2)}),
+                'scan_ref': rng.choice(scan_refs)
+            })
+            for number in range(args.items_per_room):
+                items.append({
+                    'id': index * args.items_per_room + number + 1,
+                    'room_id': room_id,
+                    'name': f'{rng.choice(WORDS)} {number}',
+                    'category': rng.choice(ITEM_CATEGORIES),
+                    'position': encode_json({
+                        'x': round(rng.uniform(0, width), 3), 'y': round(rng.uniform(0, 2), 3),
+                        'z': round(rng.uniform(0, length), 3),
+                        'width': round(rng.uniform(0.2, 0.8), 2), 'depth': round(rng.uniform(0.2, 0.8), 2)
+                    }),
+                    'confidence': round(rng.random(), 3)
+                })
+        rooms += [
+            {'id': room_count + number + 1, 'name': f'Spare {number}', 'user_id': owner_id,
+             'dimensions': encode_json({'width': 4, 'height': 2.7, 'length': 4}), 'scan_ref': scan_refs[0]}
+            for number in range(spare)
+        ]
+        db.session.execute(insert(Room), rooms)
+        db.session.execute(insert(RoomItem), items)
+
+        for start in range(0, room_count, 1000):
+            room_ids = list(range(start + 1, min(start + 1000, room_count) + 1))
+            replace_suggestions(suggest_for_rooms(load_rooms(room_ids)))
+        db.session.commit()
+
+        db.session.execute(insert(Product), [
+            {
+                'id': product_id,
+                'name': f'{rng.choice(WORDS).title()} {product_id}',
+                'description': f'A {rng.choice(WORDS)} for every {rng.choice(WORDS)}',
+                'category': rng.choice(PRODUCT_CATEGORIES),
+                'merchant': rng.choice(MERCHANTS),
+                'sku': f'SKU-{product_id}',
+                'affiliate_link': f'https://example.com/p/{product_id}',
+                'price': round(rng.uniform(5, 300), 2),
+                'is_active': rng.random() > 0.1
+            }
+            for product_id in range(1, args.products + 1)
+        ])
+        now = datetime.utcnow()
+        clicks = []
+        for _ in range(args.clicks):
+            user_id = rng.randint(1, args.users)
+            clicks.append({
+                'product_id': rng.randint(1, args.products),
+                'user_id': user_id,
+                'room_id': (user_id - 1) * args.rooms_per_user + rng.randint(1, args.rooms_per_user),
+                'timestamp': now - timedelta(seconds=rng.randint(0, 7 * 86400))
+            })
+        for start in range(0, len(clicks), 10000):
+            db.session.execute(insert(AffiliateClick), clicks[start:start + 10000])
+        db.session.commit()
+        backfill_click_rollups()
+
+        suggestions = db.session.query(OrganizationSuggestion.room_id, OrganizationSuggestion.id).order_by(
+            OrganizationSuggestion.id
+        ).all()
+        with open(os.path.join(directory, 'import.ndjson'), 'w') as f:
+            f.writelines(export_lines(1))
+        db.session.remove()
+        db.engine.dispose()
+
+    manifest = {
+        'users': args.users,
+        'rooms_per_user': args.rooms_per_user,
+        'items_per_room': args.items_per_room,
+        'products': args.products,
+        'room_count': room_count,
+        'owner_id': owner_id,
+        'spare_user_ids': list(range(args.users + 1, owner_id)),
+        'spare_room_ids': list(range(room_count + 1, room_count + spare + 1)),
+        'suggestions': [list(row) for row in rng.sample(suggestions, min(len(suggestions), spare))]
+    }
+    with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+    print(f'Built dataset {os.path.basename(directory)} in {time.perf_counter() - started:.1f}s')
+    return directory
+
+def _make_scan(rng, points=500):
+    return {
+        'device': 'iPhone 15 Pro',
+        'points': [{'x': rng.uniform(0, 6), 'y': rng.uniform(0, 3), 'z': rng.uniform(0, 5)} for _ in range(points)]
+    }
+
+def fresh_copy(directory, name):
+    """Copy the dataset's database for one mode's run, returning its SQLAlchemy URI"""
+    path = os.path.join(directory, f'run-{name}.db')
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+    shutil.copyfile(os.path.join(directory, 'bench.db'), path)
+    return f'sqlite:///{path}'
+
+# ---------------------------------------------------------------------------
+# Routes
+
+class Route:
+    """One route of a blueprint and how to build a request for it
+
+    `build(rng, data)` returns (path, body, headers); `expected` lists the
+    statuses that count as success.
+    """
+
+    def __init__(self, blueprint, method, rule, build, expected=(200,)):
+        self.name = f'{blueprint} {method} {rule}'
+        self.method = method
+        self.build = build
+        self.expected = expected
+
+def _json(payload):
+    return json.dumps(payload).encode(), {'Content-Type': 'application/json'}
+
+class RouteData:
+    """The dataset's ids, handed out to request builders"""
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            manifest = json.load(f)
+        with open(os.path.join(directory, 'import.ndjson'), 'rb') as f:
+            self.import_body = f.read()
+        self.users = manifest['users']
+        self.rooms_per_user = manifest['rooms_per_user']
+        self.items_per_room = manifest['items_per_room']
+        self.products = manifest['products']
+        self.room_count = manifest['room_count']
+        self.owner_id = manifest['owner_id']
+        self.spare_user_ids = list(manifest['spare_user_ids'])
+        self.spare_room_ids = list(manifest['spare_room_ids'])
+        self.suggestions = [tuple(pair) for pair in manifest['suggestions']]
+        self._names = itertools.count(1)
+        self._nonce = f'{os.getpid()}-{int(time.time())}'
+
+    def user(self, rng):
+        return rng.randint(1, self.users)
+
+    def room(self, rng):
+        return rng.randint(1, self.room_count)
+
+    def item(self, rng, room_id):
+        return (room_id - 1) * self.items_per_room + rng.randint(1, self.items_per_room)
+
+    def product(self, rng):
+        return rng.randint(1, self.products)
+
+    def unique_name(self):
+        return f'bench-{self._nonce}-{next(self._names)}'
+
+def _room_payload(rng):
+    return {
+        'name': 'Benchmark Room',
+        'user_id': 1,
+        'dimensions': {'width': 4.0, 'height': 2.7, 'length': 5.0},
+        'scan_data': {'points': [{'x': rng.random(), 'y': rng.random(), 'z': rng.random()} for _ in range(50)]},
+        'items': [
+            {'name': f'item {n}', 'category': rng.choice(ITEM_CATEGORIES),
+             'position': {'x': rng.uniform(0, 4), 'y': 0.0, 'z': rng.uniform(0, 5)}, 'confidence': 0.9}
+            for n in range(10)
+        ]
+    }
+
+def _feed(rng, data):
+    lines = [
+        json.dumps({'sku': f'SKU-{product_id}', 'merchant': 'Benchmark Feed', 'name': f'Feed product {product_id}',
+                    'affiliate_link': f'https://example.com/feed/{product_id}', 'category': rng.choice(PRODUCT_CATEGORIES),
+                    'price': round(rng.uniform(5, 100), 2)})
+        for product_id in range(50)
+    ]
+    return '\n'.join(lines).encode(), {'Content-Type': 'application/x-ndjson'}
+
+def routes():
+    """Every route of the three blueprints; reads first, then writes, so write targets stay valid"""
+    def get(path):
+        return path, None, {}
+
+    def room_get(suffix=''):
+        return lambda rng, data: get(f'/api/rooms/{data.room(rng)}{suffix}')
+
+    return [
+        Route('room', 'GET', '/rooms', lambda rng, data: get(f'/api/rooms?user_id={data.user(rng)}&limit=50')),
+        Route('room', 'GET', '/rooms/<id>', room_get()),
+        Route('room', 'GET', '/rooms/<id>/scan', lambda rng, data: (
+            f'/api/rooms/{data.room(rng)}/scan', None, {'Accept-Encoding': 'gzip'})),
+        Route('room', 'GET', '/rooms/<id>/layout', room_get('/layout')),
+        Route('room', 'GET', '/rooms/<id>/items/nearby', room_get('/items/nearby?x=2&y=1&z=2&radius=1.5')),
+        Route('room', 'GET', '/rooms/<id>/items/within', room_get('/items/within?min_x=1&max_x=3&min_z=1&max_z=3')),
+        Route('room', 'GET', '/rooms/<id>/items/nearest', room_get('/items/nearest?x=2&y=1&z=2&k=5')),
+        Route('room', 'GET', '/rooms/<id>/suggestions', room_get('/suggestions')),
+        Route('product', 'GET', '/products', lambda rng, data: get(
+            f'/api/products?category={rng.choice(PRODUCT_CATEGORIES)}')),
+        Route('product', 'GET', '/products/search', lambda rng, data: get(f'/api/products/search?q={rng.choice(WORDS)}')),
+        Route('product', 'GET', '/products/<id>', lambda rng, data: get(f'/api/products/{data.product(rng)}')),
+        Route('product', 'GET', '/products/cache/stats', lambda rng, data: get('/api/products/cache/stats')),
+        Route('product', 'GET', '/rooms/<id>/recommendations', room_get('/recommendations')),
+        Route('product', 'GET', '/rooms/<id>/also-clicked', room_get('/also-clicked')),
+        Route('product', 'GET', '/products/<id>/also-clicked', lambda rng, data: get(
+            f'/api/products/{data.product(rng)}/also-clicked')),
+        Route('product', 'GET', '/analytics/clicks', lambda rng, data: get('/api/analytics/clicks?days=30')),
+        Route('user', 'GET', '/users', lambda rng, data: get('/api/users')),
+        Route('user', 'GET', '/users/<id>', lambda rng, data: get(f'/api/users/{data.user(rng)}')),
+        Route('user', 'GET', '/users/<id>/export', lambda rng, data: (
+            f'/api/users/{data.user(rng)}/export', None, {'Accept-Encoding': 'gzip'})),
+
+        Route('room', 'POST', '/rooms/<id>/suggestions/<id>/implement', lambda rng, data: (
+            '/api/rooms/{}/suggestions/{}/implement'.format(*data.suggestions.pop()), None, {})),
+        Route('room', 'PUT', '/rooms/<id>', lambda rng, data: (
+            f'/api/rooms/{data.room(rng)}', *_json({'name': data.unique_name()}))),
+        Route('room', 'PATCH', '/rooms/<id>', lambda rng, data: (
+            lambda room_id: (f'/api/rooms/{room_id}', *_json({'items': {'update': [
+                {'id': data.item(rng, room_id), 'position': {'x': round(rng.uniform(0, 3), 3)}}
+            ]}})))(data.room(rng))),
+        Route('room', 'POST', '/rooms', lambda rng, data: ('/api/rooms', *_json(_room_payload(rng))), expected=(201,)),
+        Route('room', 'DELETE', '/rooms/<id>', lambda rng, data: (f'/api/rooms/{data.spare_room_ids.pop()}', None, {})),
+        Route('room', 'POST', '/rooms/suggestions/regenerate', lambda rng, data: (
+            '/api/rooms/suggestions/regenerate', *_json({'user_id': data.owner_id})), expected=(202,)),
+        Route('product', 'POST', '/products/<id>/click', lambda rng, data: (
+            f'/api/products/{data.product(rng)}/click', *_json({'user_id': data.user(rng), 'room_id': data.room(rng)}))),
+        Route('product', 'POST', '/products/import', lambda rng, data: (
+            '/api/products/import?deactivate_missing=false', *_feed(rng, data))),
+        Route('product', 'POST', '/products/seed', lambda rng, data: ('/api/products/seed', None, {})),
+        Route('user', 'POST', '/users', lambda rng, data: (
+            lambda name: ('/api/users', *_json({'username': name, 'email': f'{name}@example.com'})))(data.unique_name()),
+            expected=(201,)),
+        Route('user', 'PUT', '/users/<id>', lambda rng, data: (
+            lambda user_id: (f'/api/users/{user_id}', *_json({'email': f'user{user_id}@example.com'})))(data.user(rng))),
+        Route('user', 'DELETE', '/users/<id>', lambda rng, data: (f'/api/users/{data.spare_user_ids.pop()}', None, {}),
+              expected=(204,)),
+        Route('user', 'POST', '/users/<id>/import', lambda rng, data: (
+            f'/api/users/{data.owner_id}/import', data.import_body, {'Content-Type': 'application/x-ndjson'}),
+            expected=(201,)),
+    ]
+
+# ---------------------------------------------------------------------------
+# Drivers
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+def summarize(latencies, queries, statuses, route, elapsed):
+    latencies = sorted(latencies)
+    errors = sum(count for status, count in statuses.items() if status not in route.expected)
+    return {
+        'requests': len(latencies),
+        'throughput': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'queries': round(sum(queries) / len(queries), 2) if queries else None,
+        'errors': errors,
+        'statuses': {str(status): count for status, count in sorted(statuses.items())}
+    }
+
+def run_inprocess(directory, args):
+    """Drive each route sequentially through the Flask test client"""
+    app = make_app(fresh_copy(directory, 'inprocess'))
+    client = app.test_client()
+    data = RouteData(directory)
+    results = {}
+    for route in routes():
+        rng = random.Random(f'{args.seed}:{route.name}')
+        requests = [route.build(rng, data) for _ in range(args.warmup + args.requests)]
+        latencies, queries, statuses = [], [], {}
+        started = None
+        for number, (path, body, headers) in enumerate(requests):
+            if number == args.warmup:
+                started = time.perf_counter()
+            _queries.count = 0
+            begin = time.perf_counter()
+            response = client.open(path, method=route.method, data=body, headers=headers)
+            response.get_data()
+            latency = time.perf_counter() - begin
+            if number >= args.warmup:
+                latencies.append(latency)
+                queries.append(_queries.count)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        results[route.name] = summarize(latencies, queries, statuses, route, time.perf_counter() - started)
+        _report_line(route.name, results[route.name])
+    with app.app_context():
+        db.engine.dispose()
+    return results
+
+def run_server(directory, args):
+    """Drive each route with `concurrency` keep-alive clients against a gunicorn server"""
+    port = _free_port()
+    env = dict(os.environ, BENCH_DATABASE_URI=fresh_copy(directory, 'server'))
+    server = subprocess.Popen([
+        sys.executable, '-m', 'gunicorn', '--pythonpath', BENCH_DIR, '--bind', f'127.0.0.1:{port}',
+        '--workers', str(args.workers), '--threads', str(args.threads), '--worker-class', 'gthread',
+        '--graceful-timeout', '5', '--log-level', 'warning', 'api_routes:server_app()'
+    ], env=env, cwd=project_root)
+    try:
+        _wait_for(port, server)
+        data = RouteData(directory)
+        local = threading.local()
+
+        def send(request):
+            method, path, body, headers = request
+            for attempt in range(2):
+                if not hasattr(local, 'connection'):
+                    local.connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                begin = time.perf_counter()
+                try:
+                    local.connection.request(method, path, body=body, headers=headers)
+                    response = local.connection.getresponse()
+                    response.read()
+                    break
+                except (http.client.RemoteDisconnected, ConnectionError):
+                    # gunicorn closed the idle keep-alive connection; reconnect and resend once
+                    local.connection.close()
+                    del local.connection
+                    if attempt:
+                        raise
+            latency = time.perf_counter() - begin
+            if response.getheader('Connection', '').lower() == 'close':
+                local.connection.close()
+                del local.connection
+            return latency, int(response.getheader('X-Query-Count', 0)), response.status
+
+        results = {}
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            for route in routes():
+                rng = random.Random(f'{args.seed}:{route.name}')
+                requests = [(route.method, *route.build(rng, data)) for _ in range(args.warmup + args.requests)]
+                list(pool.map(send, requests[:args.warmup]))
+                started = time.perf_counter()
+                samples = list(pool.map(send, requests[args.warmup:]))
+                elapsed = time.perf_counter() - started
+                statuses = {}
+                for _, _, status in samples:
+                    statuses[status] = statuses.get(status, 0) + 1
+                results[route.name] = summarize(
+                    [sample[0] for sample in samples], [sample[1] for sample in samples], statuses, route, elapsed
+                )
+                _report_line(route.name, results[route.name])
+        return results
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def _wait_for(port, server, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with status {server.returncode}')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/api/products/cache/stats')
+            connection.getresponse().read()
+            connection.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'gunicorn did not answer on port {port} within {timeout}s')
+
+# ---------------------------------------------------------------------------
+# Reporting and baselines
+
+def _report_header(mode):
+    print(f'\n[{mode}]')
+    print(f"{'route':<52} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'errors':>7}")
+
+def _report_line(name, result):
+    print(f"{name:<52} {result['throughput']:>9} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} "
+          f"{result['p99_ms']:>8.2f} {result['queries']:>8} {result['errors']:>7}")
+
+def scale(args):
+    return {name: getattr(args, name) for name in (
+        'users', 'rooms_per_user', 'items_per_room', 'products', 'clicks', 'requests', 'warmup',
+        'concurrency', 'workers', 'threads', 'seed'
+    )}
+
+def check(results, baseline, threshold, min_delta_ms):
+    """Regressions of `results` against `baseline`, as human-readable lines"""
+    regressions = []
+    for mode, routes_results in results.items():
+        for name, result in routes_results.items():
+            before = baseline.get('results', {}).get(mode, {}).get(name)
+            if before is None:
+                continue
+            if result['p95_ms'] > before['p95_ms'] * (1 + threshold) and result['p95_ms'] - before['p95_ms'] > min_delta_ms:
+                regressions.append(f"{mode} {name}: p95 {before['p95_ms']:.2f} -> {result['p95_ms']:.2f} ms")
+            # Throughput is compared as time per request, so the same absolute slack applies
+            slower_ms = 1000 / result['throughput'] - 1000 / before['throughput']
+            if result['throughput'] < before['throughput'] * (1 - threshold) and slower_ms > min_delta_ms:
+                regressions.append(f"{mode} {name}: throughput {before['throughput']} -> {result['throughput']} req/s")
+            if result['queries'] is not None and before['queries'] is not None and result['queries'] > before['queries'] + 0.5:
+                regressions.append(f"{mode} {name}: queries per request {before['queries']} -> {result['queries']}")
+            if result['errors'] > before['errors']:
+                regressions.append(f"{mode} {name}: errors {before['errors']} -> {result['errors']}")
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=('inprocess', 'server', 'both'), default='both')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--rooms-per-user', type=int, default=10)
+    parser.add_argument('--items-per-room', type=int, default=15)
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--clicks', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=200, help='Measured requests per route.')
+    parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per route before measuring.')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients in server mode.')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes in server mode.')
+    parser.add_argument('--threads', type=int, default=4, help='Threads per gunicorn worker.')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help='Record these results as the baseline.')
+    parser.add_argument('--check', action='store_true', help='Exit 1 if results regressed against the baseline.')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Allowed relative p95/throughput change.')
+    parser.add_argument('--min-delta-ms', type=float, default=0.5, help='Ignore p95 and time-per-request increases smaller than this.')
+    parser.add_argument('--output', help='Also write the results as JSON to this path.')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    # One log line per request would drown the report
+    logging.getLogger('src.services.request_metrics').setLevel(logging.ERROR)
+    directory = build_dataset(args)
+    results = {}
+    if args.mode in ('inprocess', 'both'):
+        _report_header('inprocess')
+        results['inprocess'] = run_inprocess(directory, args)
+    if args.mode in ('server', 'both'):
+        _report_header(f'server: {args.workers} workers x {args.threads} threads, {args.concurrency} clients')
+        results['server'] = run_server(directory, args)
+    job_queue.shutdown()
+
+    report = {'scale': scale(args), 'recorded_at': datetime.utcnow().isoformat(timespec='seconds'), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+        print(f'\nBaseline written to {args.baseline}')
+    if args.check:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['scale'] != report['scale']:
+            print(f"\nBaseline was recorded at a different scale: {baseline['scale']}")
+            return 2
+        regressions = check(results, baseline, args.threshold, args.min_delta_ms)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        print(f'\n{len(regressions)} regressions against {args.baseline}')
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,59 @@
+"""Compare decode/re-encode of stored scan JSON against RawJSON splicing
+
+Run with: python benchmarks/json_passthrough.py
+"""
+import json
+import os
+import random
+import sys
+import timeit
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, project_root)
+
+from src.utils.raw_json import RawJSON, dumps_with_raw, encode_json
+
+def make_scan(points):
+    """Synthetic LiDAR-style scan: a point cloud plus detected planes and metadata"""
+    rng = random.Random(points)
+    return {
+        'device': 'iPhone 15 Pro',
+        'format_version': 2,
+        'points': [
+            {'x': rng.uniform(0, 6), 'y': rng.uniform(0, 3), 'z': rng.uniform(0, 5), 'c': rng.random()}
+            for _ in range(points)
+        ],
+        'planes': [
+            {'normal': [0, 1, 0], 'extent': [rng.uniform(1, 6), rng.uniform(1, 5)], 'label': 'floor'}
+            for _ in range(points // 500 + 1)
+        ],
+    }
+
+def room_payload(dimensions, scan_data, raw):
+    wrap = RawJSON if raw else json.loads
+    return {
+        'id': 1,
+        'name': 'Living Room',
+        'user_id': 1,
+        'dimensions': wrap(dimensions),
+        'scan_data': wrap(scan_data),
+        'items': [],
+        'created_at': '2026-01-01T00:00:00',
+        'updated_at': '2026-01-01T00:00:00',
+    }
+
+def main():
+    dimensions = encode_json({'width': 4.2, 'height': 2.7, 'length': 5.1})
+    print(f"{'scan size':>12} {'decode+encode':>15} {'raw splice':>12} {'speedup':>9}")
+    for points in (1_000, 10_000, 50_000):
+        scan_data = encode_json(make_scan(points))
+        assert json.loads(dumps_with_raw(room_payload(dimensions, scan_data, raw=True))) == \
+            json.loads(json.dumps(room_payload(dimensions, scan_data, raw=False)))
+
+        number = max(1, 200_000 // points)
+        current = timeit.timeit(lambda: json.dumps(room_payload(dimensions, scan_data, raw=False)), number=number) / number
+        spliced = timeit.timeit(lambda: dumps_with_raw(room_payload(dimensions, scan_data, raw=True)), number=number) / number
+        print(f'{len(scan_data) / 1024:>9.0f} KB {current * 1000:>12.2f} ms {spliced * 1000:>9.3f} ms {current / spliced:>8.0f}x')
+
+if __name__ == '__main__':
+    main()
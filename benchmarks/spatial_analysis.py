@@ -0,0 +1,104 @@
+"""Compare the vectorized layout analysis against a pure-Python baseline
+
+Run with: python benchmarks/spatial_analysis.py
+"""
+import math
+import os
+import random
+import sys
+import timeit
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, project_root)
+
+from src.services.spatial import (
+    CROWDED_DISTANCE, DENSITY_CELL, FLOOR_RESOLUTION, HOTSPOT_ITEMS, ZONE_RADIUS, RoomLayout, analyze_rooms
+)
+
+def make_room(items, seed):
+    """Synthetic room: items scattered around a few furniture clusters"""
+    rng = random.Random(seed)
+    dimensions = {'width': rng.uniform(3, 8), 'height': 2.7, 'length': rng.uniform(3, 8)}
+    centres = [(rng.uniform(0, dimensions['width']), rng.uniform(0, dimensions['length'])) for _ in range(5)]
+    positions = []
+    for _ in range(items):
+        cx, cz = rng.choice(centres)
+        positions.append({
+            'x': min(max(rng.gauss(cx, 0.6), 0), dimensions['width']),
+            'y': rng.uniform(0, 2),
+            'z': min(max(rng.gauss(cz, 0.6), 0), dimensions['length']),
+            'width': rng.uniform(0.1, 0.8),
+            'depth': rng.uniform(0.1, 0.8)
+        })
+    return dimensions, [{'position': position} for position in positions]
+
+def baseline(dimensions, items):
+    """The same metrics computed with plain loops over item dicts"""
+    points = [(item['position']['x'], item['position']['z']) for item in items]
+    sizes = [(item['position']['width'], item['position']['depth']) for item in items]
+    x0 = min([0.0] + [x - w / 2 for (x, _), (w, _) in zip(points, sizes)])
+    z0 = min([0.0] + [z - d / 2 for (_, z), (_, d) in zip(points, sizes)])
+    x1 = max([dimensions['width']] + [x + w / 2 for (x, _), (w, _) in zip(points, sizes)])
+    z1 = max([dimensions['length']] + [z + d / 2 for (_, z), (_, d) in zip(points, sizes)])
+
+    cells = {}
+    for x, z in points:
+        key = (int((x - x0) // DENSITY_CELL), int((z - z0) // DENSITY_CELL))
+        cells[key] = cells.get(key, 0) + 1
+    hotspots = sum(1 for count in cells.values() if count >= HOTSPOT_ITEMS)
+
+    nx, nz = math.ceil((x1 - x0) / FLOOR_RESOLUTION), math.ceil((z1 - z0) / FLOOR_RESOLUTION)
+    covered = set()
+    for (x, z), (w, d) in zip(points, sizes):
+        for i in range(max(0, math.floor((x - w / 2 - x0) / FLOOR_RESOLUTION)), min(nx, math.ceil((x + w / 2 - x0) / FLOOR_RESOLUTION))):
+            for j in range(max(0, math.floor((z - d / 2 - z0) / FLOOR_RESOLUTION)), min(nz, math.ceil((z + d / 2 - z0) / FLOOR_RESOLUTION))):
+                covered.add((i, j))
+    free = (nx * nz - len(covered)) * FLOOR_RESOLUTION * FLOOR_RESOLUTION
+
+    nearest = []
+    neighbours = [[] for _ in points]
+    for i, (xi, zi) in enumerate(points):
+        best = math.inf
+        for j, (xj, zj) in enumerate(points):
+            if i != j:
+                distance = math.hypot(xi - xj, zi - zj)
+                best = min(best, distance)
+                if distance <= ZONE_RADIUS:
+                    neighbours[i].append(j)
+        nearest.append(best)
+
+    zones = 0
+    seen = set()
+    for start in range(len(points)):
+        if start in seen:
+            continue
+        zones += 1
+        stack = [start]
+        seen.add(start)
+        while stack:
+            for j in neighbours[stack.pop()]:
+                if j not in seen:
+                    seen.add(j)
+                    stack.append(j)
+
+    return {'hotspots': hotspots, 'free_floor_area': round(free, 2), 'zones': zones,
+            'crowded_items': sum(1 for distance in nearest if distance < CROWDED_DISTANCE)}
+
+def vectorized(rooms):
+    return analyze_rooms([RoomLayout.from_items(dimensions, items) for dimensions, items in rooms])
+
+def main():
+    print(f"{'rooms x items':>15} {'pure Python':>13} {'NumPy':>11} {'speedup':>9}")
+    for room_count, items in ((1, 50), (1, 200), (1, 500), (1, 1000), (1000, 20), (200, 150)):
+        rooms = [make_room(items, seed) for seed in range(room_count)]
+        for (dimensions, room_items), analysis in zip(rooms, vectorized(rooms)):
+            expected = baseline(dimensions, room_items)
+            assert {key: analysis[key] for key in expected} == expected, (expected, analysis)
+
+        number = max(1, 2000 // (room_count * items) + 1)
+        current = timeit.timeit(lambda: [baseline(*room) for room in rooms], number=number) / number
+        batched = timeit.timeit(lambda: vectorized(rooms), number=number) / number
+        print(f'{room_count:>6} x {items:<6} {current * 1000:>10.1f} ms {batched * 1000:>8.2f} ms {current / batched:>8.0f}x')
+
+if __name__ == '__main__':
+    main()
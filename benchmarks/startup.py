@@ -0,0 +1,201 @@
+"""Startup cost of the API: imports, app creation and preforked worker readiness
+
+Each run starts a fresh interpreter against a database prepared by
+`flask bootstrap`, and times
+    import    `from src.main import create_app`
+    create    `create_app()`: config, models, blueprints, static manifest
+    worker    fork of the created app to the child's first response, which
+              is what a gunicorn worker pays with preload_app
+    cold      import + create + first response in one process, which is
+              what a worker pays without preload_app
+and checks that the app holds no database connection and runs no thread
+other than the main one when it is forked. One extra run under
+`python -X importtime` gives the modules and packages that dominate the
+import time.
+
+Run with:
+    python benchmarks/startup.py
+    python benchmarks/startup.py --top 30
+    python benchmarks/startup.py --check --worker-budget-ms 50
+
+--check exits 1 if the median of a phase exceeds its budget or the app is
+not safe to fork.
+"""
+import argparse
+import gc
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(BENCH_DIR, os.pardir))
+
+PHASES = ('import', 'create', 'worker', 'cold')
+
+def probe(database_uri):
+    """Time the startup phases in this (fresh) interpreter and print them as JSON"""
+    sys.path.insert(0, project_root)
+    started = time.perf_counter()
+    from src.main import create_app
+    imported = time.perf_counter()
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database_uri})
+    created = time.perf_counter()
+
+    import threading
+    from src.models.user import db
+    with app.app_context():
+        pooled = db.engine.pool.checkedin() + db.engine.pool.checkedout()
+    result = {
+        'import': (imported - started) * 1000,
+        'create': (created - imported) * 1000,
+        'threads': threading.active_count() - 1,
+        'connections': pooled
+    }
+
+    # As gunicorn.conf.py does before each fork
+    gc.freeze()
+    read_fd, write_fd = os.pipe()
+    forked = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        status = app.test_client().get('/api/products').status_code
+        os.write(write_fd, json.dumps({'worker': (time.perf_counter() - forked) * 1000, 'status': status}).encode())
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as pipe:
+        child = json.loads(pipe.read())
+    os.waitpid(pid, 0)
+    result['worker'] = child['worker']
+
+    status = app.test_client().get('/api/products').status_code
+    result['cold'] = (time.perf_counter() - started) * 1000
+    result['status'] = max(status, child['status'])
+    print(json.dumps(result))
+
+def _environment(directory):
+    # Keep scan blobs, spooled clicks and the catalog version out of src/database
+    return dict(
+        os.environ,
+        SCAN_BLOB_DIR=os.path.join(directory, 'blobs'),
+        CLICK_SPOOL_PATH=os.path.join(directory, 'click_spool.ndjson'),
+        CATALOG_VERSION_PATH=os.path.join(directory, 'catalog.version'),
+        PYTHONPATH=project_root
+    )
+
+def bootstrap(database_uri, env):
+    code = ('from src.main import create_app; '
+            f'result = create_app({{"SQLALCHEMY_DATABASE_URI": {database_uri!r}}}).test_cli_runner().invoke(args=["bootstrap"]); '
+            'print(result.output, end=""); raise SystemExit(result.exit_code)')
+    subprocess.run([sys.executable, '-c', code], env=env, check=True, capture_output=True, text=True)
+
+def run_probe(database_uri, env, importtime=False):
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + [__file__, '--probe', database_uri]
+    completed = subprocess.run(command, env=env, capture_output=True, text=True, cwd=project_root)
+    if completed.returncode:
+        raise RuntimeError(f'Startup probe failed:\n{completed.stderr}')
+    return json.loads(completed.stdout.strip().splitlines()[-1]), completed.stderr
+
+def parse_importtime(output):
+    """(module, self ms, cumulative ms) for each `-X importtime` line"""
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+    return modules
+
+def package(module):
+    # Our own modules are reported one by one, third-party ones by distribution
+    parts = module.split('.')
+    return '.'.join(parts[:3]) if parts[0] == 'src' else parts[0]
+
+def import_report(modules, top):
+    by_package = {}
+    for name, self_ms, _ in modules:
+        by_package[package(name)] = by_package.get(package(name), 0) + self_ms
+    return {
+        'total_ms': round(sum(self_ms for _, self_ms, _ in modules), 1),
+        'packages': [(name, round(ms, 1)) for name, ms in sorted(by_package.items(), key=lambda item: -item[1])[:top]],
+        'modules': [(name, round(self_ms, 1), round(cumulative_ms, 1))
+                    for name, self_ms, cumulative_ms in sorted(modules, key=lambda item: -item[1])[:top]]
+    }
+
+def check(result, args):
+    failures = []
+    for phase in PHASES:
+        budget = getattr(args, f'{phase}_budget_ms')
+        if budget is not None and result['phases'][phase] > budget:
+            failures.append(f"{phase}: {result['phases'][phase]:.1f} ms exceeds the {budget:g} ms budget")
+    if result['threads']:
+        failures.append(f"create_app() left {result['threads']} threads running before the fork")
+    if result['connections']:
+        failures.append(f"create_app() left {result['connections']} database connections open before the fork")
+    if result['status'] >= 500:
+        failures.append(f"first request answered {result['status']}")
+    return failures
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='Fresh interpreters timed; medians are reported.')
+    parser.add_argument('--top', type=int, default=15, help='Packages and modules listed in the import report.')
+    parser.add_argument('--check', action='store_true', help='Exit 1 if a phase exceeds its budget.')
+    parser.add_argument('--import-budget-ms', type=float, default=300, help='Budget for importing src.main.')
+    parser.add_argument('--create-budget-ms', type=float, default=1000, help='Budget for create_app().')
+    parser.add_argument('--worker-budget-ms', type=float, default=75, help='Budget from fork to first response.')
+    parser.add_argument('--cold-budget-ms', type=float, default=None, help='Budget for a worker without preload.')
+    parser.add_argument('--output', help='Also write the results as JSON to this path.')
+    parser.add_argument('--probe', metavar='DATABASE_URI', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.probe:
+        probe(args.probe)
+        return 0
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_uri = f"sqlite:///{os.path.join(directory, 'app.db')}"
+        env = _environment(directory)
+        bootstrap(database_uri, env)
+        runs = [run_probe(database_uri, env)[0] for _ in range(args.repeat)]
+        _, importtime = run_probe(database_uri, env, importtime=True)
+
+    result = {
+        'phases': {phase: round(statistics.median(run[phase] for run in runs), 1) for phase in PHASES},
+        'threads': max(run['threads'] for run in runs),
+        'connections': max(run['connections'] for run in runs),
+        'status': max(run['status'] for run in runs),
+        'imports': import_report(parse_importtime(importtime), args.top)
+    }
+
+    print(f"{'phase':<10} {'median ms':>10} {'budget ms':>10}")
+    for phase in PHASES:
+        budget = getattr(args, f'{phase}_budget_ms')
+        print(f"{phase:<10} {result['phases'][phase]:>10.1f} {'-' if budget is None else f'{budget:g}':>10}")
+    print(f"threads before fork: {result['threads']}, open connections before fork: {result['connections']}")
+    print(f"\nimport time by package (self time, {result['imports']['total_ms']:.1f} ms in all)")
+    for name, ms in result['imports']['packages']:
+        print(f'  {name:<48} {ms:>8.1f}')
+    print('\nslowest modules (self / cumulative ms)')
+    for name, self_ms, cumulative_ms in result['imports']['modules']:
+        print(f'  {name:<48} {self_ms:>8.1f} {cumulative_ms:>8.1f}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    if args.check:
+        failures = check(result, args)
+        for failure in failures:
+            print(f'BUDGET  {failure}')
+        if failures:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
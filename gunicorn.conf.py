@@ -0,0 +1,26 @@
+"""gunicorn settings: `gunicorn` from the project root picks this file up
+
+Run `flask --app src.main bootstrap` once per deploy before starting the
+server; workers never change the schema. The master builds the app once
+(`preload_app`) and forks workers from it, so a new worker, at boot or on
+an autoscale event, serves its first request without importing anything.
+This is safe because creating the app opens no database connection and
+starts no thread: pools and background threads are created per process on
+first use, and SQLite connections are checked against the owning pid.
+"""
+import gc
+import multiprocessing
+import os
+
+wsgi_app = 'src.main:create_app()'
+preload_app = True
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+graceful_timeout = 10
+
+def pre_fork(server, worker):
+    # Move the preloaded app out of the collector's reach, so that collections in a
+    # worker do not touch, and thereby copy, the pages it shares with the master
+    gc.freeze()
@@ -0,0 +1,197 @@
+import time
+from datetime import datetime, timedelta
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import inspect
+from src.models.user import db
+from src.models.room import Room
+from src.services.blob_store import scan_store
+from src.services.click_rollups import backfill_click_rollups
+from src.services.analytics_events import compact
+from src.services.product_search import create_search_index
+from src.services.product_import import import_feed
+from src.services.query_plans import check_query_plans
+from src.services.sharding import shard_map
+from src.utils.schema import upgrade_schema
+
+def _upgrade_schema(connection):
+    changes = upgrade_schema(connection, db.metadata)
+    if connection.dialect.name == 'sqlite' and any(change.startswith('created index') for change in changes):
+        # Refresh the planner's statistics so it picks up the new indexes
+        connection.exec_driver_sql('ANALYZE')
+    return changes
+
+@click.command('bootstrap')
+@with_appcontext
+def bootstrap_command():
+    """Prepare the database once per deploy, before workers start: schema, search index and room shards"""
+    with db.engine.begin() as connection:
+        changes = _upgrade_schema(connection)
+        # New product tables get the index from their after_create DDL; older databases need it built
+        if connection.dialect.name == 'sqlite' and 'product_fts' not in inspect(connection).get_table_names():
+            create_search_index(connection)
+            changes.append('created product search index')
+    changes += shard_map.bootstrap()
+    for change in changes:
+        click.echo(change)
+    click.echo(f'Database ready ({len(changes)} changes)')
+
+@click.command('upgrade-schema')
+@with_appcontext
+def upgrade_schema_command():
+    """Create missing tables, columns and indexes on an existing database"""
+    with db.engine.begin() as connection:
+        changes = _upgrade_schema(connection)
+    for change in changes:
+        click.echo(change)
+    click.echo(f'Schema up to date ({len(changes)} changes)')
+
+@click.command('migrate-scans')
+@click.option('--batch-size', default=100, show_default=True, help='Rooms moved per commit.')
+@with_appcontext
+def migrate_scans(batch_size):
+    """Move inline room scan_data into the content-addressed blob store"""
+    with db.engine.begin() as connection:
+        for change in upgrade_schema(connection, db.metadata):
+            click.echo(change)
+
+    moved = 0
+    while True:
+        rooms = Room.query.filter(Room.scan_ref.is_(None), Room.scan_data.isnot(None)).limit(batch_size).all()
+        if not rooms:
+            break
+        for room in rooms:
+            room.set_scan_data(room.scan_data)
+        db.session.commit()
+        moved += len(rooms)
+        click.echo(f'Moved {moved} scans')
+
+    click.echo(f'Done: {moved} scans moved to {scan_store.root}')
+
+@click.command('prune-scans')
+@click.option('--grace-minutes', default=60, show_default=True,
+              help='Keep unreferenced blobs stored more recently than this; their rooms may not have committed yet.')
+@with_appcontext
+def prune_scans(grace_minutes):
+    """Delete scan blobs no longer referenced by any room"""
+    # Measured before the references are read, so a room committed after the read stored its blob after the cutoff
+    cutoff = time.time() - grace_minutes * 60
+    referenced = {ref for (ref,) in db.session.query(Room.scan_ref).filter(Room.scan_ref.isnot(None)).distinct()}
+    removed = 0
+    for digest in list(scan_store.digests()):
+        if digest in referenced:
+            continue
+        modified_at = scan_store.modified_at(digest)
+        if modified_at is not None and modified_at < cutoff:
+            scan_store.delete(digest)
+            removed += 1
+    click.echo(f'Removed {removed} unreferenced scan blobs')
+
+@click.command('backfill-click-rollups')
+@click.option('--chunk-size', default=100000, show_default=True, help='Clicks rolled up per commit.')
+@with_appcontext
+def backfill_click_rollups_command(chunk_size):
+    """Rebuild hourly and daily click rollups from the full click history"""
+    total = backfill_click_rollups(chunk_size, progress=lambda done: click.echo(f'Rolled up {done} clicks'))
+    click.echo(f'Done: {total} clicks rolled up')
+
+@click.command('compact-analytics')
+@click.option('--older-than-days', default=7, show_default=True, help='Compact raw rows older than this.')
+@click.option('--bucket-seconds', default=3600, show_default=True, help='Width of the compacted buckets.')
+@with_appcontext
+def compact_analytics(older_than_days, bucket_seconds):
+    """Fold old AppMetrics and UserActivity rows into coarser rollup buckets"""
+    compacted = compact(datetime.utcnow() - timedelta(days=older_than_days), bucket_seconds)
+    click.echo(f"Compacted {compacted['metric']} metric samples and {compacted['activity']} activity events")
+
+@click.command('rebuild-product-search')
+@with_appcontext
+def rebuild_product_search():
+    """Create the product full-text index if missing and rebuild it from the product table"""
+    with db.engine.begin() as connection:
+        create_search_index(connection)
+    click.echo('Product search index rebuilt')
+
+@click.command('import-products')
+@click.argument('feed', type=click.File('rb'))
+@click.option('--format', 'feed_format', type=click.Choice(['csv', 'ndjson']), help='Defaults to the file extension.')
+@click.option('--batch-size', default=2000, show_default=True, help='Rows upserted per commit.')
+@click.option('--keep-missing', is_flag=True, help='Do not deactivate products missing from the feed.')
+@with_appcontext
+def import_products_command(feed, feed_format, batch_size, keep_missing):
+    """Stream a CSV or NDJSON merchant feed into the catalog, upserting on (merchant, sku)"""
+    feed_format = feed_format or ('csv' if feed.name.endswith('.csv') else 'ndjson')
+    summary = import_feed(
+        feed, feed_format,
+        batch_size=batch_size,
+        deactivate_missing=not keep_missing,
+        progress=lambda imported, errors: click.echo(f'Imported {imported} products ({errors} invalid rows)')
+    )
+    for error in summary['errors']:
+        click.echo(f"line {error['line']}: {error['error']}", err=True)
+    click.echo(f"Done: {summary['imported']} imported, {summary['deactivated']} deactivated, "
+               f"{summary['error_count']} invalid rows")
+
+@click.command('check-query-plans')
+@click.option('--verbose', is_flag=True, help='Print every plan, not only the ones with full scans.')
+@with_appcontext
+def check_query_plans_command(verbose):
+    """Fail if any hot route query plans a full table scan (EXPLAIN QUERY PLAN)"""
+    with db.engine.connect() as connection:
+        results = check_query_plans(connection)
+    failures = 0
+    for route, plan, scans in results:
+        if scans:
+            failures += 1
+        if scans or verbose:
+            click.echo(f"{'FULL SCAN' if scans else 'ok':>9}  {route}")
+            for line in plan:
+                click.echo(f'           {line}')
+    click.echo(f'{len(results) - failures}/{len(results)} route queries use an index')
+    if failures:
+        raise SystemExit(1)
+
+@click.command('rebalance-shards')
+@click.option('--drain', multiple=True, help='Move every user off this shard, e.g. before removing it (repeatable).')
+@click.option('--user', 'user_ids', type=int, multiple=True, help='Only move these users (repeatable).')
+@click.option('--to', 'target', help='Move the --user users to this shard, or to global, and keep them there.')
+@click.option('--limit', type=int, help='Move at most this many users.')
+@click.option('--dry-run', is_flag=True, help='List the moves without making them.')
+@with_appcontext
+def rebalance_shards_command(drain, user_ids, target, limit, dry_run):
+    """Move users' rooms to their hash ring shard, e.g. after adding shards to ROOM_SHARD_COUNT"""
+    if not shard_map.enabled:
+        raise click.UsageError('No room shards configured (ROOM_SHARD_COUNT)')
+    unknown = set(drain) - set(shard_map.engines)
+    if unknown:
+        raise click.UsageError(f'Unknown shards: {", ".join(sorted(unknown))}')
+    if target is not None:
+        if target not in shard_map.locations():
+            raise click.UsageError(f'Unknown shard: {target}')
+        if not user_ids:
+            raise click.UsageError('--to needs --user')
+        moves = [(user_id, shard_map.shard_for_user(user_id), target) for user_id in user_ids]
+        moves = [move for move in moves if move[1] != target]
+    else:
+        moves = shard_map.plan(drain)
+        if user_ids:
+            moves = [move for move in moves if move[0] in user_ids]
+    moves = moves[:limit] if limit is not None else moves
+
+    for user_id, source, destination in moves:
+        if dry_run:
+            click.echo(f'user {user_id}: {source} -> {destination}')
+            continue
+        counts = shard_map.move_user(user_id, source, destination, pinned=True if target is not None else None)
+        click.echo(f"user {user_id}: {source} -> {destination} ({counts['room']} rooms, "
+                   f"{counts['room_item']} items, {counts['organization_suggestion']} suggestions)")
+    if dry_run:
+        click.echo(f'{len(moves)} users would move')
+        return
+
+    # Moves fence off the old databases, so leftovers only come from moves that were interrupted
+    merged = 0
+    for user_id, location, placed in shard_map.leftovers():
+        shard_map.move_user(user_id, location, placed)
+        merged += 1
+    click.echo(f'Done: {len(moves)} users moved, {merged} leftover placements merged')
@@ -1,70 +1,115 @@
+import importlib
 import os
-import sys
+from flask import Flask
+from flask_cors import CORS
 
-# Explicitly add the project root to sys.path (keep this for robustness)
-project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
-sys.path.insert(0, project_root)
+# (module, blueprint attribute, URL prefix); a module is only imported when its blueprint is registered
+BLUEPRINTS = (
+    ('src.routes.user', 'user_bp', '/api'),
+    ('src.routes.room', 'room_bp', '/api'),
+    ('src.routes.product', 'product_bp', '/api'),
+    ('src.routes.analytics', 'analytics_bp', '/api/analytics'),
+    ('src.routes.job', 'job_bp', '/api'),
+)
 
-from flask import Flask, send_from_directory
-from flask_cors import CORS
-from src.models.user import db
-from src.models.admin import Admin
-from src.models.analytics import UserActivity, AffiliateClick, RoomScan, AppMetrics
-from src.models.product import Product
-from src.routes.user import user_bp
-from src.routes.auth import auth_bp
-from src.routes.analytics import analytics_bp
-from src.routes.products import products_bp
+def create_app(config=None):
+    """Build the application without touching the database
+
+    Creating the app only reads configuration, imports the models and the
+    blueprints named in the BLUEPRINTS config key (all of them by default)
+    and builds the static manifest; no connection is opened and no thread
+    is started. Schema changes are made once per deploy by `flask bootstrap`,
+    and each process resumes the job queue when it serves its first request.
+    With `preload_app` (see gunicorn.conf.py) the master does this work once
+    and forked workers are ready at once.
+    """
+    app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
+    app.config['SECRET_KEY'] = 'roomscan-admin-secret-key-change-in-production'
+    # Bearer token for the admin metrics endpoint; unset leaves it open like the other stats endpoints
+    app.config['ADMIN_METRICS_TOKEN'] = os.environ.get('ADMIN_METRICS_TOKEN')
+    # Database configuration
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Room data is split across ROOM_SHARD_COUNT SQLite files (see src.services.sharding); 0 keeps it in app.db
+    shard_dir = os.environ.get('ROOM_SHARD_DIR', os.path.join(os.path.dirname(__file__), 'database'))
+    app.config['ROOM_SHARDS'] = [
+        f"sqlite:///{os.path.join(shard_dir, f'rooms-{index}.db')}" for index in range(int(os.environ.get('ROOM_SHARD_COUNT', 0)))
+    ]
+    app.config['BLUEPRINTS'] = [module for module, _, _ in BLUEPRINTS]
+    app.config.update(config or {})
 
-app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
-app.config['SECRET_KEY'] = 'roomscan-admin-secret-key-change-in-production'
+    from sqlalchemy.orm import configure_mappers
+    from src.models.user import db
+    # Import every model so that db.metadata is complete for `flask bootstrap`
+    import src.models.room
+    import src.models.product
+    import src.models.analytics
+    import src.models.job
+    import src.models.shard
+    from src.utils.sqlite import engine_options
+    from src.services.clicks import click_buffer
+    from src.services.jobs import job_queue
+    from src.services.co_clicks import co_click_index
+    from src.services.static_assets import static_assets
+    from src.services.request_metrics import TimedJSONProvider, request_metrics
+    from src.services.sharding import shard_map
 
-# Enable CORS for all routes
-CORS(app, resources={r'/api/*': {'origins': 'https://admin-dashboard-roomscan-victorias-projects-7fdc1e3e.vercel.app', 'supports_credentials': True}})
-# Register blueprints
-app.register_blueprint(user_bp, url_prefix='/api')
-app.register_blueprint(auth_bp, url_prefix='/api/auth')
-app.register_blueprint(analytics_bp, url_prefix='/api/analytics')
-app.register_blueprint(products_bp, url_prefix='/api')
+    # RawJSONProvider that also records serialization time for request metrics
+    app.json = TimedJSONProvider(app)
 
-# Database configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
+    # Enable CORS for all routes
+    CORS(app, resources={r'/api/*': {'origins': 'https://admin-dashboard-roomscan-victorias-projects-7fdc1e3e.vercel.app', 'supports_credentials': True}})
 
-with app.app_context():
-    db.create_all()
-    
-    # Create default admin user if none exists
-    if not Admin.query.first():
-        default_admin = Admin(
-            username='admin',
-            email='admin@roomscan.com',
-            role='super_admin'
-        )
-        default_admin.set_password('admin123')  # Change this in production!
-        db.session.add(default_admin)
-        db.session.commit()
-        print("Default admin user created: username='admin', password='admin123'")
+    # WAL, busy_timeout and cache pragmas are applied to each connection by src.utils.sqlite
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options())
+    db.init_app(app)
+    shard_map.init_app(app)
+    click_buffer.init_app(app)
+    job_queue.init_app(app)
+    co_click_index.init_app(app)
+    static_assets.init_app(app)
+    request_metrics.init_app(app)
 
-@app.route('/', defaults={'path': ''}) 
-@app.route('/<path:path>')
-def serve(path):
-    static_folder_path = app.static_folder
-    if static_folder_path is None:
+    register_blueprints(app, app.config['BLUEPRINTS'])
+    register_commands(app)
+
+    @app.route('/', defaults={'path': ''})
+    @app.route('/<path:path>')
+    def serve(path):
+        """Static files and the SPA fallback, answered from the in-memory manifest"""
+        if app.static_folder is None:
             return "Static folder not configured", 404
+        return static_assets.serve(path)
 
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
-    else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
-        else:
-            return "index.html not found", 404
+    # Work each process would otherwise repeat on its first request, done here so forked workers inherit it;
+    # both are in-memory only: resolving the mapper relationships and compiling the URL matcher
+    configure_mappers()
+    app.url_map.update()
+    return app
 
+def register_blueprints(app, modules):
+    """Import and register the blueprints of `modules`, in BLUEPRINTS order"""
+    known = {module for module, _, _ in BLUEPRINTS}
+    unknown = set(modules) - known
+    if unknown:
+        raise ValueError(f'Unknown blueprint modules: {", ".join(sorted(unknown))}')
+    for module, attribute, url_prefix in BLUEPRINTS:
+        if module in modules:
+            app.register_blueprint(getattr(importlib.import_module(module), attribute), url_prefix=url_prefix)
 
-if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=os.environ.get('PORT', 5000), debug=True)
+def register_commands(app):
+    from src import commands
+    for command in (
+        commands.bootstrap_command, commands.upgrade_schema_command, commands.migrate_scans,
+        commands.prune_scans, commands.backfill_click_rollups_command, commands.compact_analytics,
+        commands.rebuild_product_search, commands.import_products_command, commands.check_query_plans_command,
+        commands.rebalance_shards_command
+    ):
+        app.cli.add_command(command)
 
 
+if __name__ == '__main__':
+    import sys
+    # `python src/main.py` puts src/ rather than the project root on sys.path
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+    create_app().run(host='0.0.0.0', port=os.environ.get('PORT', 5000), debug=True)
@@ -1,30 +1,22 @@
-from flask_sqlalchemy import SQLAlchemy
-
-db = SQLAlchemy()
+from src.models.user import db
+# Clicks are recorded by the product routes; the model lives with Product and is re-exported here
+from src.models.product import AffiliateClick
 
 class UserActivity(db.Model):
+    __table_args__ = (
+        db.Index('ix_user_activity_type_timestamp', 'activity_type', 'timestamp'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer) # Optional: if you track users
     activity_type = db.Column(db.String(50), nullable=False) # 'room_scan', 'product_click', etc.
     timestamp = db.Column(db.DateTime, default=db.func.current_timestamp())
-    metadata = db.Column(db.JSON) # Store additional data as JSON
+    # `metadata` is reserved on declarative models, so the column is mapped under another name
+    extra_data = db.Column('metadata', db.JSON) # Store additional data as JSON
 
     def __repr__(self):
         return f'<UserActivity {self.activity_type} at {self.timestamp}>'
 
-class AffiliateClick(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, nullable=False)
-    timestamp = db.Column(db.DateTime, default=db.func.current_timestamp())
-    user_id = db.Column(db.Integer) # Optional: if you track users
-    ip_address = db.Column(db.String(45))
-    user_agent = db.Column(db.Text)
-    converted = db.Column(db.Boolean, default=False)
-    commission_amount = db.Column(db.Float)
-
-    def __repr__(self):
-        return f'<AffiliateClick product_id={self.product_id} at {self.timestamp}>'
-
 class RoomScan(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer) # Optional: if you track users
@@ -37,12 +29,34 @@ class RoomScan(db.Model):
         return f'<RoomScan {self.room_type} at {self.timestamp}>'
 
 class AppMetrics(db.Model):
+    __table_args__ = (
+        db.Index('ix_app_metrics_name_timestamp', 'metric_name', 'timestamp'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     metric_name = db.Column(db.String(100), nullable=False)
     metric_value = db.Column(db.Float, nullable=False)
     timestamp = db.Column(db.DateTime, default=db.func.current_timestamp())
-    metadata = db.Column(db.JSON) # Store additional data as JSON
+    extra_data = db.Column('metadata', db.JSON) # Store additional data as JSON
 
     def __repr__(self):
         return f'<AppMetrics {self.metric_name}={self.metric_value} at {self.timestamp}>'
 
+class AnalyticsRollup(db.Model):
+    """Compacted AppMetrics / UserActivity rows: one per series per time bucket"""
+    __table_args__ = (
+        db.UniqueConstraint('kind', 'name', 'bucket_seconds', 'bucket_epoch', name='uq_analytics_rollup_bucket'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False) # 'metric' or 'activity'
+    name = db.Column(db.String(100), nullable=False) # metric_name or activity_type
+    bucket_seconds = db.Column(db.Integer, nullable=False)
+    bucket_epoch = db.Column(db.Integer, nullable=False) # Bucket start, seconds since epoch
+    count = db.Column(db.Integer, nullable=False, default=0)
+    value_sum = db.Column(db.Float)
+    value_min = db.Column(db.Float)
+    value_max = db.Column(db.Float)
+
+    def __repr__(self):
+        return f'<AnalyticsRollup {self.kind}:{self.name} @{self.bucket_epoch}>'
@@ -0,0 +1,37 @@
+from src.models.user import db
+from src.utils.fields import project
+from src.utils.raw_json import raw_or_none
+from datetime import datetime
+
+class Job(db.Model):
+    """A unit of background work, persisted so its status survives restarts"""
+    __table_args__ = (
+        db.Index('ix_job_status_created_at', 'status', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)  # handler name, e.g. 'room_suggestions'
+    status = db.Column(db.String(20), nullable=False, default='queued')  # 'queued', 'running', 'succeeded', 'failed'
+    payload = db.Column(db.Text)  # JSON keyword arguments for the handler
+    result = db.Column(db.Text)  # JSON returned by the handler, or progress while running
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # refreshed while running; a stale heartbeat means the worker died
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self, fields=None):
+        return project(fields, {
+            'id': lambda: self.id,
+            'kind': lambda: self.kind,
+            'status': lambda: self.status,
+            'payload': lambda: raw_or_none(self.payload),
+            'result': lambda: raw_or_none(self.result),
+            'error': lambda: self.error,
+            'attempts': lambda: self.attempts,
+            'created_at': lambda: self.created_at.isoformat(),
+            'started_at': lambda: self.started_at.isoformat() if self.started_at else None,
+            'heartbeat_at': lambda: self.heartbeat_at.isoformat() if self.heartbeat_at else None,
+            'finished_at': lambda: self.finished_at.isoformat() if self.finished_at else None
+        })
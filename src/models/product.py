@@ -1,8 +1,15 @@
-from flask_sqlalchemy import SQLAlchemy
-
-db = SQLAlchemy()
+from src.models.user import db
+from src.utils.fields import project
+from datetime import datetime
 
 class Product(db.Model):
+    __table_args__ = (
+        # Upsert key for catalog imports; products without a SKU are not constrained
+        db.Index('uq_product_merchant_sku', 'merchant', 'sku', unique=True),
+        # Listings and recommendations filter active products, usually by category
+        db.Index('ix_product_is_active_category', 'is_active', 'category'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), nullable=False)
     description = db.Column(db.Text)
@@ -13,21 +20,70 @@ class Product(db.Model):
     price = db.Column(db.Float)
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    sku = db.Column(db.String(100)) # Merchant's stable SKU
+    last_imported_at = db.Column(db.DateTime) # Start of the last import that contained this product
 
     def __repr__(self):
         return f'<Product {self.name}>'
 
+    def to_dict(self, fields=None):
+        return project(fields, {
+            'id': lambda: self.id,
+            'name': lambda: self.name,
+            'description': lambda: self.description,
+            'category': lambda: self.category,
+            'merchant': lambda: self.merchant,
+            'affiliate_link': lambda: self.affiliate_link,
+            'image_url': lambda: self.image_url,
+            'price': lambda: self.price,
+            'is_active': lambda: self.is_active,
+            'sku': lambda: self.sku,
+            'created_at': lambda: self.created_at.isoformat() if self.created_at else None,
+            'updated_at': lambda: self.updated_at.isoformat() if self.updated_at else None
+        })
+
 class AffiliateClick(db.Model):
+    __table_args__ = (
+        db.Index('ix_affiliate_click_product_id_timestamp', 'product_id', 'timestamp'),
+        db.Index('ix_affiliate_click_timestamp', 'timestamp'),
+        db.Index('ix_affiliate_click_public_id', 'public_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
+    public_id = db.Column(db.String(32))  # assigned when the click is queued; returned to the client as click_id
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     timestamp = db.Column(db.DateTime, default=db.func.current_timestamp())
     user_id = db.Column(db.Integer) # Optional: if you track users
+    room_id = db.Column(db.Integer) # Room the click came from, if any
     ip_address = db.Column(db.String(45))
     user_agent = db.Column(db.Text)
+    referrer = db.Column(db.Text)
+    converted = db.Column(db.Boolean, default=False)
+    commission_amount = db.Column(db.Float)
 
     product = db.relationship('Product', backref=db.backref('clicks', lazy=True))
 
     def __repr__(self):
         return f'<AffiliateClick {self.product.name} at {self.timestamp}>'
 
+class ClickRollup(db.Model):
+    """Click counts per product per hour or day, maintained from AffiliateClick"""
+    __table_args__ = (
+        db.UniqueConstraint('granularity', 'bucket_start', 'product_id', name='uq_click_rollup_bucket'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(10), nullable=False)  # 'hour' or 'day'
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    click_count = db.Column(db.Integer, nullable=False, default=0)
 
+    def __repr__(self):
+        return f'<ClickRollup {self.granularity} {self.bucket_start} product_id={self.product_id}>'
+
+class ClickRollupState(db.Model):
+    """Single-row watermark: clicks with id <= last_click_id are included in ClickRollup"""
+    id = db.Column(db.Integer, primary_key=True)
+    last_click_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
@@ -1,30 +1,57 @@
 from src.models.user import db
+from src.utils.fields import project
+from src.utils.raw_json import RawJSON, raw_or_none
+from src.services.blob_store import scan_store
 from datetime import datetime
-import json
 
 class Room(db.Model):
+    __table_args__ = (
+        # Per-user listings are keyset-paginated by id
+        db.Index('ix_room_user_id_id', 'user_id', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # JSON columns are written through encode_json and served as RawJSON without re-parsing
     dimensions = db.Column(db.Text)  # JSON string for width, height, length
-    scan_data = db.Column(db.Text)  # JSON string for 3D scan data
+    scan_data = db.Column(db.Text)  # Legacy inline JSON scan, superseded by scan_ref
+    scan_ref = db.Column(db.String(64))  # SHA-256 of the scan JSON in scan_store
     items = db.relationship('RoomItem', backref='room', lazy=True, cascade='all, delete-orphan')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'user_id': self.user_id,
-            'dimensions': json.loads(self.dimensions) if self.dimensions else None,
-            'scan_data': json.loads(self.scan_data) if self.scan_data else None,
-            'items': [item.to_dict() for item in self.items],
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
-        }
+    # Large fields left out of list views unless requested with ?include=
+    deferred_fields = ('scan_data',)
+    field_columns = {'scan_data': ('scan_ref',)}
+
+    def set_scan_data(self, encoded):
+        """Store encoded scan JSON in the blob store and keep only its reference"""
+        self.scan_ref = scan_store.put(encoded)
+        self.scan_data = None
+
+    def scan_json(self):
+        if self.scan_ref:
+            return RawJSON(scan_store.get_text(self.scan_ref))
+        return raw_or_none(self.scan_data)
+
+    def to_dict(self, fields=None):
+        return project(fields, {
+            'id': lambda: self.id,
+            'name': lambda: self.name,
+            'user_id': lambda: self.user_id,
+            'dimensions': lambda: raw_or_none(self.dimensions),
+            'scan_data': lambda: self.scan_json(),
+            'items': lambda: [item.to_dict(fields.nested('items') if fields is not None else None) for item in self.items],
+            'created_at': lambda: self.created_at.isoformat(),
+            'updated_at': lambda: self.updated_at.isoformat()
+        })
 
 class RoomItem(db.Model):
+    __table_args__ = (
+        db.Index('ix_room_item_room_id', 'room_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     room_id = db.Column(db.Integer, db.ForeignKey('room.id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
@@ -33,18 +60,23 @@ class RoomItem(db.Model):
     confidence = db.Column(db.Float, default=0.0)  # AI detection confidence
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'room_id': self.room_id,
-            'name': self.name,
-            'category': self.category,
-            'position': json.loads(self.position) if self.position else None,
-            'confidence': self.confidence,
-            'created_at': self.created_at.isoformat()
-        }
+    def to_dict(self, fields=None):
+        return project(fields, {
+            'id': lambda: self.id,
+            'room_id': lambda: self.room_id,
+            'name': lambda: self.name,
+            'category': lambda: self.category,
+            'position': lambda: raw_or_none(self.position),
+            'confidence': lambda: self.confidence,
+            'created_at': lambda: self.created_at.isoformat()
+        })
 
 class OrganizationSuggestion(db.Model):
+    __table_args__ = (
+        # Suggestions are always read per room, ordered by priority
+        db.Index('ix_organization_suggestion_room_id_priority', 'room_id', 'priority'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     room_id = db.Column(db.Integer, db.ForeignKey('room.id'), nullable=False)
     suggestion_type = db.Column(db.String(50), nullable=False)  # 'storage', 'furniture', 'layout'
@@ -54,15 +86,15 @@ class OrganizationSuggestion(db.Model):
     is_implemented = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'room_id': self.room_id,
-            'suggestion_type': self.suggestion_type,
-            'title': self.title,
-            'description': self.description,
-            'priority': self.priority,
-            'is_implemented': self.is_implemented,
-            'created_at': self.created_at.isoformat()
-        }
+    def to_dict(self, fields=None):
+        return project(fields, {
+            'id': lambda: self.id,
+            'room_id': lambda: self.room_id,
+            'suggestion_type': lambda: self.suggestion_type,
+            'title': lambda: self.title,
+            'description': lambda: self.description,
+            'priority': lambda: self.priority,
+            'is_implemented': lambda: self.is_implemented,
+            'created_at': lambda: self.created_at.isoformat()
+        })
 
@@ -0,0 +1,30 @@
+from src.models.user import db
+from datetime import datetime
+
+class UserShard(db.Model):
+    """The database holding a user's rooms, items and suggestions (see src.services.sharding)"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    shard = db.Column(db.String(20), nullable=False)  # 'global' or 'shard<N>'
+    pinned = db.Column(db.Boolean, nullable=False, default=False)  # placed by hand; rebalancing leaves it alone
+    moved_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ShardFence(db.Model):
+    """Rows moved out of the database holding this record; its triggers reject writes that still arrive
+
+    A row without `room_id` fences the user's new rooms, one with `room_id`
+    new items and suggestions of that room. See ShardMap.move_user.
+    """
+    __table_args__ = (
+        db.Index('ix_shard_fence_user_id', 'user_id'),
+        db.Index('ix_shard_fence_room_id', 'room_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    room_id = db.Column(db.Integer)
+    moved_to = db.Column(db.String(20), nullable=False)
+
+class ShardSequence(db.Model):
+    """Next id sequence number of a sharded table; every database that holds rooms has its own"""
+    name = db.Column(db.String(50), primary_key=True)  # table name
+    next_value = db.Column(db.Integer, nullable=False)
@@ -1,6 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
+from src.services.sharding import RoutingSession
+from src.utils.fields import project
 
-db = SQLAlchemy()
+# RoutingSession sends room data to its shard (src.services.sharding); without shards it behaves as the default session
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -12,4 +15,12 @@ class User(db.Model):
     def __repr__(self):
         return f'<User {self.username}>'
 
+    def to_dict(self, fields=None):
+        return project(fields, {
+            'id': lambda: self.id,
+            'username': lambda: self.username,
+            'email': lambda: self.email,
+            'created_at': lambda: self.created_at.isoformat() if self.created_at else None
+        })
+
 
@@ -0,0 +1,90 @@
+from flask import Blueprint, current_app, request, jsonify
+from src.models.user import db
+from src.services.analytics_events import EventBatcher, default_window, parse_timestamp, series
+from src.services.request_metrics import request_metrics
+import hmac
+import json
+
+analytics_bp = Blueprint('analytics', __name__)
+
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson')
+MIN_INTERVAL = 1
+MAX_BUCKETS = 10000
+
+@analytics_bp.route('/events', methods=['POST'])
+def ingest_events():
+    """Bulk-ingest metric samples and user activity events
+
+    JSON body: {"metrics": [{"metric_name", "metric_value", "timestamp"?, "metadata"?}],
+                "activities": [{"activity_type", "user_id"?, "timestamp"?, "metadata"?}]}
+    NDJSON body: one event per line, each with "type": "metric" or "activity".
+    The whole batch is rejected if any event is invalid.
+    """
+    batcher = EventBatcher()
+
+    try:
+        if request.mimetype in NDJSON_MIMETYPES:
+            # Read line by line so large uploads are never held in memory at once
+            for position, line in enumerate(request.stream):
+                if line.strip():
+                    batcher.add_typed(json.loads(line), position)
+        else:
+            data = request.get_json() or {}
+            for position, event in enumerate(data.get('metrics', [])):
+                batcher.add('metric', event, position)
+            for position, event in enumerate(data.get('activities', [])):
+                batcher.add('activity', event, position)
+
+        counts = batcher.finish()
+        db.session.commit()
+        return jsonify({'metrics': counts['metric'], 'activities': counts['activity']}), 201
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+
+@analytics_bp.route('/metrics/<metric_name>/series', methods=['GET'])
+def get_metric_series(metric_name):
+    """Get count/sum/avg/min/max of a metric per time bucket"""
+    return _series_response('metric', metric_name)
+
+@analytics_bp.route('/activity/<activity_type>/series', methods=['GET'])
+def get_activity_series(activity_type):
+    """Get the number of activity events of a type per time bucket"""
+    return _series_response('activity', activity_type)
+
+def _series_response(kind, name):
+    interval = request.args.get('interval', 3600, type=int)
+    start, end = default_window()
+
+    try:
+        if 'start' in request.args:
+            start = parse_timestamp(request.args['start'])
+        if 'end' in request.args:
+            end = parse_timestamp(request.args['end'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if interval < MIN_INTERVAL or (end - start).total_seconds() / interval > MAX_BUCKETS:
+        return jsonify({'error': f'interval must be at least {MIN_INTERVAL}s and yield at most {MAX_BUCKETS} buckets'}), 400
+
+    return jsonify({
+        'name': name,
+        'interval': interval,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'buckets': series(kind, name, interval, start, end)
+    })
+
+@analytics_bp.route('/requests', methods=['GET'])
+def get_request_metrics():
+    """Per-endpoint request counts and p50/p95/p99 of duration, SQL statements, DB and serialization time
+
+    Covers the worker process that answers; persisted `request.*` series in
+    AppMetrics cover all workers. When ADMIN_METRICS_TOKEN is configured it
+    must be sent as a bearer token.
+    """
+    token = current_app.config.get('ADMIN_METRICS_TOKEN')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify(request_metrics.snapshot())
@@ -0,0 +1,10 @@
+from flask import Blueprint, jsonify
+from src.models.job import Job
+
+job_bp = Blueprint('job', __name__)
+
+@job_bp.route('/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get a background job's status, progress and result"""
+    job = Job.query.filter_by(id=job_id).first_or_404()
+    return jsonify(job.to_dict())
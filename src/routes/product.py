@@ -1,8 +1,18 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, abort, request, jsonify
 from src.models.user import db
-from src.models.product import Product, AffiliateClick, ProductRecommendation
+from src.models.product import Product
 from src.models.room import Room, OrganizationSuggestion
-import json
+from src.services.recommendations import recommendation_index
+from src.services.clicks import click_buffer, product_links
+from src.services.click_rollups import click_analytics
+from src.services.product_search import search_products
+from src.services.product_import import import_feed
+from src.services.product_cache import product_cache
+from src.services.catalog import catalog
+from src.services.co_clicks import co_click_index
+from src.utils.fields import FieldSet
+from src.utils.conditional import CATALOG_CACHE_CONTROL, make_etag, not_modified, with_validators
+from datetime import datetime
 
 product_bp = Blueprint('product', __name__)
 
@@ -11,76 +21,151 @@ def get_products():
     """Get products with optional filtering"""
     category = request.args.get('category')
     room_id = request.args.get('room_id')
-    limit = request.args.get('limit', 20, type=int)
+    # Clamped like /products/search: the limit is part of the cache key, so it also bounds the number of entries
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    fields = FieldSet.from_request(request.args)
     
-    query = Product.query.filter_by(is_active=True)
+    # Pages are cached whole and `fields` applied per response, so /products skips the SELECT projection
+    # the other routes use: one cache entry serves every field selection
+    def load_page():
+        return [product.to_dict() for product in product_page_query(category, limit).all()]
     
-    if category:
-        query = query.filter_by(category=category)
+    # Personalized listings depend on the room, so only the plain catalog listing is validated
+    etag = None if room_id else make_etag('products', catalog.current())
+    if etag:
+        response = not_modified(etag, cache_control=CATALOG_CACHE_CONTROL)
+        if response is not None:
+            return response
     
-    products = query.limit(limit).all()
+    products = product_cache.get_or_load(f'list:{category or ""}:{limit}', load_page)
     
     # If room_id is provided, get personalized recommendations
     if room_id:
         recommendations = get_room_recommendations(room_id)
         # Merge with general products, prioritizing recommendations
-        recommended_ids = [r['product_id'] for r in recommendations]
-        recommended_products = [p for p in products if p.id in recommended_ids]
-        other_products = [p for p in products if p.id not in recommended_ids]
+        recommended_ids = {r['product_id'] for r in recommendations}
+        recommended_products = [p for p in products if p['id'] in recommended_ids]
+        other_products = [p for p in products if p['id'] not in recommended_ids]
         products = recommended_products + other_products[:limit-len(recommended_products)]
     
-    return jsonify([product.to_dict() for product in products])
+    response = jsonify([fields.apply(product) for product in products])
+    if etag:
+        last_modified = max((_product_last_modified(product) for product in products), default=None)
+        with_validators(response, etag, last_modified, CATALOG_CACHE_CONTROL)
+    return response
+
+def product_page_query(category, limit):
+    """Up to `limit` active products, of `category` if given"""
+    query = Product.query.filter_by(is_active=True)
+    if category:
+        query = query.filter_by(category=category)
+    return query.limit(limit)
+
+@product_bp.route('/products/search', methods=['GET'])
+def search_products_route():
+    """Full-text search over product name, description, category and merchant"""
+    q = request.args.get('q', '')
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    offset = request.args.get('offset', 0, type=int)
+    fields = FieldSet.from_request(request.args)
+    
+    query = search_products(
+        q,
+        merchant=request.args.get('merchant'),
+        min_price=request.args.get('min_price', type=float),
+        max_price=request.args.get('max_price', type=float),
+        include_inactive=request.args.get('include_inactive', 'false').lower() == 'true'
+    )
+    if query is None:
+        return jsonify([])
+    
+    products = query.options(*fields.load_options(Product)).offset(offset).limit(limit).all()
+    return jsonify([product.to_dict(fields) for product in products])
 
 @product_bp.route('/products/<int:product_id>', methods=['GET'])
 def get_product(product_id):
     """Get a specific product"""
-    product = Product.query.get_or_404(product_id)
-    return jsonify(product.to_dict())
+    etag = make_etag('product', product_id, catalog.current())
+    response = not_modified(etag, cache_control=CATALOG_CACHE_CONTROL)
+    if response is not None:
+        return response
+    fields = FieldSet.from_request(request.args)
+    
+    def load_product():
+        product = db.session.get(Product, product_id)
+        return product.to_dict() if product else None
+    
+    product = product_cache.get_or_load(f'product:{product_id}', load_product)
+    if product is None:
+        abort(404)
+    response = not_modified(etag, _product_last_modified(product), CATALOG_CACHE_CONTROL)
+    if response is not None:
+        return response
+    return with_validators(jsonify(fields.apply(product)), etag, _product_last_modified(product), CATALOG_CACHE_CONTROL)
+
+def _product_last_modified(product):
+    """Last-Modified of a serialized product: updated_at, or created_at for rows that predate it"""
+    timestamp = product.get('updated_at') or product.get('created_at')
+    return datetime.fromisoformat(timestamp) if timestamp else None
+
+@product_bp.route('/products/cache/stats', methods=['GET'])
+def get_product_cache_stats():
+    """Hit/miss counters for the product read-through cache"""
+    return jsonify(product_cache.stats())
 
 @product_bp.route('/products/<int:product_id>/click', methods=['POST'])
 def track_affiliate_click(product_id):
-    """Track affiliate link clicks for analytics and commission"""
-    product = Product.query.get_or_404(product_id)
-    data = request.get_json() or {}
+    """Track affiliate link clicks for analytics and commission
+
+    The click is queued and written in a batch by the click buffer, so this
+    request does no database reads or writes. The returned `click_id` is the
+    click's `public_id`, not its row id, which is only assigned on insert.
+    """
+    affiliate_link = product_links.get(product_id)
+    if affiliate_link is None:
+        abort(404)
+    data = request.get_json(silent=True) or {}
     
     try:
-        click = AffiliateClick(
-            product_id=product_id,
-            user_id=data.get('user_id'),
-            room_id=data.get('room_id'),
-            ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent'),
-            referrer=request.headers.get('Referer')
-        )
-        
-        db.session.add(click)
-        db.session.commit()
-        
-        return jsonify({
-            'success': True,
-            'affiliate_link': product.affiliate_link,
-            'click_id': click.id
+        click_id = click_buffer.enqueue({
+            'product_id': product_id,
+            'user_id': data.get('user_id'),
+            'room_id': data.get('room_id'),
+            'ip_address': request.remote_addr,
+            'user_agent': request.headers.get('User-Agent'),
+            'referrer': request.headers.get('Referer'),
+            'timestamp': datetime.utcnow()
         })
-        
-    except Exception as e:
-        db.session.rollback()
+    except ValueError as e:
         return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        'affiliate_link': affiliate_link,
+        'click_id': click_id
+    })
 
 @product_bp.route('/rooms/<int:room_id>/recommendations', methods=['GET'])
 def get_room_product_recommendations(room_id):
     """Get product recommendations for a specific room"""
-    room = Room.query.get_or_404(room_id)
-    recommendations = get_room_recommendations(room_id)
+    Room.query.get_or_404(room_id)
+    suggestions = OrganizationSuggestion.query.filter_by(room_id=room_id).all()
+    recommendations = recommendation_index.recommend(suggestions)
+    
+    # Keep the first recommendation per product, matching the order they were generated in
+    recommendations_by_product = {}
+    for recommendation in recommendations:
+        recommendations_by_product.setdefault(recommendation['product_id'], recommendation)
     
     # Get the actual product data
-    product_ids = [r['product_id'] for r in recommendations]
-    products = Product.query.filter(Product.id.in_(product_ids), Product.is_active==True).all()
+    fields = FieldSet.from_request(request.args)
+    products = recommended_products_query(list(recommendations_by_product), fields).all()
     
     # Combine product data with recommendation data
     result = []
     for product in products:
-        recommendation = next((r for r in recommendations if r['product_id'] == product.id), None)
-        product_data = product.to_dict()
+        recommendation = recommendations_by_product.get(product.id)
+        product_data = product.to_dict(fields)
         if recommendation:
             product_data['recommendation'] = {
                 'relevance_score': recommendation['relevance_score'],
@@ -93,73 +178,77 @@ def get_room_product_recommendations(room_id):
     
     return jsonify(result)
 
+def recommended_products_query(product_ids, fields):
+    """The active products among `product_ids`, loading only `fields`"""
+    return Product.query.options(*fields.load_options(Product)).filter(Product.id.in_(product_ids), Product.is_active==True)
+
+def _scored_products(scored):
+    """Serialize (product_id, score) pairs as products with a `score`, keeping their order"""
+    fields = FieldSet.from_request(request.args)
+    ids = [product_id for product_id, _ in scored]
+    products = {
+        product.id: product
+        for product in Product.query.options(*fields.load_options(Product)).filter(Product.id.in_(ids))
+    } if ids else {}
+    return jsonify([
+        dict(products[product_id].to_dict(fields), score=round(score, 6))
+        for product_id, score in scored if product_id in products
+    ])
+
+@product_bp.route('/rooms/<int:room_id>/also-clicked', methods=['GET'])
+def get_room_also_clicked(room_id):
+    """Products that users with similar rooms, or with the same clicks, also clicked
+
+    Scores come from an in-memory co-click model refreshed in the background.
+    """
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    scored = co_click_index.recommend_for_room(room_id, limit)
+    if scored is None:
+        abort(404)
+    return _scored_products(scored)
+
+@product_bp.route('/products/<int:product_id>/also-clicked', methods=['GET'])
+def get_product_also_clicked(product_id):
+    """Products clicked by the users who clicked this product"""
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    return _scored_products(co_click_index.also_clicked(product_id, limit))
+
 @product_bp.route('/analytics/clicks', methods=['GET'])
 def get_click_analytics():
-    """Get affiliate click analytics"""
+    """Get affiliate click analytics
+
+    Counts come from the hourly/daily rollups plus clicks not yet rolled up;
+    pass `group_by=merchant` for per-merchant totals.
+    """
     days = request.args.get('days', 30, type=int)
-    
-    # This would typically include more sophisticated analytics
-    # For now, return basic click counts
-    from sqlalchemy import func
-    from datetime import datetime, timedelta
-    
-    start_date = datetime.utcnow() - timedelta(days=days)
-    
-    clicks = db.session.query(
-        Product.name,
-        Product.merchant,
-        func.count(AffiliateClick.id).label('click_count')
-    ).join(AffiliateClick).filter(
-        AffiliateClick.clicked_at >= start_date
-    ).group_by(Product.id).all()
-    
-    return jsonify([{
-        'product_name': click.name,
-        'merchant': click.merchant,
-        'click_count': click.click_count
-    } for click in clicks])
+    group_by = request.args.get('group_by', 'product')
+    return jsonify(click_analytics(days, group_by=group_by))
 
 def get_room_recommendations(room_id):
     """Generate product recommendations based on room analysis"""
-    room = Room.query.get(room_id)
-    if not room:
+    if not db.session.query(Room.id).filter_by(id=room_id).first():
         return []
     
     suggestions = OrganizationSuggestion.query.filter_by(room_id=room_id).all()
+    return recommendation_index.recommend(suggestions)
+
+@product_bp.route('/products/import', methods=['POST'])
+def import_products():
+    """Bulk upsert a merchant feed streamed as CSV (text/csv) or NDJSON (application/x-ndjson)
+
+    Rows are keyed on (merchant, sku); products of the feed's merchants that
+    are missing from the feed are deactivated unless `deactivate_missing=false`.
+    """
+    feed_format = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+    deactivate_missing = request.args.get('deactivate_missing', 'true').lower() != 'false'
     
-    recommendations = []
-    
-    for suggestion in suggestions:
-        # Map suggestion types to product categories
-        if suggestion.suggestion_type == 'storage':
-            products = Product.query.filter_by(category='storage', is_active=True).limit(3).all()
-            for product in products:
-                recommendations.append({
-                    'product_id': product.id,
-                    'relevance_score': 0.9 if suggestion.priority == 1 else 0.7,
-                    'reason': f"Recommended for: {suggestion.title}"
-                })
+    try:
+        summary = import_feed(request.stream, feed_format, deactivate_missing=deactivate_missing)
+        return jsonify(summary)
         
-        elif suggestion.suggestion_type == 'furniture':
-            products = Product.query.filter_by(category='furniture', is_active=True).limit(2).all()
-            for product in products:
-                recommendations.append({
-                    'product_id': product.id,
-                    'relevance_score': 0.8 if suggestion.priority == 1 else 0.6,
-                    'reason': f"Recommended for: {suggestion.title}"
-                })
-    
-    # Add some general recommendations
-    general_products = Product.query.filter_by(is_active=True).limit(2).all()
-    for product in general_products:
-        if not any(r['product_id'] == product.id for r in recommendations):
-            recommendations.append({
-                'product_id': product.id,
-                'relevance_score': 0.5,
-                'reason': "Popular organization solution"
-            })
-    
-    return recommendations
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
 
 # Initialize some sample products
 @product_bp.route('/products/seed', methods=['POST'])
@@ -171,48 +260,32 @@ def seed_products():
             'description': 'Modular storage system perfect for organizing any room',
             'category': 'storage',
             'price': 89.99,
-            'original_price': 109.99,
             'merchant': 'IKEA',
-            'affiliate_link': 'https://www.ikea.com/us/en/p/algot-shelf-unit-white-s49022093/?affiliate=roomscan',
-            'rating': 4.5,
-            'review_count': 1247,
-            'features': json.dumps(['Adjustable shelves', 'Easy assembly', 'Durable metal construction'])
+            'affiliate_link': 'https://www.ikea.com/us/en/p/algot-shelf-unit-white-s49022093/?affiliate=roomscan'
         },
         {
             'name': 'Container Store Elfa Shelving',
             'description': 'Premium modular shelving system for maximum organization',
             'category': 'storage',
             'price': 159.99,
-            'original_price': 199.99,
             'merchant': 'The Container Store',
-            'affiliate_link': 'https://www.containerstore.com/s/elfa/elfa-shelving?affiliate=roomscan',
-            'rating': 4.8,
-            'review_count': 892,
-            'features': json.dumps(['Lifetime warranty', 'Custom configurations', 'Professional installation'])
+            'affiliate_link': 'https://www.containerstore.com/s/elfa/elfa-shelving?affiliate=roomscan'
         },
         {
             'name': 'Wayfair Storage Ottoman',
             'description': 'Multi-functional ottoman with hidden storage compartment',
             'category': 'furniture',
             'price': 79.99,
-            'original_price': 99.99,
             'merchant': 'Wayfair',
-            'affiliate_link': 'https://www.wayfair.com/furniture/pdp/storage-ottoman?affiliate=roomscan',
-            'rating': 4.3,
-            'review_count': 2156,
-            'features': json.dumps(['Hidden storage', 'Comfortable seating', 'Multiple colors available'])
+            'affiliate_link': 'https://www.wayfair.com/furniture/pdp/storage-ottoman?affiliate=roomscan'
         },
         {
             'name': 'Amazon Basics Storage Bins',
             'description': 'Set of 6 collapsible fabric storage bins with handles',
             'category': 'storage',
             'price': 24.99,
-            'original_price': 34.99,
             'merchant': 'Amazon',
-            'affiliate_link': 'https://amazon.com/dp/B07EXAMPLE?tag=roomscan-20',
-            'rating': 4.2,
-            'review_count': 5432,
-            'features': json.dumps(['Collapsible design', 'Reinforced handles', 'Machine washable'])
+            'affiliate_link': 'https://amazon.com/dp/B07EXAMPLE?tag=roomscan-20'
         }
     ]
     
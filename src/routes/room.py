@@ -1,16 +1,75 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, send_file
 from src.models.user import db, User
 from src.models.room import Room, RoomItem, OrganizationSuggestion
+from src.utils.fields import FieldSet
+from src.utils.raw_json import encode_json
+from src.utils.json_patch import apply_json_patch, merge_patch
+from src.utils.conditional import ROOM_CACHE_CONTROL, make_etag, not_modified, with_validators
+from src.services.blob_store import scan_store
+from src.services.jobs import job_queue
+from src.services.spatial import DENSITY_CELL, RoomLayout, analyze_room, density_grid, spatial_suggestions
+from src.services.spatial_index import room_indexes
+import src.services.suggestion_jobs  # registers the suggestion job handlers
+from sqlalchemy.orm import selectinload
+from datetime import datetime
+from urllib.parse import urlencode
 import json
+import math
 
 room_bp = Blueprint('room', __name__)
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
 @room_bp.route('/rooms', methods=['GET'])
 def get_rooms():
-    """Get all rooms for a user"""
+    """Get a page of rooms for a user, ordered by id
+
+    Pass the `X-Next-Cursor` response header back as `cursor` to fetch the next page.
+    `scan_data` is only returned with `?include=scan_data` or when named in `?fields=`.
+    """
     user_id = request.args.get('user_id', 1)  # Default to user 1 for demo
-    rooms = Room.query.filter_by(user_id=user_id).all()
-    return jsonify([room.to_dict() for room in rooms])
+    cursor = request.args.get('cursor', type=int)
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    fields = FieldSet.from_request(request.args, deferred=Room.deferred_fields)
+    
+    # Fetch the page's (id, updated_at) versions first, plus one extra row to know whether another page exists
+    versions = room_versions_query(user_id, cursor, limit + 1).all()
+    has_more = len(versions) > limit
+    versions = versions[:limit]
+    
+    etag = make_etag('rooms', [tuple(version) for version in versions])
+    last_modified = max((version.updated_at for version in versions), default=None)
+    # A deleted room does not move the max updated_at, so lists are only validated by ETag
+    response = not_modified(etag, cache_control=ROOM_CACHE_CONTROL)
+    
+    if response is None:
+        rooms = room_page_query([version.id for version in versions], fields).all() if versions else []
+        response = jsonify([room.to_dict(fields) for room in rooms])
+    
+    with_validators(response, etag, last_modified, ROOM_CACHE_CONTROL)
+    if has_more:
+        next_cursor = versions[-1].id
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+        next_args = dict(request.args.items(), user_id=user_id, limit=limit, cursor=next_cursor)
+        response.headers['Link'] = f'<{request.base_url}?{urlencode(next_args)}>; rel="next"'
+    return response
+
+def room_versions_query(user_id, cursor, limit):
+    """(id, updated_at) of up to `limit` of a user's rooms after the `cursor` id, in id order"""
+    versions = Room.query.with_entities(Room.id, Room.updated_at).filter_by(user_id=user_id)
+    if cursor is not None:
+        versions = versions.filter(Room.id > cursor)
+    return versions.order_by(Room.id).limit(limit)
+
+def room_page_query(room_ids, fields):
+    """The rooms of one page, in id order, loading only `fields`"""
+    query = Room.query.filter(Room.id.in_(room_ids)).options(*fields.load_options(Room))
+    if 'items' in fields:
+        # Items for the whole page load in a single batched query
+        query = query.options(selectinload(Room.items).options(*fields.nested('items').load_options(RoomItem)))
+    return query.order_by(Room.id)
 
 @room_bp.route('/rooms', methods=['POST'])
 def create_room():
@@ -21,9 +80,9 @@ def create_room():
         room = Room(
             name=data.get('name', 'Untitled Room'),
             user_id=data.get('user_id', 1),
-            dimensions=json.dumps(data.get('dimensions', {})),
-            scan_data=json.dumps(data.get('scan_data', {}))
+            dimensions=encode_json(data.get('dimensions', {}))
         )
+        room.set_scan_data(encode_json(data.get('scan_data', {})))
         
         db.session.add(room)
         db.session.flush()  # Get the room ID
@@ -35,25 +94,18 @@ def create_room():
                 room_id=room.id,
                 name=item_data.get('name'),
                 category=item_data.get('category'),
-                position=json.dumps(item_data.get('position', {})),
+                position=encode_json(item_data.get('position', {})),
                 confidence=item_data.get('confidence', 0.0)
             )
             db.session.add(item)
         
-        # Generate organization suggestions
-        suggestions = generate_organization_suggestions(room.id, items_data)
-        for suggestion_data in suggestions:
-            suggestion = OrganizationSuggestion(
-                room_id=room.id,
-                suggestion_type=suggestion_data['type'],
-                title=suggestion_data['title'],
-                description=suggestion_data['description'],
-                priority=suggestion_data['priority']
-            )
-            db.session.add(suggestion)
+        # Suggestions and recommendations are generated in the background once the room is committed
+        job = job_queue.enqueue('room_suggestions', room_id=room.id)
         
         db.session.commit()
-        return jsonify(room.to_dict()), 201
+        response = jsonify(room.to_dict())
+        response.headers['X-Suggestions-Job'] = str(job.id)
+        return response, 201
         
     except Exception as e:
         db.session.rollback()
@@ -62,12 +114,125 @@ def create_room():
 @room_bp.route('/rooms/<int:room_id>', methods=['GET'])
 def get_room(room_id):
     """Get a specific room with all details"""
-    room = Room.query.get_or_404(room_id)
-    return jsonify(room.to_dict())
+    version = Room.query.with_entities(Room.updated_at).filter_by(id=room_id).first_or_404()
+    etag = make_etag('room', room_id, version.updated_at)
+    response = not_modified(etag, version.updated_at, ROOM_CACHE_CONTROL)
+    if response is not None:
+        return response
+    
+    fields = FieldSet.from_request(request.args)
+    room = Room.query.options(*fields.load_options(Room)).filter_by(id=room_id).first_or_404()
+    return with_validators(jsonify(room.to_dict(fields)), etag, version.updated_at, ROOM_CACHE_CONTROL)
+
+@room_bp.route('/rooms/<int:room_id>/scan', methods=['GET'])
+def download_room_scan(room_id):
+    """Stream a room's raw scan JSON without loading it into memory"""
+    room = Room.query.with_entities(Room.scan_ref, Room.scan_data).filter_by(id=room_id).first_or_404()
+    
+    if not room.scan_ref:
+        return Response(room.scan_data or 'null', mimetype='application/json')
+    
+    if 'gzip' in request.accept_encodings:
+        # The stored blob is already gzip, so send the file untouched
+        response = send_file(scan_store.path(room.scan_ref), mimetype='application/json', etag=room.scan_ref)
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        return response
+    
+    return Response(scan_store.iter_chunks(room.scan_ref), mimetype='application/json')
+
+@room_bp.route('/rooms/<int:room_id>/layout', methods=['GET'])
+def get_room_layout(room_id):
+    """Analyze the floor layout of a room's items: density grid, free area, spacing and zones"""
+    room = Room.query.with_entities(Room.dimensions).filter_by(id=room_id).first_or_404()
+    rows = RoomItem.query.with_entities(RoomItem.position).filter_by(room_id=room_id).all()
+    layout = RoomLayout.from_items(
+        json.loads(room.dimensions) if room.dimensions else None,
+        [{'position': json.loads(row.position) if row.position else None} for row in rows]
+    )
+    
+    analysis = analyze_room(layout)
+    analysis['suggestions'] = spatial_suggestions(analysis)
+    analysis['density_grid'] = {
+        'origin': layout.origin.tolist(),
+        'cell_size': DENSITY_CELL,
+        'items_per_m2': density_grid(layout).tolist()
+    }
+    return jsonify(analysis)
+
+def _query_point(prefix=''):
+    """Read a point from the query string; y defaults to 0 (floor level)"""
+    x = request.args.get(prefix + 'x', type=float)
+    z = request.args.get(prefix + 'z', type=float)
+    if x is None or z is None:
+        raise ValueError(f'{prefix}x and {prefix}z are required')
+    return (x, request.args.get(prefix + 'y', 0.0, type=float), z)
+
+def _items_response(room_id, matches):
+    """Serialize the matched items in match order, adding `distance` when known"""
+    fields = FieldSet.from_request(request.args)
+    ids = [item_id for item_id, _ in matches]
+    items = room_items_query(room_id, ids).options(*fields.load_options(RoomItem)).all() if ids else []
+    by_id = {item.id: item for item in items}
+    results = []
+    for item_id, distance in matches:
+        if item_id in by_id:
+            data = by_id[item_id].to_dict(fields)
+            if distance is not None:
+                data['distance'] = round(distance, 4)
+            results.append(data)
+    return jsonify(results)
+
+def room_items_query(room_id, item_ids):
+    """The items of `item_ids` that belong to the room"""
+    return RoomItem.query.filter(RoomItem.room_id == room_id, RoomItem.id.in_(item_ids))
+
+@room_bp.route('/rooms/<int:room_id>/items/nearby', methods=['GET'])
+def get_items_nearby(room_id):
+    """Items within `radius` metres of (x, y, z), nearest first"""
+    index = room_indexes.get(room_id)
+    if index is None:
+        return jsonify({'error': 'Room not found'}), 404
+    try:
+        center = _query_point()
+        radius = request.args.get('radius', type=float)
+        if radius is None or radius < 0:
+            raise ValueError('radius must be a non-negative number')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return _items_response(room_id, index.within_radius(center, radius))
+
+@room_bp.route('/rooms/<int:room_id>/items/within', methods=['GET'])
+def get_items_within(room_id):
+    """Items inside the box from (min_x, min_y, min_z) to (max_x, max_y, max_z), by id
+
+    Any bound left out is unbounded, so a shelf can be queried by x/z extent alone.
+    """
+    index = room_indexes.get(room_id)
+    if index is None:
+        return jsonify({'error': 'Room not found'}), 404
+    low = tuple(request.args.get(f'min_{axis}', -math.inf, type=float) for axis in 'xyz')
+    high = tuple(request.args.get(f'max_{axis}', math.inf, type=float) for axis in 'xyz')
+    if any(l > h for l, h in zip(low, high)):
+        return jsonify({'error': 'min bounds must not exceed max bounds'}), 400
+    return _items_response(room_id, [(item_id, None) for item_id in index.within_box(low, high)])
+
+@room_bp.route('/rooms/<int:room_id>/items/nearest', methods=['GET'])
+def get_items_nearest(room_id):
+    """The `k` items closest to (x, y, z), nearest first"""
+    index = room_indexes.get(room_id)
+    if index is None:
+        return jsonify({'error': 'Room not found'}), 404
+    try:
+        point = _query_point()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    k = max(1, min(request.args.get('k', 5, type=int), MAX_PAGE_SIZE))
+    return _items_response(room_id, index.nearest(point, k))
 
 @room_bp.route('/rooms/<int:room_id>', methods=['PUT'])
 def update_room(room_id):
-    """Update room details"""
+    """Update room details and regenerate its suggestions in the background"""
     room = Room.query.get_or_404(room_id)
     data = request.get_json()
     
@@ -75,17 +240,119 @@ def update_room(room_id):
         if 'name' in data:
             room.name = data['name']
         if 'dimensions' in data:
-            room.dimensions = json.dumps(data['dimensions'])
+            room.dimensions = encode_json(data['dimensions'])
         if 'scan_data' in data:
-            room.scan_data = json.dumps(data['scan_data'])
+            room.set_scan_data(encode_json(data['scan_data']))
+        job = job_queue.enqueue('room_suggestions', room_id=room.id)
         
         db.session.commit()
-        return jsonify(room.to_dict())
+        response = jsonify(room.to_dict())
+        response.headers['X-Suggestions-Job'] = str(job.id)
+        return response
         
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
+@room_bp.route('/rooms/<int:room_id>', methods=['PATCH'])
+def patch_room(room_id):
+    """Apply incremental changes to a room in one transaction
+
+    Body keys (all optional):
+      name         new room name
+      dimensions   JSON merge patch (RFC 7386) for the dimensions
+      scan_data    JSON merge patch for the scan
+      scan_patch   JSON Patch (RFC 6902) operations for the scan
+      items        {"add": [...], "update": [{"id": ..., ...}], "delete": [ids]};
+                   an update's `position` is merge-patched into the stored one
+
+    Changing the items or the dimensions regenerates the room's suggestions
+    in the background; the job id is returned in `X-Suggestions-Job`.
+    """
+    room = Room.query.options(*FieldSet(exclude=Room.deferred_fields).load_options(Room)).filter_by(id=room_id).first_or_404()
+    data = request.get_json() or {}
+    
+    try:
+        if 'name' in data:
+            room.name = data['name']
+        if 'dimensions' in data:
+            dimensions = json.loads(room.dimensions) if room.dimensions else {}
+            room.dimensions = encode_json(merge_patch(dimensions, data['dimensions']))
+        if 'scan_data' in data or 'scan_patch' in data:
+            scan = room.scan_json()
+            scan = scan.loads() if scan else {}
+            if 'scan_data' in data:
+                scan = merge_patch(scan, data['scan_data'])
+            if 'scan_patch' in data:
+                scan = apply_json_patch(scan, data['scan_patch'])
+            room.set_scan_data(encode_json(scan))
+        
+        previous_version = room.updated_at
+        changed_items, deleted_ids = apply_item_changes(room.id, data.get('items') or {})
+        # Suggestions are derived from the items and the dimensions
+        regenerate = data.get('items') or 'dimensions' in data
+        job = job_queue.enqueue('room_suggestions', room_id=room.id) if regenerate else None
+        
+        room.updated_at = version = datetime.utcnow()
+        db.session.flush()
+        positions = {item.id: item.position for item in changed_items}
+        db.session.commit()
+        room_indexes.apply(room.id, previous_version, version, positions, deleted_ids)
+        fields = FieldSet.from_request(request.args, deferred=Room.deferred_fields)
+        response = jsonify(room.to_dict(fields))
+        if job is not None:
+            response.headers['X-Suggestions-Job'] = str(job.id)
+        return response
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+
+def apply_item_changes(room_id, changes):
+    """Add, update and delete a room's items, touching only the rows named in `changes`
+
+    Returns the added and updated items and the set of deleted item ids.
+    """
+    updates = {item_data['id']: item_data for item_data in changes.get('update', [])}
+    delete_ids = set(changes.get('delete', []))
+    
+    items = []
+    if updates:
+        items = room_items_query(room_id, list(updates)).all()
+        missing = set(updates) - {item.id for item in items}
+        if missing:
+            raise ValueError(f'Items not found in room {room_id}: {sorted(missing)}')
+        for item in items:
+            item_data = updates[item.id]
+            if 'name' in item_data:
+                item.name = item_data['name']
+            if 'category' in item_data:
+                item.category = item_data['category']
+            if 'confidence' in item_data:
+                item.confidence = item_data['confidence']
+            if 'position' in item_data:
+                position = json.loads(item.position) if item.position else {}
+                item.position = encode_json(merge_patch(position, item_data['position']))
+    
+    if delete_ids:
+        deleted = room_items_query(room_id, list(delete_ids)).delete(synchronize_session='fetch')
+        if deleted != len(delete_ids):
+            raise ValueError(f'Some items to delete were not found in room {room_id}')
+    
+    added = []
+    for item_data in changes.get('add', []):
+        item = RoomItem(
+            room_id=room_id,
+            name=item_data.get('name'),
+            category=item_data.get('category'),
+            position=encode_json(item_data.get('position', {})),
+            confidence=item_data.get('confidence', 0.0)
+        )
+        db.session.add(item)
+        added.append(item)
+    
+    return items + added, delete_ids
+
 @room_bp.route('/rooms/<int:room_id>', methods=['DELETE'])
 def delete_room(room_id):
     """Delete a room and all associated data"""
@@ -103,8 +370,23 @@ def delete_room(room_id):
 @room_bp.route('/rooms/<int:room_id>/suggestions', methods=['GET'])
 def get_room_suggestions(room_id):
     """Get organization suggestions for a room"""
-    suggestions = OrganizationSuggestion.query.filter_by(room_id=room_id).order_by(OrganizationSuggestion.priority).all()
-    return jsonify([suggestion.to_dict() for suggestion in suggestions])
+    fields = FieldSet.from_request(request.args)
+    suggestions = room_suggestions_query(room_id, fields).all()
+    return jsonify([suggestion.to_dict(fields) for suggestion in suggestions])
+
+def room_suggestions_query(room_id, fields):
+    """A room's suggestions, highest priority first, loading only `fields`"""
+    return OrganizationSuggestion.query.options(
+        *fields.load_options(OrganizationSuggestion)
+    ).filter_by(room_id=room_id).order_by(OrganizationSuggestion.priority)
+
+@room_bp.route('/rooms/suggestions/regenerate', methods=['POST'])
+def regenerate_suggestions():
+    """Queue a job that regenerates suggestions for all rooms, or one user's with `user_id`"""
+    data = request.get_json(silent=True) or {}
+    job = job_queue.enqueue('regenerate_suggestions', user_id=data.get('user_id'))
+    db.session.commit()
+    return jsonify(job.to_dict()), 202
 
 @room_bp.route('/rooms/<int:room_id>/suggestions/<int:suggestion_id>/implement', methods=['POST'])
 def implement_suggestion(room_id, suggestion_id):
@@ -119,54 +401,3 @@ def implement_suggestion(room_id, suggestion_id):
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
-
-def generate_organization_suggestions(room_id, items):
-    """Generate AI-powered organization suggestions based on room items"""
-    suggestions = []
-    
-    # Analyze items by category
-    categories = {}
-    for item in items:
-        category = item.get('category', 'unknown')
-        if category not in categories:
-            categories[category] = []
-        categories[category].append(item)
-    
-    # Storage suggestions
-    if len(items) > 3:
-        suggestions.append({
-            'type': 'storage',
-            'title': 'Add storage bins for loose items',
-            'description': 'This will help reduce clutter and make items easier to find',
-            'priority': 1
-        })
-    
-    # Furniture suggestions
-    if 'storage' not in categories or len(categories.get('storage', [])) < 2:
-        suggestions.append({
-            'type': 'furniture',
-            'title': 'Consider a bookshelf for better organization',
-            'description': 'Vertical storage maximizes space efficiency',
-            'priority': 2
-        })
-    
-    # Organization suggestions
-    if 'furniture' in categories and len(categories['furniture']) > 2:
-        suggestions.append({
-            'type': 'organization',
-            'title': 'Use drawer organizers for small items',
-            'description': 'Keep frequently used items easily accessible',
-            'priority': 2
-        })
-    
-    # Lighting suggestions
-    if 'lighting' not in categories:
-        suggestions.append({
-            'type': 'lighting',
-            'title': 'Improve lighting for better visibility',
-            'description': 'Good lighting makes organization and daily tasks easier',
-            'priority': 3
-        })
-    
-    return suggestions
-
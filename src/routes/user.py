@@ -1,5 +1,6 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 from src.models.user import User, db
+from src.services.account_export import export_lines, gzip_stream, import_lines
 
 user_bp = Blueprint('user', __name__)
 
@@ -37,3 +38,24 @@ def delete_user(user_id):
     db.session.delete(user)
     db.session.commit()
     return '', 204
+
+@user_bp.route('/users/<int:user_id>/export', methods=['GET'])
+def export_user_data(user_id):
+    """Stream all of a user's rooms, items and suggestions as NDJSON, gzipped if accepted"""
+    lines = export_lines(user_id)
+    headers = {'Content-Disposition': f'attachment; filename="user-{user_id}-export.ndjson"'}
+    if 'gzip' in request.accept_encodings:
+        lines = gzip_stream(lines)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(stream_with_context(lines), mimetype='application/x-ndjson', headers=headers)
+
+@user_bp.route('/users/<int:user_id>/import', methods=['POST'])
+def import_user_data(user_id):
+    """Import an NDJSON export (optionally Content-Encoding: gzip) into this user's account"""
+    try:
+        counts = import_lines(user_id, request.stream, gzipped=request.content_encoding == 'gzip')
+        db.session.commit()
+        return jsonify(counts), 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
@@ -0,0 +1,189 @@
+import io
+import json
+import zlib
+from datetime import datetime
+from sqlalchemy import insert
+from sqlalchemy.orm import selectinload
+from src.models.user import db
+from src.models.room import Room, RoomItem, OrganizationSuggestion
+from src.services.blob_store import scan_store
+from src.utils.raw_json import dumps_with_raw, encode_json
+from src.utils.streams import binary_reader
+
+EXPORT_VERSION = 1
+ROOM_CHUNK_SIZE = 100
+IMPORT_ROOM_BATCH = 200
+IMPORT_CHILD_BATCH = 2000
+
+def export_lines(user_id, chunk_size=ROOM_CHUNK_SIZE):
+    """Yield a user's rooms, items and suggestions as NDJSON lines
+
+    Rooms are fetched in keyset-paginated chunks with their items and
+    suggestions batched per chunk, so memory stays bounded by `chunk_size`.
+    """
+    yield _line({'type': 'export', 'version': EXPORT_VERSION, 'user_id': user_id,
+                 'exported_at': datetime.utcnow().isoformat()})
+
+    last_id = 0
+    while True:
+        rooms = export_rooms_query(user_id, last_id, chunk_size).all()
+        if not rooms:
+            return
+
+        suggestions = {}
+        for suggestion in export_suggestions_query([room.id for room in rooms]):
+            suggestions.setdefault(suggestion.room_id, []).append(suggestion)
+
+        for room in rooms:
+            data = room.to_dict()
+            data.pop('items')
+            yield _line({'type': 'room', 'data': data})
+            for item in room.items:
+                yield _line({'type': 'item', 'data': item.to_dict()})
+            for suggestion in suggestions.get(room.id, []):
+                yield _line({'type': 'suggestion', 'data': suggestion.to_dict()})
+
+        last_id = rooms[-1].id
+        # Drop the chunk from the identity map so the session does not grow with the account
+        db.session.expunge_all()
+
+def export_rooms_query(user_id, after_id, limit):
+    """The next `limit` of a user's rooms after `after_id`, with their items"""
+    return Room.query.filter(Room.user_id == user_id, Room.id > after_id).options(
+        selectinload(Room.items)
+    ).order_by(Room.id).limit(limit)
+
+def export_suggestions_query(room_ids):
+    return OrganizationSuggestion.query.filter(
+        OrganizationSuggestion.room_id.in_(room_ids)
+    ).order_by(OrganizationSuggestion.id)
+
+def _line(record):
+    return dumps_with_raw(record, separators=(',', ':')) + '\n'
+
+def gzip_stream(chunks, level=6):
+    """Gzip an iterable of str chunks incrementally"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode('utf-8'))
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def _timestamp(value):
+    return datetime.fromisoformat(value) if value else datetime.utcnow()
+
+class AccountImporter:
+    """Recreates exported rooms under a user, remapping room ids, in batched inserts"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.room_ids = {}
+        self.pending_rooms = []
+        self.pending_children = []
+        self.counts = {'rooms': 0, 'items': 0, 'suggestions': 0}
+
+    def add(self, record):
+        kind = record.get('type')
+        data = record.get('data') or {}
+        if kind == 'export':
+            if record.get('version') != EXPORT_VERSION:
+                raise ValueError(f"Unsupported export version: {record.get('version')}")
+        elif kind == 'room':
+            self.pending_rooms.append((data['id'], self._room_row(data)))
+        elif kind in ('item', 'suggestion'):
+            self.pending_children.append((kind, data['room_id'], self._child_row(kind, data)))
+        else:
+            raise ValueError(f'Unknown record type: {kind}')
+
+        if len(self.pending_rooms) >= IMPORT_ROOM_BATCH or len(self.pending_children) >= IMPORT_CHILD_BATCH:
+            self.flush()
+
+    def _room_row(self, data):
+        return {
+            'name': data.get('name') or 'Untitled Room',
+            'user_id': self.user_id,
+            'dimensions': encode_json(data.get('dimensions') or {}),
+            'scan_ref': scan_store.put(encode_json(data.get('scan_data') or {})),
+            'created_at': _timestamp(data.get('created_at')),
+            'updated_at': _timestamp(data.get('updated_at'))
+        }
+
+    def _child_row(self, kind, data):
+        if kind == 'item':
+            return {
+                'name': data.get('name'),
+                'category': data.get('category'),
+                'position': encode_json(data.get('position') or {}),
+                'confidence': data.get('confidence', 0.0),
+                'created_at': _timestamp(data.get('created_at'))
+            }
+        return {
+            'suggestion_type': data.get('suggestion_type'),
+            'title': data.get('title'),
+            'description': data.get('description'),
+            'priority': data.get('priority', 1),
+            'is_implemented': bool(data.get('is_implemented')),
+            'created_at': _timestamp(data.get('created_at'))
+        }
+
+    def flush(self):
+        if self.pending_rooms:
+            new_ids = db.session.scalars(
+                insert(Room).returning(Room.id, sort_by_parameter_order=True),
+                [row for _, row in self.pending_rooms]
+            ).all()
+            for (old_id, _), new_id in zip(self.pending_rooms, new_ids):
+                self.room_ids[old_id] = new_id
+            self.counts['rooms'] += len(new_ids)
+            self.pending_rooms = []
+
+        rows = {'item': [], 'suggestion': []}
+        for kind, old_room_id, row in self.pending_children:
+            if old_room_id not in self.room_ids:
+                raise ValueError(f'{kind} refers to room {old_room_id}, which is not in the export')
+            rows[kind].append(dict(row, room_id=self.room_ids[old_room_id]))
+        if rows['item']:
+            db.session.execute(insert(RoomItem), rows['item'])
+            self.counts['items'] += len(rows['item'])
+        if rows['suggestion']:
+            db.session.execute(insert(OrganizationSuggestion), rows['suggestion'])
+            self.counts['suggestions'] += len(rows['suggestion'])
+        self.pending_children = []
+
+def import_lines(user_id, stream, gzipped=False):
+    """Import an NDJSON export from a binary stream into `user_id` in one transaction"""
+    stream = io.BufferedReader(_GunzipReader(stream)) if gzipped else binary_reader(stream)
+    importer = AccountImporter(user_id)
+    for line_number, line in enumerate(io.TextIOWrapper(stream, encoding='utf-8'), start=1):
+        if not line.strip():
+            continue
+        try:
+            importer.add(json.loads(line))
+        except (ValueError, KeyError) as e:
+            raise ValueError(f'Line {line_number}: {e}')
+    importer.flush()
+    return importer.counts
+
+class _GunzipReader(io.RawIOBase):
+    """Readable binary stream that decompresses gzip input on the fly"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        self._buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while not self._buffer:
+            chunk = self._stream.read(64 * 1024)
+            if not chunk:
+                self._buffer = self._decompressor.flush()
+                break
+            self._buffer = self._decompressor.decompress(chunk)
+        size = min(len(target), len(self._buffer))
+        target[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
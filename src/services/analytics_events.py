@@ -0,0 +1,198 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import Integer, cast, func, insert, literal, null, select, union_all
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from src.models.user import db
+from src.models.analytics import AppMetrics, UserActivity, AnalyticsRollup
+
+INSERT_CHUNK_SIZE = 5000
+
+# kind -> (raw model, series name column, value column or None)
+SOURCES = {
+    'metric': (AppMetrics, AppMetrics.metric_name, AppMetrics.metric_value),
+    'activity': (UserActivity, UserActivity.activity_type, None),
+}
+
+def parse_timestamp(value):
+    """Accept ISO 8601 strings or epoch seconds; returns a naive UTC datetime"""
+    if value is None:
+        return datetime.utcnow()
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
+    if isinstance(value, str):
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+    raise ValueError(f'Invalid timestamp: {value!r}')
+
+def metric_row(event):
+    if not event.get('metric_name'):
+        raise ValueError('metric_name is required')
+    value = event.get('metric_value')
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError('metric_value must be a number')
+    return {
+        'metric_name': event['metric_name'],
+        'metric_value': float(value),
+        'timestamp': parse_timestamp(event.get('timestamp')),
+        'extra_data': event.get('metadata')
+    }
+
+def activity_row(event):
+    if not event.get('activity_type'):
+        raise ValueError('activity_type is required')
+    return {
+        'user_id': event.get('user_id'),
+        'activity_type': event['activity_type'],
+        'timestamp': parse_timestamp(event.get('timestamp')),
+        'extra_data': event.get('metadata')
+    }
+
+class EventBatcher:
+    """Validates events and bulk-inserts them in chunks of INSERT_CHUNK_SIZE rows"""
+
+    def __init__(self):
+        self.pending = {'metric': [], 'activity': []}
+        self.counts = {'metric': 0, 'activity': 0}
+
+    def add(self, kind, event, position):
+        if not isinstance(event, dict):
+            raise ValueError(f'Event {position}: expected an object')
+        try:
+            row = metric_row(event) if kind == 'metric' else activity_row(event)
+        except ValueError as e:
+            raise ValueError(f'Event {position}: {e}')
+        self.pending[kind].append(row)
+        if len(self.pending[kind]) >= INSERT_CHUNK_SIZE:
+            self._insert(kind)
+
+    def add_typed(self, event, position):
+        """Add an event carrying its own `type` of 'metric' or 'activity'"""
+        kind = event.get('type') if isinstance(event, dict) else None
+        if kind not in SOURCES:
+            raise ValueError(f"Event {position}: type must be 'metric' or 'activity'")
+        self.add(kind, event, position)
+
+    def finish(self):
+        for kind in self.pending:
+            self._insert(kind)
+        return self.counts
+
+    def _insert(self, kind):
+        rows = self.pending[kind]
+        if rows:
+            db.session.execute(insert(SOURCES[kind][0]), rows)
+            self.counts[kind] += len(rows)
+            self.pending[kind] = []
+
+def _epoch(column):
+    return cast(func.strftime('%s', column), Integer)
+
+def series_query(kind, name, interval, start, end):
+    """(bucket, count, sum, min, max) per `interval` seconds of raw rows merged with compacted rollups"""
+    model, name_column, value_column = SOURCES[kind]
+    value = value_column if value_column is not None else null()
+
+    raw_bucket = (_epoch(model.timestamp) // interval) * interval
+    raw = select(
+        raw_bucket.label('bucket'),
+        func.count().label('count'),
+        func.sum(value).label('value_sum'),
+        func.min(value).label('value_min'),
+        func.max(value).label('value_max')
+    ).where(
+        name_column == name,
+        model.timestamp >= start,
+        model.timestamp < end
+    ).group_by(raw_bucket)
+
+    rollup_bucket = (AnalyticsRollup.bucket_epoch // interval) * interval
+    rollup = select(
+        rollup_bucket.label('bucket'),
+        func.sum(AnalyticsRollup.count).label('count'),
+        func.sum(AnalyticsRollup.value_sum).label('value_sum'),
+        func.min(AnalyticsRollup.value_min).label('value_min'),
+        func.max(AnalyticsRollup.value_max).label('value_max')
+    ).where(
+        AnalyticsRollup.kind == kind,
+        AnalyticsRollup.name == name,
+        AnalyticsRollup.bucket_epoch >= int(start.replace(tzinfo=timezone.utc).timestamp()),
+        AnalyticsRollup.bucket_epoch < int(end.replace(tzinfo=timezone.utc).timestamp())
+    ).group_by(rollup_bucket)
+
+    combined = union_all(raw, rollup).subquery()
+    return select(
+        combined.c.bucket,
+        func.sum(combined.c.count),
+        func.sum(combined.c.value_sum),
+        func.min(combined.c.value_min),
+        func.max(combined.c.value_max)
+    ).group_by(combined.c.bucket).order_by(combined.c.bucket)
+
+def series(kind, name, interval, start, end):
+    """count/sum/avg/min/max per `interval` seconds, merging raw rows with compacted rollups"""
+    value_column = SOURCES[kind][2]
+    rows = db.session.execute(series_query(kind, name, interval, start, end)).all()
+    buckets = []
+    for bucket, count, value_sum, value_min, value_max in rows:
+        entry = {
+            'bucket_start': datetime.fromtimestamp(bucket, timezone.utc).replace(tzinfo=None).isoformat(),
+            'count': count
+        }
+        if value_column is not None:
+            entry.update({
+                'sum': value_sum,
+                'avg': value_sum / count if count else None,
+                'min': value_min,
+                'max': value_max
+            })
+        buckets.append(entry)
+    return buckets
+
+def compact(older_than, bucket_seconds=3600):
+    """Fold raw metric and activity rows older than `older_than` into rollups and delete them
+
+    The cutoff is rounded down to a bucket boundary so no bucket is split
+    between raw rows and a rollup. Returns {kind: raw rows compacted}.
+    """
+    cutoff_epoch = int(older_than.replace(tzinfo=timezone.utc).timestamp()) // bucket_seconds * bucket_seconds
+    cutoff = datetime.fromtimestamp(cutoff_epoch, timezone.utc).replace(tzinfo=None)
+
+    compacted = {}
+    for kind, (model, name_column, value_column) in SOURCES.items():
+        value = value_column if value_column is not None else null()
+        bucket = (_epoch(model.timestamp) // bucket_seconds) * bucket_seconds
+        grouped = select(
+            literal(kind),
+            name_column,
+            literal(bucket_seconds),
+            bucket,
+            func.count(),
+            func.sum(value),
+            func.min(value),
+            func.max(value)
+        ).where(model.timestamp < cutoff).group_by(name_column, bucket)
+
+        statement = sqlite_insert(AnalyticsRollup).from_select(
+            ['kind', 'name', 'bucket_seconds', 'bucket_epoch', 'count', 'value_sum', 'value_min', 'value_max'],
+            grouped
+        )
+        excluded = statement.excluded
+        statement = statement.on_conflict_do_update(
+            index_elements=['kind', 'name', 'bucket_seconds', 'bucket_epoch'],
+            set_={
+                'count': AnalyticsRollup.count + excluded.count,
+                'value_sum': AnalyticsRollup.value_sum + excluded.value_sum,
+                'value_min': func.min(AnalyticsRollup.value_min, excluded.value_min),
+                'value_max': func.max(AnalyticsRollup.value_max, excluded.value_max)
+            }
+        )
+        db.session.execute(statement)
+        compacted[kind] = db.session.query(model).filter(model.timestamp < cutoff).delete(synchronize_session=False)
+
+    db.session.commit()
+    return compacted
+
+def default_window(days=1):
+    end = datetime.utcnow()
+    return end - timedelta(days=days), end
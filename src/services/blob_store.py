@@ -0,0 +1,108 @@
+import gzip
+import hashlib
+import mmap
+import os
+import tempfile
+import zlib
+
+CHUNK_SIZE = 64 * 1024
+
+class BlobStore:
+    """Content-addressed, gzip-compressed blobs on the local filesystem
+
+    Blobs are keyed by the SHA-256 of their uncompressed bytes, so storing the
+    same payload twice writes it once. Files are plain gzip and can be sent
+    as-is to clients that accept `Content-Encoding: gzip`.
+
+    A blob's mtime is the last time it was stored: `put` refreshes it when
+    the payload already exists. `flask prune-scans` skips recent blobs,
+    because the room that references them may not have committed yet.
+    """
+
+    def __init__(self, root, compresslevel=6):
+        self.root = root
+        self.compresslevel = compresslevel
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:] + '.gz')
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def put(self, data):
+        """Store bytes and return their digest; existing blobs are not rewritten"""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if os.path.exists(path):
+            try:
+                os.utime(path)
+                return digest
+            except FileNotFoundError:
+                pass  # pruned meanwhile; write it again
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file in the same directory so the rename is atomic
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(gzip.compress(data, compresslevel=self.compresslevel, mtime=0))
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return digest
+
+    def get(self, digest):
+        with open(self.path(digest), 'rb') as f:
+            return gzip.decompress(f.read())
+
+    def get_text(self, digest):
+        return self.get(digest).decode('utf-8')
+
+    def iter_chunks(self, digest, chunk_size=CHUNK_SIZE):
+        """Yield the uncompressed blob in chunks, reading the file through mmap"""
+        with open(self.path(digest), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+                for offset in range(0, len(mapped), chunk_size):
+                    chunk = decompressor.decompress(mapped[offset:offset + chunk_size])
+                    if chunk:
+                        yield chunk
+                tail = decompressor.flush()
+                if tail:
+                    yield tail
+
+    def modified_at(self, digest):
+        """Unix time the blob was last stored, or None if it does not exist"""
+        try:
+            return os.path.getmtime(self.path(digest))
+        except FileNotFoundError:
+            return None
+
+    def delete(self, digest):
+        try:
+            os.unlink(self.path(digest))
+        except FileNotFoundError:
+            pass
+
+    def digests(self):
+        """Iterate over the digests of every stored blob"""
+        if not os.path.isdir(self.root):
+            return
+        for prefix in os.listdir(self.root):
+            directory = os.path.join(self.root, prefix)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                if name.endswith('.gz'):
+                    yield prefix + name[:-len('.gz')]
+
+scan_store = BlobStore(os.environ.get(
+    'SCAN_BLOB_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'blobs')
+))
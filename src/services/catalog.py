@@ -0,0 +1,114 @@
+import os
+import tempfile
+import threading
+import time
+import uuid
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from src.models.product import Product
+
+class CatalogVersion:
+    """Version token for the product catalog, shared by all worker processes
+
+    Every committed product write replaces the token. It is stored in a small
+    file, and each process re-reads the file at most once per
+    `check_interval` seconds. A process that sees a new token runs its change
+    listeners, so in-memory caches in other workers are invalidated within
+    that interval.
+    """
+
+    def __init__(self, path=None, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._version = self._read() or self._create()
+        self._checked_at = time.monotonic()
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def on_change(self, listener):
+        self._listeners.append(listener)
+        return listener
+
+    def current(self):
+        """Return the current version, noticing writes made by other processes"""
+        if self.path and time.monotonic() - self._checked_at > self.check_interval:
+            self._checked_at = time.monotonic()
+            version = self._read()
+            if version and version != self._version:
+                self._set(version)
+        return self._version
+
+    def bump(self):
+        version = uuid.uuid4().hex
+        if self.path:
+            self._write(version)
+        self._set(version)
+        return version
+
+    def _set(self, version):
+        with self._lock:
+            self._version = version
+        for listener in self._listeners:
+            listener()
+
+    def _read(self):
+        if not self.path:
+            return None
+        try:
+            with open(self.path) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _write(self, version):
+        os.replace(self._write_temp(version), self.path)
+
+    def _write_temp(self, version):
+        directory = os.path.dirname(self.path)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as tmp:
+            tmp.write(version)
+        return tmp_path
+
+    def _create(self):
+        """Create the version file if it is missing and return the version every process agrees on
+
+        The token is linked into place only if no file exists yet, so when
+        several workers start at once one of them creates it and the others
+        read the winner's token.
+        """
+        version = uuid.uuid4().hex
+        if not self.path:
+            return version
+        tmp_path = self._write_temp(version)
+        try:
+            os.link(tmp_path, self.path)
+        except FileExistsError:
+            version = self._read() or version
+        finally:
+            os.unlink(tmp_path)
+        return version
+
+catalog = CatalogVersion(os.environ.get(
+    'CATALOG_VERSION_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'catalog.version')
+))
+
+def catalog_changed():
+    """Invalidate catalog caches; call after writes that bypass the ORM (bulk imports)"""
+    catalog.bump()
+
+@event.listens_for(Session, 'after_flush')
+def _track_product_writes(session, flush_context):
+    if any(isinstance(obj, Product) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info['catalog_changed'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _bump_catalog_version(session):
+    # Bump only once the write is committed, so caches never refill with pre-commit data
+    if session.info.pop('catalog_changed', False):
+        catalog_changed()
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_product_writes(session):
+    session.info.pop('catalog_changed', None)
@@ -0,0 +1,160 @@
+from datetime import datetime, timedelta
+from sqlalchemy import and_, func, literal, or_, select, union_all
+from sqlalchemy.dialects.sqlite import insert
+from src.models.user import db
+from src.models.product import Product, AffiliateClick, ClickRollup, ClickRollupState
+from src.services.clicks import click_buffer
+
+# strftime formats matching how SQLAlchemy stores DateTime values in SQLite,
+# so rollup buckets compare correctly against datetime bind parameters
+BUCKET_FORMATS = {
+    'hour': '%Y-%m-%d %H:00:00.000000',
+    'day': '%Y-%m-%d 00:00:00.000000',
+}
+
+def _state():
+    state = db.session.get(ClickRollupState, 1)
+    if state is None:
+        state = ClickRollupState(id=1, last_click_id=0)
+        db.session.add(state)
+        db.session.flush()
+    return state
+
+def roll_up_clicks(max_clicks=None):
+    """Fold clicks newer than the watermark into the hourly and daily rollups
+
+    Runs inside the caller's transaction and returns the number of click ids
+    covered; `max_clicks` bounds the id range handled in one call.
+    """
+    state = _state()
+    low = state.last_click_id
+    high = db.session.query(func.max(AffiliateClick.id)).scalar() or 0
+    if max_clicks is not None:
+        high = min(high, low + max_clicks)
+    if high <= low:
+        return 0
+
+    for granularity, bucket_format in BUCKET_FORMATS.items():
+        bucket = func.strftime(bucket_format, AffiliateClick.timestamp)
+        counts = select(
+            literal(granularity),
+            bucket,
+            AffiliateClick.product_id,
+            func.count(AffiliateClick.id)
+        ).where(
+            AffiliateClick.id > low,
+            AffiliateClick.id <= high
+        ).group_by(bucket, AffiliateClick.product_id)
+        statement = insert(ClickRollup).from_select(
+            ['granularity', 'bucket_start', 'product_id', 'click_count'], counts
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=['granularity', 'bucket_start', 'product_id'],
+            set_={'click_count': ClickRollup.click_count + statement.excluded.click_count}
+        )
+        db.session.execute(statement)
+
+    state.last_click_id = high
+    return high - low
+
+def backfill_click_rollups(chunk_size=100000, progress=None):
+    """Rebuild all rollups from raw click history, committing every `chunk_size` clicks"""
+    db.session.query(ClickRollup).delete()
+    _state().last_click_id = 0
+    db.session.commit()
+
+    total = 0
+    while True:
+        covered = roll_up_clicks(max_clicks=chunk_size)
+        db.session.commit()
+        if not covered:
+            return total
+        total += covered
+        if progress:
+            progress(total)
+
+def _floor_hour(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+def _ceil(moment, floor, step):
+    floored = floor(moment)
+    return floored if floored == moment else floored + step
+
+def click_counts(start):
+    """Click counts since `start`, as a (product_id, click_count) subquery to be summed per product
+
+    Whole days come from daily rollups, the partial first day and the current
+    day from hourly rollups, and only the partial first hour plus clicks not
+    yet rolled up are read from AffiliateClick.
+    """
+    state = db.session.get(ClickRollupState, 1)
+    watermark = state.last_click_id if state else 0
+    first_hour = _ceil(start, _floor_hour, timedelta(hours=1))
+    first_day = _ceil(start, lambda m: m.replace(hour=0, minute=0, second=0, microsecond=0), timedelta(days=1))
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    # Raw clicks are read as one row each from two disjoint index ranges (timestamp, then rowid);
+    # grouping them here would make SQLite scan a whole index to avoid sorting
+    raw_head = select(
+        AffiliateClick.product_id.label('product_id'),
+        literal(1).label('click_count')
+    ).where(
+        AffiliateClick.timestamp >= start,
+        AffiliateClick.timestamp < first_hour
+    )
+
+    raw_tail = select(
+        AffiliateClick.product_id.label('product_id'),
+        literal(1).label('click_count')
+    ).where(
+        AffiliateClick.id > watermark,
+        AffiliateClick.timestamp >= start,
+        AffiliateClick.timestamp >= first_hour
+    )
+
+    hourly = select(
+        ClickRollup.product_id.label('product_id'),
+        func.sum(ClickRollup.click_count).label('click_count')
+    ).where(
+        ClickRollup.granularity == 'hour',
+        ClickRollup.bucket_start >= first_hour,
+        or_(ClickRollup.bucket_start < first_day, ClickRollup.bucket_start >= today)
+    ).group_by(ClickRollup.product_id)
+
+    daily = select(
+        ClickRollup.product_id.label('product_id'),
+        func.sum(ClickRollup.click_count).label('click_count')
+    ).where(
+        and_(ClickRollup.granularity == 'day', ClickRollup.bucket_start >= first_day, ClickRollup.bucket_start < today)
+    ).group_by(ClickRollup.product_id)
+
+    return union_all(raw_head, raw_tail, hourly, daily).subquery()
+
+def click_analytics_query(days, group_by='product'):
+    """Click totals of the last `days` per product, or per merchant, most clicked first"""
+    start = datetime.utcnow() - timedelta(days=days)
+    counts = click_counts(start)
+    total = func.sum(counts.c.click_count).label('click_count')
+
+    if group_by == 'merchant':
+        return db.session.query(Product.merchant, total).join(
+            counts, counts.c.product_id == Product.id
+        ).group_by(Product.merchant).order_by(total.desc())
+
+    return db.session.query(Product.name, Product.merchant, total).join(
+        counts, counts.c.product_id == Product.id
+    ).group_by(Product.id).order_by(total.desc())
+
+def click_analytics(days, group_by='product'):
+    rows = click_analytics_query(days, group_by).all()
+    if group_by == 'merchant':
+        return [{'merchant': row.merchant, 'click_count': row.click_count} for row in rows]
+
+    return [{
+        'product_name': row.name,
+        'merchant': row.merchant,
+        'click_count': row.click_count
+    } for row in rows]
+
+# Keep rollups current in the same transaction that inserts each click batch
+click_buffer.add_flush_listener(lambda rows: roll_up_clicks())
@@ -0,0 +1,255 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+from sqlalchemy import exc, insert
+from src.models.user import db
+from src.models.product import Product, AffiliateClick
+from src.services.catalog import catalog
+
+logger = logging.getLogger(__name__)
+
+class ProductLinkCache:
+    """Product id -> affiliate link, so click tracking needs no read per request"""
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._links = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def get(self, product_id):
+        catalog.current()
+        links = self._links
+        if links is None or time.monotonic() - self._loaded_at > self.ttl:
+            links = self._load()
+        return links.get(product_id)
+
+    def _load(self):
+        with self._lock:
+            if self._links is None or time.monotonic() - self._loaded_at > self.ttl:
+                rows = db.session.query(Product.id, Product.affiliate_link).all()
+                self._links = {row.id: row.affiliate_link for row in rows}
+                self._loaded_at = time.monotonic()
+            return self._links
+
+    def invalidate(self):
+        self._links = None
+
+class ClickBuffer:
+    """Write-behind buffer that batches affiliate clicks into multi-row inserts
+
+    Clicks are queued in memory and a background thread inserts them when
+    `batch_size` clicks are waiting or `flush_interval` seconds have passed.
+    Clicks that cannot be inserted (queue full, database error, shutdown
+    failure) are appended to an NDJSON spool file and replayed on the next
+    flush. When a batch insert fails, its rows are retried one at a time;
+    rows the database rejects are moved to a dead-letter file next to the
+    spool (`<spool_path>.dead`) so they cannot block later flushes.
+
+    The row id does not exist until the batch is inserted, so `enqueue()`
+    gives each click a random `public_id` and returns it; that is the id
+    callers hand out to refer to the click.
+    """
+
+    def __init__(self, batch_size=500, flush_interval=1.0, maxsize=50000, spool_path=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool_path = spool_path
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._app = None
+        self._thread = None
+        self._pid = None
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+        self._spool_lock = threading.Lock()
+        self._flush_listeners = []
+
+    def init_app(self, app):
+        self._app = app
+        atexit.register(self.shutdown)
+
+    def add_flush_listener(self, listener):
+        """Call `listener(rows)` inside the flush transaction after each batch insert"""
+        self._flush_listeners.append(listener)
+
+    def enqueue(self, click):
+        """Queue a click for insertion and return its `public_id`
+
+        Raises ValueError if `user_id` or `room_id` is neither an integer nor None.
+        """
+        for key in ('user_id', 'room_id'):
+            value = click.get(key)
+            if value is not None and (not isinstance(value, int) or isinstance(value, bool)):
+                raise ValueError(f'{key} must be an integer')
+        click = dict(click, public_id=uuid.uuid4().hex)
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(click)
+        except queue.Full:
+            self._spool([click])
+        return click['public_id']
+
+    def _ensure_worker(self):
+        # Threads do not survive a fork, so each worker process starts its own
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            with self._start_lock:
+                if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                    self._pid = os.getpid()
+                    self._stopping.clear()
+                    self._thread = threading.Thread(target=self._run, name='click-buffer', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._drain(self.batch_size, self.flush_interval)
+            if batch:
+                self.flush(batch)
+
+    def _drain(self, limit, timeout):
+        batch = []
+        deadline = time.monotonic() + timeout
+        while len(batch) < limit:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def flush(self, batch):
+        """Insert a batch of clicks, plus any spooled clicks, in one transaction"""
+        spooled, taken_path = self._take_spool()
+        rows = spooled + batch
+        if not rows:
+            return 0
+        with self._app.app_context():
+            try:
+                db.session.execute(insert(AffiliateClick), rows)
+                for listener in self._flush_listeners:
+                    listener(rows)
+                db.session.commit()
+            except Exception:
+                logger.exception('Failed to flush %d affiliate clicks, retrying them one at a time', len(rows))
+                db.session.rollback()
+                rows = self._flush_each(rows)
+        if taken_path:
+            os.unlink(taken_path)
+        return len(rows)
+
+    def _flush_each(self, rows):
+        """Insert `rows` one per transaction, dead-lettering the ones the database rejects
+
+        An OperationalError (locked or unavailable database) says nothing
+        about the row, so it and every row after it are spooled instead.
+        Returns the rows inserted.
+        """
+        inserted, dead = [], []
+        for position, row in enumerate(rows):
+            try:
+                db.session.execute(insert(AffiliateClick), [row])
+                for listener in self._flush_listeners:
+                    listener([row])
+                db.session.commit()
+            except exc.OperationalError:
+                logger.exception('Failed to flush affiliate clicks, spooling %d to disk', len(rows) - position)
+                db.session.rollback()
+                self._spool(rows[position:])
+                break
+            except Exception:
+                logger.exception('Dead-lettering affiliate click %s', row.get('public_id'))
+                db.session.rollback()
+                dead.append(row)
+            else:
+                inserted.append(row)
+        if dead:
+            self._dead_letter(dead)
+        return inserted
+
+    def shutdown(self):
+        """Stop the worker and flush whatever is still queued"""
+        self._stopping.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=self.flush_interval + 1)
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch and self._app is not None:
+            self.flush(batch)
+
+    def _spool(self, rows):
+        if not self.spool_path:
+            logger.error('Dropping %d affiliate clicks: no spool file configured', len(rows))
+            return
+        self._append(self.spool_path, rows)
+
+    def _dead_letter(self, rows):
+        """Keep rejected clicks for inspection; they are never replayed"""
+        if not self.spool_path:
+            logger.error('Dropping %d rejected affiliate clicks: no spool file configured', len(rows))
+            return
+        self._append(f'{self.spool_path}.dead', rows)
+
+    def _append(self, path, rows):
+        with self._spool_lock:
+            with open(path, 'a') as f:
+                for row in rows:
+                    f.write(json.dumps(dict(row, timestamp=row['timestamp'].isoformat()), default=str) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _take_spool(self):
+        """Move the spool aside and return its rows; the file is removed once they are handled"""
+        if not self.spool_path:
+            return [], None
+        # Renames are atomic, so only one worker process can take a given spool
+        taken_path = f'{self.spool_path}.{os.getpid()}.flushing'
+        with self._spool_lock:
+            if not os.path.exists(taken_path):
+                source = self._orphaned_spool() or self.spool_path
+                try:
+                    os.replace(source, taken_path)
+                except FileNotFoundError:
+                    return [], None
+            with open(taken_path) as f:
+                rows = [json.loads(line) for line in f if line.strip()]
+        for row in rows:
+            row['timestamp'] = datetime.fromisoformat(row['timestamp'])
+            row.setdefault('public_id', None)  # spooled before clicks had one
+        return rows, taken_path
+
+    def _orphaned_spool(self):
+        """Find a spool left mid-flush by a worker process that has since died"""
+        directory, name = os.path.split(self.spool_path)
+        for filename in os.listdir(directory or '.'):
+            if not (filename.startswith(name + '.') and filename.endswith('.flushing')):
+                continue
+            pid = filename[len(name) + 1:-len('.flushing')]
+            if not pid.isdigit():
+                continue
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                return os.path.join(directory, filename)
+            except PermissionError:
+                pass
+        return None
+
+product_links = ProductLinkCache()
+
+click_buffer = ClickBuffer(spool_path=os.environ.get(
+    'CLICK_SPOOL_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'click_spool.ndjson')
+))
+
+catalog.on_change(product_links.invalidate)
@@ -0,0 +1,270 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+import numpy as np
+from sqlalchemy import func
+from src.models.user import db
+from src.models.room import Room, RoomItem
+from src.models.product import Product, AffiliateClick
+
+logger = logging.getLogger(__name__)
+
+CO_CLICK_WEIGHT = 0.5  # weight of "users who clicked your products also clicked" vs. room-category affinity
+CANDIDATE_FACTOR = 3  # candidates checked for being active per requested result
+
+class SparseRows:
+    """Row-normalized sparse matrix in CSR arrays, built from {row: Counter({column: count})}
+
+    Each row sums to 1, so a row reads as "of the clicks linked to this
+    row, the share that went to each product".
+    """
+
+    def __init__(self, rows, row_count):
+        self.indptr = np.zeros(row_count + 1, dtype=np.int64)
+        indices = []
+        data = []
+        for row in range(row_count):
+            columns = rows.get(row)
+            if columns:
+                total = sum(columns.values())
+                indices.extend(columns.keys())
+                data.extend(count / total for count in columns.values())
+            self.indptr[row + 1] = len(indices)
+        self.indices = np.array(indices, dtype=np.int64)
+        self.data = np.array(data, dtype=float)
+
+    def weighted_sum(self, row_weights, length):
+        """Dense vector of sum(weight * row) over the given {row: weight}"""
+        rows = [row for row in row_weights if row < len(self.indptr) - 1]
+        if not rows:
+            return np.zeros(length)
+        slices = [slice(self.indptr[row], self.indptr[row + 1]) for row in rows]
+        indices = np.concatenate([self.indices[s] for s in slices])
+        weights = np.concatenate([self.data[s] * row_weights[row] for row, s in zip(rows, slices)])
+        return np.bincount(indices, weights, minlength=length)[:length]
+
+class CoClickSnapshot:
+    """Immutable matrices that requests score against; replaced wholesale on refresh"""
+
+    def __init__(self, product_ids, category_index, affinity, co_clicks, clicked, built_at):
+        self.product_ids = np.array(product_ids, dtype=np.int64)
+        self.product_index = {product_id: column for column, product_id in enumerate(product_ids)}
+        self.category_index = category_index
+        self.affinity = affinity
+        self.co_clicks = co_clicks
+        self.clicked = clicked
+        self.built_at = built_at
+
+    def score(self, categories, user_id=None, exclude=()):
+        """Score every known product for a room, returning a dense array over product_ids
+
+        `categories` is a Counter of the room's item categories; the user's own
+        clicks add products that other users clicked alongside them.
+        """
+        length = len(self.product_ids)
+        total = sum(categories.values())
+        weights = {
+            self.category_index[category]: count / total
+            for category, count in categories.items() if category in self.category_index
+        }
+        scores = self.affinity.weighted_sum(weights, length)
+
+        own = self.clicked.get(user_id, ()) if user_id is not None else ()
+        if own:
+            scores += CO_CLICK_WEIGHT * self.co_clicks.weighted_sum({column: 1 / len(own) for column in own}, length)
+        for column in own:
+            scores[column] = 0.0
+        for product_id in exclude:
+            if product_id in self.product_index:
+                scores[self.product_index[product_id]] = 0.0
+        return scores
+
+    def related(self, product_id):
+        """Dense co-click scores for products clicked by the users who clicked `product_id`"""
+        length = len(self.product_ids)
+        column = self.product_index.get(product_id)
+        if column is None:
+            return np.zeros(length)
+        scores = self.co_clicks.weighted_sum({column: 1.0}, length)
+        scores[column] = 0.0
+        return scores
+
+    def top(self, scores, limit):
+        """(product_id, score) pairs of the highest positive scores, best first"""
+        positive = np.flatnonzero(scores > 0)
+        if len(positive) > limit:
+            positive = positive[np.argpartition(scores[positive], -limit)[-limit:]]
+        order = positive[np.lexsort((self.product_ids[positive], -scores[positive]))]
+        return [(int(self.product_ids[column]), float(scores[column])) for column in order]
+
+def new_clicks_query(after_id, upper_id):
+    """(id, user_id, product_id) of clicks by known users with ids in (after_id, upper_id]"""
+    return db.session.query(AffiliateClick.id, AffiliateClick.user_id, AffiliateClick.product_id).filter(
+        AffiliateClick.id > after_id,
+        AffiliateClick.id <= upper_id,
+        AffiliateClick.user_id.isnot(None)
+    )
+
+def user_categories_query(user_ids):
+    """Distinct (user_id, category) of the items in the users' rooms"""
+    return db.session.query(Room.user_id, RoomItem.category).join(
+        RoomItem, RoomItem.room_id == Room.id
+    ).filter(Room.user_id.in_(user_ids)).distinct()
+
+class CoClickIndex:
+    """Product co-click and room-category affinity counts, refreshed incrementally
+
+    Clicks are linked to the room categories of the user who clicked. A
+    refresh reads only clicks newer than the last one seen, updates the
+    counts in place and publishes a new snapshot; a background thread,
+    started by the first request of each process, builds the first snapshot
+    and then refreshes every `refresh_interval` seconds. Until the first
+    build finishes, requests get no co-click results rather than waiting. Every `full_rebuild_every`
+    refreshes the counts are rebuilt from scratch so that room changes
+    since a user's first click are picked up.
+    """
+
+    def __init__(self, refresh_interval=300, full_rebuild_every=12):
+        self.refresh_interval = refresh_interval
+        self.full_rebuild_every = full_rebuild_every
+        self.snapshot = None
+        self._app = None
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._last_click_id = 0
+        self._refreshes = 0
+        self._product_index = {}
+        self._category_index = {}
+        self._clicked = defaultdict(set)  # user id -> product columns
+        self._user_categories = {}  # user id -> category rows
+        self._pairs = defaultdict(Counter)  # product column -> Counter(product column)
+        self._affinity = defaultdict(Counter)  # category row -> Counter(product column)
+
+    def init_app(self, app):
+        self._app = app
+        # Start building on a process's first request, so the snapshot is usually ready before it is needed
+        app.before_request(self._ensure_worker)
+
+    def current(self):
+        """Return the latest snapshot, or None while the first one is still being built"""
+        self._ensure_worker()
+        return self.snapshot
+
+    def _ensure_worker(self):
+        if self._app is None:
+            return
+        # Threads do not survive a fork, so each worker process starts its own
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            with self._start_lock:
+                if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                    self._pid = os.getpid()
+                    self._thread = threading.Thread(target=self._run, name='co-click-index', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                with self._app.app_context():
+                    self.refresh()
+            except Exception:
+                logger.exception('Failed to refresh the co-click index')
+            time.sleep(self.refresh_interval)
+
+    def refresh(self, full=False):
+        """Fold clicks newer than the last refresh into the counts and publish a snapshot"""
+        with self._refresh_lock:
+            if full or (self.full_rebuild_every and self._refreshes >= self.full_rebuild_every):
+                self._reset()
+            self._refreshes += 1
+
+            # Bound the pass, so clicks written meanwhile wait for the next one with their users' categories
+            upper = db.session.query(func.max(AffiliateClick.id)).scalar() or 0
+            clicks = new_clicks_query(self._last_click_id, upper)
+            user_ids = {row.user_id for row in clicks.with_entities(AffiliateClick.user_id).distinct()}
+            self._load_user_categories(user_ids - set(self._user_categories))
+
+            seen = 0
+            for click in clicks.order_by(AffiliateClick.id).yield_per(10000):
+                seen += 1
+                column = self._product_index.setdefault(click.product_id, len(self._product_index))
+                clicked = self._clicked[click.user_id]
+                if column in clicked:
+                    continue
+                # Pairs and affinities count users, not repeat clicks
+                for other in clicked:
+                    self._pairs[column][other] += 1
+                    self._pairs[other][column] += 1
+                clicked.add(column)
+                for row in self._user_categories.get(click.user_id, ()):
+                    self._affinity[row][column] += 1
+            self._last_click_id = max(self._last_click_id, upper)
+
+            product_ids = sorted(self._product_index, key=self._product_index.get)
+            self.snapshot = CoClickSnapshot(
+                product_ids,
+                dict(self._category_index),
+                SparseRows(self._affinity, len(self._category_index)),
+                SparseRows(self._pairs, len(product_ids)),
+                {user_id: frozenset(columns) for user_id, columns in self._clicked.items()},
+                time.time()
+            )
+            return seen
+
+    def _load_user_categories(self, user_ids):
+        user_ids = list(user_ids)
+        for user_id in user_ids:
+            self._user_categories[user_id] = set()
+        for start in range(0, len(user_ids), 500):
+            for user_id, category in user_categories_query(user_ids[start:start + 500]):
+                row = self._category_index.setdefault(category, len(self._category_index))
+                self._user_categories[user_id].add(row)
+
+    def recommend_for_room(self, room_id, limit=10):
+        """(product_id, score) pairs for a room, best first, active products only"""
+        snapshot = self.current()
+        room = db.session.query(Room.user_id).filter_by(id=room_id).first()
+        if room is None:
+            return None
+        if snapshot is None:
+            return []
+        categories = Counter(
+            category for (category,) in db.session.query(RoomItem.category).filter_by(room_id=room_id)
+        )
+        scores = snapshot.score(categories, room.user_id)
+        return self._active(snapshot.top(scores, limit * CANDIDATE_FACTOR), limit)
+
+    def also_clicked(self, product_id, limit=10):
+        """(product_id, score) pairs of products clicked by users who clicked `product_id`"""
+        snapshot = self.current()
+        if snapshot is None:
+            return []
+        return self._active(snapshot.top(snapshot.related(product_id), limit * CANDIDATE_FACTOR), limit)
+
+    def _active(self, candidates, limit):
+        if not candidates:
+            return []
+        active = {row.id for row in db.session.query(Product.id).filter(
+            Product.id.in_([product_id for product_id, _ in candidates]),
+            Product.is_active == True
+        )}
+        return [candidate for candidate in candidates if candidate[0] in active][:limit]
+
+    def stats(self):
+        snapshot = self.snapshot
+        return {
+            'last_click_id': self._last_click_id,
+            'products': len(snapshot.product_ids) if snapshot else 0,
+            'categories': len(snapshot.category_index) if snapshot else 0,
+            'co_click_entries': len(snapshot.co_clicks.data) if snapshot else 0,
+            'affinity_entries': len(snapshot.affinity.data) if snapshot else 0,
+            'built_at': snapshot.built_at if snapshot else None
+        }
+
+co_click_index = CoClickIndex(refresh_interval=float(os.environ.get('CO_CLICK_REFRESH_SECONDS', 300)))
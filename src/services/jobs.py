@@ -0,0 +1,236 @@
+import atexit
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import case, event, func, update
+from sqlalchemy.orm import Session
+from src.models.user import db
+from src.models.job import Job
+from src.utils.raw_json import encode_json
+
+logger = logging.getLogger(__name__)
+
+# A job whose process died this many times (e.g. because the job crashes it) is failed rather than requeued
+MAX_ATTEMPTS = 3
+
+class JobQueue:
+    """Background jobs persisted in the `job` table and run on a thread pool
+
+    `enqueue()` adds a job row to the caller's session; the job is handed to
+    the pool only once that session commits, so a rolled-back request never
+    leaves work behind. Workers claim a job with a conditional UPDATE, so a
+    job is run once even when several processes try to resume the same rows.
+    Jobs still queued at shutdown stay in the table and are picked up again
+    by `resume()`, which each process runs in the background when it serves
+    its first request.
+
+    While a job runs, its process refreshes `heartbeat_at` every
+    `heartbeat_interval` seconds (and on each `progress()` call). `resume()`
+    only requeues a running job once its heartbeat is `stale_after` seconds
+    old, i.e. once the process that claimed it has stopped, and fails it
+    instead once it has been claimed MAX_ATTEMPTS times.
+    """
+
+    def __init__(self, max_workers=2, process_workers=None, stale_after=600, heartbeat_interval=60):
+        if heartbeat_interval >= stale_after:
+            raise ValueError('heartbeat_interval must be shorter than stale_after')
+        self.max_workers = max_workers
+        self.process_workers = process_workers or os.cpu_count() or 1
+        self.stale_after = stale_after
+        self.heartbeat_interval = heartbeat_interval
+        self._handlers = {}
+        self._app = None
+        self._executor = None
+        self._processes = None
+        self._pid = None
+        self._resumed_pid = None
+        self._running = set()
+        self._heartbeat = None
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+
+    def init_app(self, app):
+        self._app = app
+        app.before_request(self._resume_once)
+        atexit.register(self.shutdown)
+
+    def handler(self, kind):
+        """Register `func(job, **payload)` as the handler for jobs of `kind`"""
+        def register(func):
+            self._handlers[kind] = func
+            return func
+        return register
+
+    def enqueue(self, kind, **payload):
+        """Add a job to the current session; it is dispatched after the session commits"""
+        if kind not in self._handlers:
+            raise ValueError(f'No handler registered for job kind: {kind}')
+        job = Job(kind=kind, payload=encode_json(payload))
+        db.session.add(job)
+        db.session.flush()  # Get the job ID
+        db.session.info.setdefault('queued_jobs', []).append(job.id)
+        return job
+
+    def dispatch(self, job_ids):
+        executor = self._ensure_executor()
+        for job_id in job_ids:
+            executor.submit(self.run, job_id)
+
+    def _ensure_executor(self):
+        # Pools do not survive a fork, so each worker process starts its own
+        if self._executor is None or self._pid != os.getpid():
+            with self._start_lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._processes = None
+                    self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='job')
+        return self._executor
+
+    def _ensure_heartbeat(self):
+        # Started with the first job a process runs; like the pool, it does not survive a fork
+        if self._heartbeat is None or not self._heartbeat.is_alive():
+            with self._start_lock:
+                if self._heartbeat is None or not self._heartbeat.is_alive():
+                    self._stopping.clear()
+                    self._heartbeat = threading.Thread(target=self._beat, name='job-heartbeat', daemon=True)
+                    self._heartbeat.start()
+
+    def _beat(self):
+        while not self._stopping.wait(self.heartbeat_interval):
+            job_ids = list(self._running)
+            if not job_ids:
+                continue
+            try:
+                with self._app.app_context():
+                    db.session.execute(
+                        update(Job).where(Job.id.in_(job_ids), Job.status == 'running').values(
+                            heartbeat_at=datetime.utcnow()
+                        )
+                    )
+                    db.session.commit()
+            except Exception:
+                logger.exception('Failed to refresh the heartbeat of jobs %s', job_ids)
+
+    def _resume_once(self):
+        # Not at startup: creating the app stays free of database I/O and a preforking master resumes nothing
+        if self._resumed_pid != os.getpid():
+            executor = self._ensure_executor()
+            with self._start_lock:
+                if self._resumed_pid == os.getpid():
+                    return
+                self._resumed_pid = os.getpid()
+            executor.submit(self._resume_logged)
+
+    def _resume_logged(self):
+        try:
+            resumed = self.resume()
+        except Exception:
+            logger.exception('Failed to resume queued jobs')
+        else:
+            if resumed:
+                logger.info('Resumed %d queued jobs', resumed)
+
+    def process_pool(self):
+        """Shared process pool for CPU-bound fan-out inside a job"""
+        self._ensure_executor()
+        with self._start_lock:
+            if self._processes is None:
+                # Spawned, not forked: the parent has database connections and running threads
+                self._processes = ProcessPoolExecutor(
+                    self.process_workers, mp_context=multiprocessing.get_context('spawn')
+                )
+        return self._processes
+
+    def run(self, job_id):
+        """Claim and run one queued job; returns False if another worker got it first"""
+        with self._app.app_context():
+            now = datetime.utcnow()
+            claimed = db.session.execute(
+                update(Job).where(Job.id == job_id, Job.status == 'queued').values(
+                    status='running', started_at=now, heartbeat_at=now, attempts=Job.attempts + 1
+                )
+            ).rowcount
+            db.session.commit()
+            if not claimed:
+                return False
+
+            self._running.add(job_id)
+            self._ensure_heartbeat()
+            try:
+                job = db.session.get(Job, job_id)
+                try:
+                    handler = self._handlers[job.kind]
+                    result = handler(job, **json.loads(job.payload or '{}'))
+                    job.result = encode_json(result) if result is not None else job.result
+                    job.status = 'succeeded'
+                except Exception as e:
+                    logger.exception('Job %d (%s) failed', job_id, job.kind)
+                    db.session.rollback()
+                    job = db.session.get(Job, job_id)
+                    job.status = 'failed'
+                    job.error = str(e)
+                job.finished_at = datetime.utcnow()
+                db.session.commit()
+            finally:
+                self._running.discard(job_id)
+            return True
+
+    def progress(self, job, **counters):
+        """Record a running job's progress, visible to status requests before it finishes"""
+        job.result = encode_json(counters)
+        job.heartbeat_at = datetime.utcnow()
+        db.session.commit()
+
+    def resume(self):
+        """Re-dispatch queued jobs and requeue ones whose process stopped sending heartbeats"""
+        with self._app.app_context():
+            db.session.execute(requeue_stale_jobs(datetime.utcnow() - timedelta(seconds=self.stale_after)))
+            db.session.commit()
+            job_ids = [row.id for row in queued_jobs_query()]
+        self.dispatch(job_ids)
+        return len(job_ids)
+
+    def shutdown(self):
+        """Stop taking new work; jobs not yet started remain queued in the database"""
+        self._stopping.set()
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            if self._processes is not None:
+                self._processes.shutdown(wait=True, cancel_futures=True)
+        self._executor = None
+        self._processes = None
+
+def requeue_stale_jobs(cutoff):
+    """UPDATE statement that requeues running jobs whose last heartbeat is older than `cutoff`
+
+    Jobs already claimed MAX_ATTEMPTS times are marked failed instead.
+    """
+    exhausted = Job.attempts >= MAX_ATTEMPTS
+    # Rows claimed before heartbeat_at existed fall back to started_at
+    return update(Job).where(
+        Job.status == 'running', func.coalesce(Job.heartbeat_at, Job.started_at) < cutoff
+    ).values(
+        status=case((exhausted, 'failed'), else_='queued'),
+        error=case((exhausted, f'Worker stopped during each of {MAX_ATTEMPTS} attempts'), else_=Job.error),
+        finished_at=case((exhausted, datetime.utcnow()), else_=Job.finished_at)
+    )
+
+def queued_jobs_query():
+    return db.session.query(Job.id).filter(Job.status == 'queued').order_by(Job.id)
+
+job_queue = JobQueue(max_workers=int(os.environ.get('JOB_WORKERS', 2)))
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch_queued_jobs(session):
+    # Dispatch only once the job rows are committed, so workers can see them
+    job_ids = session.info.pop('queued_jobs', None)
+    if job_ids:
+        job_queue.dispatch(job_ids)
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_queued_jobs(session):
+    session.info.pop('queued_jobs', None)
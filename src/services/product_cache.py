@@ -0,0 +1,103 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from src.services.catalog import catalog
+from src.utils.cache import TTLCache
+
+class SharedCacheStore:
+    """SQLite-file key/value store that lets gunicorn workers share cached entries"""
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM cache WHERE key = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        self._connection().execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, json.dumps(value), time.time() + self.ttl)
+        )
+
+    def prune(self, version):
+        """Drop entries written under older catalog versions"""
+        self._connection().execute('DELETE FROM cache WHERE key NOT LIKE ? OR expires_at <= ?', (version + ':%', time.time()))
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+class ProductCache:
+    """Read-through cache of serialized products and listing pages
+
+    Keys are prefixed with the catalog version, so any product write makes
+    every older entry unreachable. Entries are kept in a per-process LRU and,
+    if `shared_path` is set, in a SQLite file shared by all workers.
+    """
+
+    def __init__(self, maxsize=2048, ttl=600, shared_path=None):
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.shared = SharedCacheStore(shared_path, ttl) if shared_path else None
+        self.loads = 0
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for `key` (a string), calling `loader()` on a miss"""
+        version = catalog.current()
+        versioned_key = f'{version}:{key}'
+
+        value = self.local.get(versioned_key)
+        if value is not None:
+            return value['value']
+
+        if self.shared is not None:
+            value = self.shared.get(versioned_key)
+            if value is not None:
+                self.local.set(versioned_key, value)
+                return value['value']
+
+        # Wrapped so that a cached None (e.g. a missing product) is still a hit
+        value = {'value': loader()}
+        self.loads += 1
+        self.local.set(versioned_key, value)
+        if self.shared is not None:
+            self.shared.set(versioned_key, value)
+        return value['value']
+
+    def on_catalog_change(self):
+        self.local.clear()
+        if self.shared is not None:
+            self.shared.prune(catalog.current())
+
+    def stats(self):
+        stats = {'version': catalog.current(), 'loads': self.loads, 'local': self.local.stats()}
+        if self.shared is not None:
+            stats['shared'] = self.shared.stats()
+        return stats
+
+product_cache = ProductCache(shared_path=os.environ.get('PRODUCT_CACHE_PATH'))
+catalog.on_change(product_cache.on_catalog_change)
@@ -0,0 +1,138 @@
+import csv
+import io
+import json
+from datetime import datetime
+from sqlalchemy.dialects.sqlite import insert
+from src.models.user import db
+from src.models.product import Product
+from src.services.catalog import catalog_changed
+from src.utils.streams import binary_reader
+
+BATCH_SIZE = 2000
+MAX_REPORTED_ERRORS = 100
+
+REQUIRED_FIELDS = ('sku', 'merchant', 'name', 'affiliate_link')
+TEXT_FIELDS = ('sku', 'merchant', 'name', 'affiliate_link', 'description', 'category', 'image_url')
+
+def iter_feed(stream, feed_format):
+    """Yield (line_number, row dict) from a binary CSV or NDJSON stream without reading it all"""
+    text_stream = io.TextIOWrapper(binary_reader(stream), encoding='utf-8', newline='')
+    if feed_format == 'csv':
+        reader = csv.DictReader(text_stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif feed_format == 'ndjson':
+        for line_number, line in enumerate(text_stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except ValueError:
+                yield line_number, None
+    else:
+        raise ValueError(f'Unsupported feed format: {feed_format}')
+
+def clean_row(row):
+    """Validate a feed row and map it onto Product columns"""
+    if not isinstance(row, dict):
+        raise ValueError('expected a JSON object')
+    product = {}
+    for field in TEXT_FIELDS:
+        value = row.get(field)
+        product[field] = str(value).strip() if value not in (None, '') else None
+    missing = [field for field in REQUIRED_FIELDS if not product[field]]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+
+    price = row.get('price')
+    if price in (None, ''):
+        product['price'] = None
+    else:
+        try:
+            product['price'] = float(price)
+        except (TypeError, ValueError):
+            raise ValueError(f'invalid price {price!r}')
+        if product['price'] < 0:
+            raise ValueError(f'invalid price {price!r}')
+    return product
+
+class ProductImporter:
+    """Upserts feed rows in batches keyed on (merchant, sku)
+
+    Products of the merchants seen in the feed that the feed did not contain
+    are deactivated by `finish()`.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, deactivate_missing=True, progress=None):
+        self.batch_size = batch_size
+        self.deactivate_missing = deactivate_missing
+        self.progress = progress
+        self.started_at = datetime.utcnow()
+        self.merchants = set()
+        self.batch = {}
+        self.imported = 0
+        self.deactivated = 0
+        self.errors = []
+        self.error_count = 0
+
+    def add(self, line_number, row):
+        try:
+            product = clean_row(row)
+        except ValueError as e:
+            self.error_count += 1
+            if len(self.errors) < MAX_REPORTED_ERRORS:
+                self.errors.append({'line': line_number, 'error': str(e)})
+            return
+        product['is_active'] = True
+        product['last_imported_at'] = self.started_at
+        product['updated_at'] = self.started_at
+        self.merchants.add(product['merchant'])
+        # A SKU repeated within one batch would conflict with itself; the last row wins
+        self.batch[(product['merchant'], product['sku'])] = product
+        if len(self.batch) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if not self.batch:
+            return
+        statement = insert(Product)
+        statement = statement.on_conflict_do_update(
+            index_elements=['merchant', 'sku'],
+            set_={
+                column: statement.excluded[column]
+                for column in ('name', 'description', 'category', 'affiliate_link',
+                               'image_url', 'price', 'is_active', 'last_imported_at', 'updated_at')
+            }
+        )
+        db.session.execute(statement, list(self.batch.values()))
+        db.session.commit()
+        self.imported += len(self.batch)
+        self.batch = {}
+        if self.progress:
+            self.progress(self.imported, self.error_count)
+
+    def finish(self):
+        self._flush()
+        if self.deactivate_missing and self.merchants:
+            self.deactivated = db.session.query(Product).filter(
+                Product.merchant.in_(self.merchants),
+                Product.is_active == True,
+                db.or_(Product.last_imported_at.is_(None), Product.last_imported_at < self.started_at)
+            ).update({Product.is_active: False, Product.updated_at: datetime.utcnow()}, synchronize_session=False)
+            db.session.commit()
+
+        # Core upserts bypass the ORM events that normally bump the catalog version
+        catalog_changed()
+
+        return {
+            'imported': self.imported,
+            'deactivated': self.deactivated,
+            'error_count': self.error_count,
+            'errors': self.errors
+        }
+
+def import_feed(stream, feed_format, **kwargs):
+    importer = ProductImporter(**kwargs)
+    for line_number, row in iter_feed(stream, feed_format):
+        importer.add(line_number, row)
+    return importer.finish()
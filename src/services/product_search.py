@@ -0,0 +1,68 @@
+import re
+from sqlalchemy import DDL, column, event, literal_column, table, text
+from src.models.product import Product
+
+# External-content FTS5 index over the product table, kept in sync by triggers
+SEARCH_INDEX_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5(
+        name, description, category, merchant,
+        content='product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_ai AFTER INSERT ON product BEGIN
+        INSERT INTO product_fts(rowid, name, description, category, merchant)
+        VALUES (new.id, new.name, new.description, new.category, new.merchant);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_ad AFTER DELETE ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, name, description, category, merchant)
+        VALUES ('delete', old.id, old.name, old.description, old.category, old.merchant);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_au AFTER UPDATE OF name, description, category, merchant ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, name, description, category, merchant)
+        VALUES ('delete', old.id, old.name, old.description, old.category, old.merchant);
+        INSERT INTO product_fts(rowid, name, description, category, merchant)
+        VALUES (new.id, new.name, new.description, new.category, new.merchant);
+    END""",
+]
+
+# bm25 column weights: name, description, category, merchant
+RANK = literal_column('bm25(product_fts, 10.0, 1.0, 4.0, 2.0)')
+
+product_fts = table('product_fts', column('rowid'))
+
+for statement in SEARCH_INDEX_DDL:
+    event.listen(Product.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+
+def create_search_index(connection):
+    """Create the index and triggers on an existing database and rebuild its contents"""
+    for statement in SEARCH_INDEX_DDL:
+        connection.execute(text(statement))
+    connection.execute(text("INSERT INTO product_fts(product_fts) VALUES ('rebuild')"))
+
+def match_expression(query):
+    """Turn free text into an FTS5 query: every word must match, the last one as a prefix"""
+    terms = re.findall(r'\w+', query.lower())
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+def search_products(query, merchant=None, min_price=None, max_price=None, include_inactive=False):
+    """Return a Product query ranked by relevance, or None if `query` has no searchable words"""
+    match = match_expression(query)
+    if match is None:
+        return None
+
+    products = Product.query.join(product_fts, product_fts.c.rowid == Product.id).filter(
+        text('product_fts MATCH :match').bindparams(match=match)
+    )
+    if not include_inactive:
+        products = products.filter(Product.is_active == True)
+    if merchant:
+        products = products.filter(Product.merchant == merchant)
+    if min_price is not None:
+        products = products.filter(Product.price >= min_price)
+    if max_price is not None:
+        products = products.filter(Product.price <= max_price)
+    return products.order_by(RANK)
@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+from sqlalchemy import inspect, select
+from src.models.room import Room, RoomItem
+from src.utils.fields import FieldSet
+from src.utils.sqlite import explain_query_plan, full_scans
+
+def selectin_statement(relationship, parent_ids):
+    """The statement selectinload() issues to load `relationship` for `parent_ids`"""
+    prop = relationship.property
+    (_, remote), = prop.local_remote_pairs
+    return select(prop.mapper).where(remote.in_(parent_ids))
+
+def route_queries():
+    """(route, statement) pairs for the queries the hot routes and jobs issue, with sample parameters
+
+    Statements come from the same query builders the routes and services
+    call. Primary-key lookups (session.get and filters on id alone) are
+    left out; they always search the rowid.
+    """
+    # Imported here: the routes import the services, some of which import this module's callers
+    from src.routes.room import DEFAULT_PAGE_SIZE, room_versions_query, room_page_query, room_items_query
+    from src.routes.room import room_suggestions_query
+    from src.routes.product import product_page_query, recommended_products_query
+    from src.services.account_export import ROOM_CHUNK_SIZE, export_rooms_query, export_suggestions_query
+    from src.services.analytics_events import series_query
+    from src.services.click_rollups import click_analytics_query
+    from src.services.co_clicks import new_clicks_query, user_categories_query
+    from src.services.jobs import queued_jobs_query, requeue_stale_jobs
+    from src.services.product_search import search_products
+    from src.services.recommendations import recommendation_index
+    from src.services.spatial_index import item_positions_query
+    from src.services.suggestion_jobs import implemented_suggestions_query
+
+    now = datetime.utcnow()
+    page_fields = FieldSet(exclude=Room.deferred_fields)
+    return [
+        ('GET /rooms (page versions)', room_versions_query(1, 0, DEFAULT_PAGE_SIZE + 1)),
+        ('GET /rooms (page)', room_page_query([1, 2, 3], page_fields)),
+        ('GET /rooms (items)', selectin_statement(Room.items, [1, 2, 3])),
+        ('GET /rooms/<id>/suggestions', room_suggestions_query(1, FieldSet())),
+        ('GET /rooms/<id>/items/nearest (grid)', item_positions_query(1)),
+        ('GET /rooms/<id>/items/nearest (items)', room_items_query(1, [1, 2]).options(*FieldSet().load_options(RoomItem))),
+        ('PATCH /rooms/<id> (items)', room_items_query(1, [1, 2])),
+        ('GET /users/<id>/export (rooms)', export_rooms_query(1, 0, ROOM_CHUNK_SIZE)),
+        ('GET /users/<id>/export (suggestions)', export_suggestions_query([1, 2])),
+        ('GET /products', product_page_query(None, 20)),
+        ('GET /products?category=', product_page_query('storage', 20)),
+        ('GET /products/search', search_products('storage shelf')),
+        ('GET /rooms/<id>/recommendations (ranked)', recommendation_index.ranked_query(['storage', 'furniture'])),
+        ('GET /rooms/<id>/recommendations (general)', recommendation_index.general_query()),
+        ('GET /rooms/<id>/recommendations (products)', recommended_products_query([1, 2], FieldSet())),
+        ('GET /analytics/clicks', click_analytics_query(30)),
+        ('GET /analytics/clicks?group_by=merchant', click_analytics_query(30, 'merchant')),
+        ('GET /analytics/metrics/<name>/series', series_query('metric', 'scan_duration', 3600, now - timedelta(days=1), now)),
+        ('GET /analytics/activity/<type>/series', series_query('activity', 'room_scan', 3600, now - timedelta(days=1), now)),
+        ('co-click refresh (clicks)', new_clicks_query(0, 1000)),
+        ('co-click refresh (user categories)', user_categories_query([1, 2])),
+        ('room_suggestions job', implemented_suggestions_query([1, 2])),
+        ('job resume (stale)', requeue_stale_jobs(now - timedelta(minutes=10))),
+        ('job resume (queued)', queued_jobs_query()),
+    ]
+
+def check_query_plans(connection):
+    """Explain every route query, returning (route, plan lines, full-scan lines) per query"""
+    tables = set(inspect(connection).get_table_names())
+    results = []
+    for route, query in route_queries():
+        # ORM Query objects are explained through the statement they compile to
+        plan = explain_query_plan(connection, getattr(query, 'statement', query))
+        results.append((route, plan, full_scans(plan, tables)))
+    return results
@@ -0,0 +1,115 @@
+from sqlalchemy import func
+from src.models.user import db
+from src.models.product import Product
+from src.services.catalog import catalog
+from src.utils.cache import TTLCache
+
+# Suggestion type -> (product category, products per suggestion, score for priority 1, score otherwise)
+SUGGESTION_CATEGORY_RULES = {
+    'storage': ('storage', 3, 0.9, 0.7),
+    'furniture': ('furniture', 2, 0.8, 0.6),
+    'clutter': ('storage', 2, 0.85, 0.65),
+}
+
+GENERAL_LIMIT = 2
+GENERAL_SCORE = 0.5
+
+# Cache key for the category-independent "popular" list
+_GENERAL_KEY = '__general__'
+
+class RecommendationIndex:
+    """In-memory ranked product ids per category, loaded with one query per miss batch"""
+
+    def __init__(self, depth=20, maxsize=256, ttl=300):
+        self.depth = depth
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def ranked(self, categories):
+        """Return {category: [product_id, ...]} for the given categories"""
+        catalog.current()
+        result = {}
+        missing = []
+        for category in categories:
+            ids = self._cache.get(category)
+            if ids is None:
+                missing.append(category)
+            else:
+                result[category] = ids
+
+        if missing:
+            loaded = {category: [] for category in missing}
+            for product_id, category in self.ranked_query(missing):
+                loaded[category].append(product_id)
+            for category, ids in loaded.items():
+                self._cache.set(category, ids)
+            result.update(loaded)
+
+        return result
+
+    def ranked_query(self, categories):
+        """(id, category) of the first `depth` active products of each category, in rank order"""
+        rank = func.row_number().over(
+            partition_by=Product.category, order_by=Product.id
+        ).label('rank')
+        ranked_products = db.session.query(Product.id, Product.category, rank).filter(
+            Product.is_active == True,
+            Product.category.in_(categories)
+        ).subquery()
+        return db.session.query(ranked_products.c.id, ranked_products.c.category).filter(
+            ranked_products.c.rank <= self.depth
+        ).order_by(ranked_products.c.category, ranked_products.c.rank)
+
+    def general(self):
+        """Return the ranked ids of active products regardless of category"""
+        catalog.current()
+        ids = self._cache.get(_GENERAL_KEY)
+        if ids is None:
+            ids = [row.id for row in self.general_query()]
+            self._cache.set(_GENERAL_KEY, ids)
+        return ids
+
+    def general_query(self):
+        return db.session.query(Product.id).filter(
+            Product.is_active == True
+        ).order_by(Product.id).limit(self.depth)
+
+    def recommend(self, suggestions):
+        """Resolve recommendations for all of a room's suggestions in one pass"""
+        categories = {
+            SUGGESTION_CATEGORY_RULES[s.suggestion_type][0]
+            for s in suggestions if s.suggestion_type in SUGGESTION_CATEGORY_RULES
+        }
+        ranked = self.ranked(categories) if categories else {}
+
+        recommendations = []
+        seen = set()
+        for suggestion in suggestions:
+            rule = SUGGESTION_CATEGORY_RULES.get(suggestion.suggestion_type)
+            if not rule:
+                continue
+            category, limit, high_score, low_score = rule
+            score = high_score if suggestion.priority == 1 else low_score
+            for product_id in ranked.get(category, [])[:limit]:
+                recommendations.append({
+                    'product_id': product_id,
+                    'relevance_score': score,
+                    'reason': f"Recommended for: {suggestion.title}"
+                })
+                seen.add(product_id)
+
+        # Add some general recommendations
+        for product_id in self.general()[:GENERAL_LIMIT]:
+            if product_id not in seen:
+                recommendations.append({
+                    'product_id': product_id,
+                    'relevance_score': GENERAL_SCORE,
+                    'reason': "Popular organization solution"
+                })
+
+        return recommendations
+
+    def invalidate(self):
+        self._cache.clear()
+
+recommendation_index = RecommendationIndex()
+catalog.on_change(recommendation_index.invalidate)
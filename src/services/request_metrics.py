@@ -0,0 +1,274 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from flask import g, request
+from sqlalchemy import event, insert
+from sqlalchemy.engine import Engine
+from src.models.user import db
+from src.models.analytics import AppMetrics
+from src.utils.json_provider import RawJSONProvider
+
+logger = logging.getLogger(__name__)
+
+N_PLUS_ONE_THRESHOLD = 5  # identical statements in one request that flag it as N+1
+SLOW_REQUEST_MS = 500  # requests slower than this are logged as warnings
+SAMPLES_PER_ENDPOINT = 1024  # recent requests kept per endpoint for percentiles
+UNFLUSHED_PER_ENDPOINT = 10000  # requests kept per endpoint between flushes; older ones are dropped
+PERCENTILES = (50, 95, 99)
+
+# Cost of the request being handled on this thread, or None outside requests
+_current = contextvars.ContextVar('request_cost', default=None)
+
+class RequestCost:
+    """What one request spent: SQL statements and time, JSON serialization time"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.statements = Counter()
+
+    def repeated_statements(self, threshold=N_PLUS_ONE_THRESHOLD):
+        """(statement, count) of statements run at least `threshold` times, most repeated first"""
+        return [(statement, count) for statement, count in self.statements.most_common() if count >= threshold]
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        context._request_metrics_started = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    cost = _current.get()
+    started = getattr(context, '_request_metrics_started', None)
+    if cost is None or started is None:
+        return
+    cost.sql_count += 1
+    cost.db_time += time.perf_counter() - started
+    # Statements are parameterized, so the same text with new parameters is the N+1 signature
+    cost.statements[statement] += 1
+
+class TimedJSONProvider(RawJSONProvider):
+    """RawJSONProvider that adds the time spent encoding responses to the request's cost"""
+
+    def dumps(self, obj, **kwargs):
+        cost = _current.get()
+        if cost is None:
+            return super().dumps(obj, **kwargs)
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            cost.serialize_time += time.perf_counter() - started
+
+class EndpointStats:
+    """Counters and a window of recent samples for one endpoint"""
+
+    def __init__(self, rule, method, flushed=False):
+        self.rule = rule
+        self.method = method
+        self.count = 0
+        self.errors = 0
+        self.n_plus_one = 0
+        # (duration ms, statements, db ms, serialize ms) of recent requests
+        self.samples = deque(maxlen=SAMPLES_PER_ENDPOINT)
+        # Requests since the last flush, only kept when something flushes them
+        self.unflushed = deque(maxlen=UNFLUSHED_PER_ENDPOINT) if flushed else None
+        self.unflushed_count = 0
+
+    def add(self, sample, status, repeated):
+        self.count += 1
+        self.errors += status >= 500
+        self.n_plus_one += bool(repeated)
+        self.samples.append(sample)
+        if self.unflushed is not None:
+            self.unflushed.append(sample)
+            self.unflushed_count += 1
+
+    def take_unflushed(self):
+        """(request count, samples) since the last call; samples are capped at UNFLUSHED_PER_ENDPOINT"""
+        taken = self.unflushed_count, list(self.unflushed or ())
+        if self.unflushed is not None:
+            self.unflushed.clear()
+        self.unflushed_count = 0
+        return taken
+
+    def to_dict(self):
+        columns = list(zip(*self.samples)) or [(), (), (), ()]
+        return {
+            'rule': self.rule,
+            'method': self.method,
+            'count': self.count,
+            'errors': self.errors,
+            'n_plus_one': self.n_plus_one,
+            'duration_ms': _percentiles(columns[0]),
+            'sql_count': _percentiles(columns[1]),
+            'db_ms': _percentiles(columns[2]),
+            'serialize_ms': _percentiles(columns[3])
+        }
+
+def _percentiles(values):
+    """Nearest-rank percentiles of `values`, or None for each if there are none"""
+    ordered = sorted(values)
+    return {
+        f'p{p}': round(ordered[max(0, -(-p * len(ordered) // 100) - 1)], 3) if ordered else None
+        for p in PERCENTILES
+    }
+
+class RequestMetrics:
+    """Per-request cost instrumentation with per-endpoint percentiles
+
+    Each request's wall time, SQL statement count, time in the database and
+    JSON serialization time are sent back in a `Server-Timing` header and
+    logged as one JSON line. A request that runs the same statement
+    N_PLUS_ONE_THRESHOLD or more times, typically a lazy load inside a loop,
+    is logged as a warning naming the statement. Percentiles are kept per
+    endpoint in this process; with `flush_interval` set, a background
+    thread also writes them to AppMetrics as
+    `request.<endpoint>.<stat>` series so that all workers are covered.
+
+    Statements run while a streamed body is generated count towards the
+    log line and percentiles, but not towards the header, which is sent
+    first.
+    """
+
+    def __init__(self, flush_interval=0):
+        self.flush_interval = flush_interval
+        self.started_at = datetime.utcnow()
+        self._endpoints = {}
+        self._lock = threading.Lock()
+        self._app = None
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def init_app(self, app):
+        """Install the request hooks on `app`; serialization is only timed with TimedJSONProvider as app.json"""
+        self._app = app
+        app.before_request(self._start)
+        app.after_request(self._add_server_timing)
+        app.teardown_request(self._finish)
+
+    def _start(self):
+        g.request_cost = RequestCost()
+        g.request_cost_token = _current.set(g.request_cost)
+        self._ensure_worker()
+
+    def _add_server_timing(self, response):
+        cost = g.get('request_cost')
+        if cost is not None:
+            total = (time.perf_counter() - cost.started) * 1000
+            response.headers['Server-Timing'] = ', '.join([
+                f'db;dur={cost.db_time * 1000:.2f};desc="{cost.sql_count} queries"',
+                f'serialize;dur={cost.serialize_time * 1000:.2f}',
+                f'total;dur={total:.2f}'
+            ])
+            g.request_status = response.status_code
+        return response
+
+    def _finish(self, exc):
+        cost = g.pop('request_cost', None)
+        if cost is None:
+            return
+        _current.reset(g.pop('request_cost_token'))
+        duration = (time.perf_counter() - cost.started) * 1000
+        status = 500 if exc is not None else g.get('request_status', 500)
+        endpoint = request.endpoint or '<unmatched>'
+        repeated = cost.repeated_statements()
+
+        record = {
+            'event': 'request',
+            'method': request.method,
+            'path': request.path,
+            'endpoint': endpoint,
+            'status': status,
+            'duration_ms': round(duration, 3),
+            'sql_count': cost.sql_count,
+            'db_ms': round(cost.db_time * 1000, 3),
+            'serialize_ms': round(cost.serialize_time * 1000, 3)
+        }
+        if repeated:
+            record['n_plus_one'] = [{'statement': statement[:300], 'count': count} for statement, count in repeated]
+            logger.warning(json.dumps(record))
+        elif duration > SLOW_REQUEST_MS:
+            logger.warning(json.dumps(record))
+        else:
+            logger.info(json.dumps(record))
+
+        if request.url_rule is None:
+            return
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = EndpointStats(
+                    request.url_rule.rule, request.method, flushed=bool(self.flush_interval)
+                )
+            stats.add((duration, cost.sql_count, cost.db_time * 1000, cost.serialize_time * 1000), status, repeated)
+
+    def snapshot(self):
+        """Per-endpoint counters and percentiles of this process, slowest p95 first"""
+        with self._lock:
+            endpoints = {endpoint: stats.to_dict() for endpoint, stats in self._endpoints.items()}
+        ordered = sorted(endpoints.items(), key=lambda entry: -(entry[1]['duration_ms']['p95'] or 0))
+        return {
+            'pid': os.getpid(),
+            'since': self.started_at.isoformat(),
+            'n_plus_one_threshold': N_PLUS_ONE_THRESHOLD,
+            'endpoints': dict(ordered)
+        }
+
+    def _ensure_worker(self):
+        if not self.flush_interval or self._app is None:
+            return
+        # Threads do not survive a fork, so each worker process starts its own
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            with self._start_lock:
+                if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                    self._pid = os.getpid()
+                    self._thread = threading.Thread(target=self._run, name='request-metrics', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                with self._app.app_context():
+                    self.flush()
+            except Exception:
+                logger.exception('Failed to persist request metrics')
+
+    def flush(self):
+        """Write percentiles of the requests since the last flush to AppMetrics, returning the row count
+
+        Only requests recorded while `flush_interval` is set are kept for flushing.
+        """
+        with self._lock:
+            windows = [(endpoint, stats.take_unflushed()) for endpoint, stats in self._endpoints.items()]
+        now = datetime.utcnow()
+        rows = []
+        for endpoint, (count, samples) in windows:
+            if not samples:
+                continue
+            durations, statements = [sample[0] for sample in samples], [sample[1] for sample in samples]
+            values = {'requests': count}
+            values.update({f'{name}_ms': value for name, value in _percentiles(durations).items()})
+            values['sql_count_p95'] = _percentiles(statements)['p95']
+            for stat, value in values.items():
+                rows.append({
+                    'metric_name': f'request.{endpoint}.{stat}'[:100],
+                    'metric_value': float(value),
+                    'timestamp': now,
+                    'extra_data': {'endpoint': endpoint, 'pid': os.getpid()}
+                })
+        if rows:
+            db.session.execute(insert(AppMetrics), rows)
+            db.session.commit()
+        return len(rows)
+
+request_metrics = RequestMetrics(flush_interval=float(os.environ.get('REQUEST_METRICS_FLUSH_SECONDS', 0)))
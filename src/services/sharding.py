@@ -0,0 +1,620 @@
+import bisect
+import hashlib
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, delete, event, func, insert, inspect, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.horizontal_shard import ShardedSession, execute_and_instances
+from sqlalchemy.orm import Mapper
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter, BooleanClauseList
+from src.utils.cache import TTLCache
+from src.utils.schema import upgrade_schema
+
+GLOBAL = 'global'  # the main database: users, catalog, analytics, placements and rooms from before sharding
+# Tables split across shards, and the column that places each row: on its user's shard, or its room's
+SHARDED_TABLES = {'room': 'user_id', 'room_item': 'room_id', 'organization_suggestion': 'room_id'}
+# WHERE columns whose = / IN values narrow a statement to the shards of those users or rooms
+ROUTING_COLUMNS = {
+    ('room', 'user_id'): 'user',
+    ('room', 'id'): 'room',
+    ('room_item', 'room_id'): 'room',
+    ('organization_suggestion', 'room_id'): 'room',
+}
+# A sharded row's id is sequence * ID_STRIDE + index of the database that created it, so ids never
+# collide, even after a user's rows move; this also bounds the number of shards
+ID_STRIDE = 1024
+LOOKUP_CHUNK_SIZE = 500
+# Reject writes for rows a move took out of this database (see ShardMap.move_user); the check runs inside the
+# writer's own transaction, so it cannot race the move, which holds the database's write lock until it commits
+FENCE_TRIGGERS = (
+    """CREATE TRIGGER IF NOT EXISTS shard_fence_room BEFORE INSERT ON room
+    WHEN EXISTS (SELECT 1 FROM shard_fence WHERE user_id = NEW.user_id AND room_id IS NULL)
+    BEGIN SELECT RAISE(ABORT, 'shard fence: the user''s rooms moved to another database'); END""",
+    """CREATE TRIGGER IF NOT EXISTS shard_fence_room_item BEFORE INSERT ON room_item
+    WHEN EXISTS (SELECT 1 FROM shard_fence WHERE room_id = NEW.room_id)
+    BEGIN SELECT RAISE(ABORT, 'shard fence: the room moved to another database'); END""",
+    """CREATE TRIGGER IF NOT EXISTS shard_fence_organization_suggestion BEFORE INSERT ON organization_suggestion
+    WHEN EXISTS (SELECT 1 FROM shard_fence WHERE room_id = NEW.room_id)
+    BEGIN SELECT RAISE(ABORT, 'shard fence: the room moved to another database'); END""",
+)
+
+class HashRing:
+    """Consistent hash ring over shard names; adding a shard moves about 1/N of the keys, all onto it"""
+
+    def __init__(self, shards, replicas=128):
+        self.shards = list(shards)
+        points = sorted((_hash(f'{shard}:{replica}'), shard) for shard in self.shards for replica in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    def shard_for(self, key):
+        if not self._hashes:
+            return None
+        return self._owners[bisect.bisect(self._hashes, _hash(str(key))) % len(self._hashes)]
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+def _table_name(mapper):
+    if mapper is not None and not isinstance(mapper, Mapper):
+        mapper = inspect(mapper, raiseerr=False)
+    return getattr(getattr(mapper, 'local_table', None), 'name', None)
+
+def _criteria(statement, parameters):
+    """{(table, column): values} for ROUTING_COLUMNS compared with = or IN at the top level of the WHERE clause"""
+    where = getattr(statement, 'whereclause', None)
+    if where is None:
+        return {}
+    if isinstance(where, BooleanClauseList) and where.operator is operators.and_:
+        clauses = where.clauses
+    else:
+        clauses = [where]
+    criteria = {}
+    for clause in clauses:
+        if not isinstance(clause, BinaryExpression):
+            continue
+        column, bind = clause.left, clause.right
+        if isinstance(column, BindParameter):
+            # Relationship loaders compare the other way round: `:param = room_item.room_id`
+            column, bind = bind, column
+        if not isinstance(bind, BindParameter):
+            continue
+        key = (getattr(getattr(column, 'table', None), 'name', None), getattr(column, 'name', None))
+        if key not in ROUTING_COLUMNS:
+            continue
+        # Loaders such as selectinload pass the values with the execution, not in the statement
+        value = parameters[bind.key] if isinstance(parameters, dict) and bind.key in parameters else bind.effective_value
+        if value is None:
+            continue
+        if clause.operator is operators.eq:
+            values = {value}
+        elif clause.operator is operators.in_op:
+            values = set(value)
+        else:
+            continue
+        criteria[key] = criteria[key] & values if key in criteria else values
+    return criteria
+
+class ShardMap:
+    """Places each user's rooms, room items and suggestions in one of several SQLite files
+
+    With ROOM_SHARDS configured, RoutingSession sends every statement on the
+    sharded tables to the database holding its rows, so writes to different
+    users' rooms take different SQLite write locks, while everything else
+    (users, catalog, analytics, jobs) stays in the main, `global`, database.
+
+    A user is placed on first room creation by a consistent hash ring over
+    the shards, and the placement is recorded in UserShard; the record, not
+    the ring, is what routes the user's rows, so adding a shard moves nobody
+    until `flask rebalance-shards` copies the affected users over. Rooms
+    created before sharding stay in the global database, recorded as placed
+    there by `flask bootstrap`, until they are rebalanced.
+
+    Statements are routed by their WHERE clause: `room.user_id` to the
+    user's database, `room.id` and the children's `room_id` to the database
+    holding the room (found through the id's origin, then by probing each
+    database, and cached). Statements that name neither are run on every
+    database and their rows concatenated, so ORDER BY and LIMIT then apply
+    per database. Rows of sharded tables get ids from a ShardSequence in the
+    database they are written to (see ID_STRIDE).
+
+    Placements and room locations are cached per process; a move bumps a
+    version file (as the catalog does) that every process checks at most
+    once per `check_interval` seconds. Until a process has seen the new
+    version its writes may still go to the old database; the move's
+    ShardFence records make those fail there instead of leaving rows behind.
+    """
+
+    def __init__(self, version_path=None, check_interval=1.0, cache_size=100000):
+        self.engines = {}
+        self.ring = HashRing([])
+        self.version_path = version_path
+        self.check_interval = check_interval
+        self.version = None
+        self._users = TTLCache(maxsize=cache_size, ttl=3600)
+        self._rooms = TTLCache(maxsize=cache_size, ttl=3600)
+
+    def init_app(self, app):
+        """Create (but not connect) an engine per URI in ROOM_SHARDS; none keeps every room in the main database"""
+        options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+        uris = app.config.get('ROOM_SHARDS') or []
+        if len(uris) >= ID_STRIDE:
+            raise ValueError(f'At most {ID_STRIDE - 1} room shards are supported')
+        self.engines = {f'shard{index}': create_engine(uri, **options) for index, uri in enumerate(uris)}
+        self.ring = HashRing(self.engines)
+        # Imported here: the catalog module imports the models, which import this module for RoutingSession
+        from src.services.catalog import CatalogVersion
+        self.version = CatalogVersion(self.version_path, check_interval=self.check_interval)
+        self.version.on_change(self._forget)
+        self._forget()
+
+    @property
+    def enabled(self):
+        return bool(self.engines)
+
+    def locations(self):
+        """Every database that can hold rooms, the global one first"""
+        return [GLOBAL, *self.engines]
+
+    def binds(self, db):
+        return {GLOBAL: db.engine, **self.engines}
+
+    def _engine(self, location):
+        if location == GLOBAL:
+            from src.models.user import db
+            return db.engine
+        return self.engines[location]
+
+    def _index(self, location):
+        return 0 if location == GLOBAL else int(location[len('shard'):]) + 1
+
+    def _forget(self):
+        self._users.clear()
+        self._rooms.clear()
+
+    # Placement
+
+    def shard_for_user(self, user_id, place=False):
+        """Database holding `user_id`'s rooms; with `place`, an unplaced user is placed on their ring shard
+
+        The placement commits on its own rather than with the caller's
+        session, which would otherwise hold the main database's write lock
+        while waiting for the shard's, the reverse of every other writer.
+        """
+        from src.models.shard import UserShard
+        self.version.current()
+        user_id = int(user_id)
+        shard = self._users.get(user_id)
+        if shard is not None:
+            return shard
+        with self._engine(GLOBAL).connect() as connection:
+            shard = connection.execute(select(UserShard.shard).where(UserShard.user_id == user_id)).scalar()
+            if shard is None:
+                if not place:
+                    return self.ring.shard_for(user_id)
+                connection.execute(sqlite_insert(UserShard).on_conflict_do_nothing(), {
+                    'user_id': user_id, 'shard': self.ring.shard_for(user_id), 'pinned': False,
+                    'moved_at': datetime.utcnow()
+                })
+                # Another process may have placed the user first
+                shard = connection.execute(select(UserShard.shard).where(UserShard.user_id == user_id)).scalar()
+                connection.commit()
+        self._users.set(user_id, shard)
+        return shard
+
+    def shards_for_rooms(self, room_ids):
+        """Databases holding any of `room_ids`; rooms that exist nowhere add nothing"""
+        self.version.current()
+        shards = set()
+        missing = []
+        for room_id in room_ids:
+            shard = self._rooms.get(room_id)
+            if shard is None:
+                missing.append(room_id)
+            else:
+                shards.add(shard)
+        if not missing:
+            return shards
+
+        # Most rooms never moved, so look in the database that created them first
+        by_origin = {}
+        locations = self.locations()
+        for room_id in missing:
+            origin = locations[room_id % ID_STRIDE] if room_id % ID_STRIDE < len(locations) else GLOBAL
+            by_origin.setdefault(origin, []).append(room_id)
+        for origin, ids in by_origin.items():
+            found = self._probe(origin, ids)
+            shards.update(found.values())
+            for location in locations:
+                pending = [room_id for room_id in ids if room_id not in found]
+                if not pending:
+                    break
+                if location != origin:
+                    found.update(self._probe(location, pending))
+            shards.update(found.values())
+        return shards
+
+    def _probe(self, location, room_ids):
+        from src.models.room import Room
+        found = {}
+        with self._engine(location).connect() as connection:
+            for start in range(0, len(room_ids), LOOKUP_CHUNK_SIZE):
+                chunk = room_ids[start:start + LOOKUP_CHUNK_SIZE]
+                for (room_id,) in connection.execute(select(Room.id).where(Room.id.in_(chunk))):
+                    found[room_id] = location
+                    self._rooms.set(room_id, location)
+        return found
+
+    def shard_for_row(self, table, row):
+        """Database for a new row of a sharded table, given as a dict of column values"""
+        if table == 'room':
+            return self.shard_for_user(row['user_id'], place=True)
+        shards = self.shards_for_rooms([row['room_id']])
+        if len(shards) != 1:
+            raise ValueError(f"Room {row['room_id']} not found")
+        return shards.pop()
+
+    def allocate_ids(self, session, location, table, count):
+        """`count` new ids for `table` rows written to `location`, drawn in the session's transaction"""
+        from src.models.shard import ShardSequence
+        connection = session.connection(bind_arguments={'shard_id': location})
+        end = connection.execute(
+            update(ShardSequence).where(ShardSequence.name == table)
+            .values(next_value=ShardSequence.next_value + count).returning(ShardSequence.next_value)
+        ).scalar()
+        if end is None:
+            raise RuntimeError(f'No id sequence for {table} in {location}; run `flask bootstrap`')
+        index = self._index(location)
+        return [value * ID_STRIDE + index for value in range(end - count, end)]
+
+    # Session hooks
+
+    def shard_chooser(self, mapper, instance, clause=None, **kw):
+        table = _table_name(mapper)
+        if not self.enabled or table not in SHARDED_TABLES:
+            return GLOBAL
+        if instance is None:
+            raise ValueError(f'Cannot choose a shard for {table} without a row')
+        room = instance.__dict__.get('room')
+        if room is not None and inspect(room).identity_token is not None:
+            return inspect(room).identity_token
+        column = SHARDED_TABLES[table]
+        return self.shard_for_row(table, {column: getattr(instance, column)})
+
+    def identity_chooser(self, mapper, primary_key, *, lazy_loaded_from=None, **kw):
+        if lazy_loaded_from is not None and lazy_loaded_from.identity_token is not None:
+            return [lazy_loaded_from.identity_token]
+        table = _table_name(mapper)
+        if not self.enabled or table not in SHARDED_TABLES:
+            return [None]
+        if table == 'room':
+            return sorted(self.shards_for_rooms([primary_key[0]])) or [GLOBAL]
+        return self.locations()
+
+    def route(self, orm_context):
+        """do_orm_execute handler: run statements on sharded tables on their databases
+
+        Other statements run as they would in a plain session, on the main
+        database (see RoutingSession.get_bind), and their objects carry no
+        identity token.
+        """
+        if orm_context.is_insert:
+            return self.route_insert(orm_context)
+        # bind_mapper also catches entities only selected from a subquery, as in Query.count()
+        mappers = (*orm_context.all_mappers, orm_context.bind_mapper)
+        if not any(_table_name(mapper) in SHARDED_TABLES for mapper in mappers):
+            return None
+        return execute_and_instances(orm_context)
+
+    def execute_chooser(self, orm_context):
+        parent = orm_context.lazy_loaded_from if orm_context.is_select else None
+        if parent is not None and parent.identity_token is not None:
+            # A relationship loaded from an object lives in the same database
+            return [parent.identity_token]
+        criteria = _criteria(orm_context.statement, orm_context.parameters)
+        if not criteria:
+            return self.locations()
+        shards = set()
+        for (table, column), values in criteria.items():
+            if ROUTING_COLUMNS[table, column] == 'user':
+                shards.update(self.shard_for_user(user_id) for user_id in values)
+            else:
+                shards.update(self.shards_for_rooms(values))
+        return sorted(shards) or [GLOBAL]
+
+    def route_insert(self, orm_context):
+        """Run ORM inserts on one database each, splitting rows for sharded tables by database
+
+        Rows of sharded tables without an id are given one. A split insert's
+        RETURNING rows come back one database after another.
+        """
+        if orm_context.bind_mapper is None:
+            return None
+        table = _table_name(orm_context.bind_mapper)
+        session = orm_context.session
+        location = orm_context.bind_arguments.get('shard_id')
+        if location is None and table not in SHARDED_TABLES:
+            location = GLOBAL
+        if location is not None:
+            with session.pinned(location):
+                return orm_context.invoke_statement()
+        if not orm_context.parameters:
+            raise ValueError('Inserts into sharded tables need their rows as parameters')
+
+        rows = orm_context.parameters if orm_context.is_executemany else [orm_context.parameters]
+        groups = {}
+        for row in rows:
+            groups.setdefault(self.shard_for_row(table, row), []).append(dict(row))
+        results = []
+        for location, group in groups.items():
+            unnumbered = [row for row in group if row.get('id') is None]
+            for row, row_id in zip(unnumbered, self.allocate_ids(session, location, table, len(unnumbered))):
+                row['id'] = row_id
+            if table == 'room':
+                for row in group:
+                    self._rooms.set(row['id'], location)
+            results.append(session.execute(
+                orm_context.statement, group,
+                execution_options=orm_context.local_execution_options,
+                bind_arguments=dict(orm_context.bind_arguments, shard_id=location)
+            ))
+        return results[0] if len(results) == 1 else results[0].merge(*results[1:])
+
+    def prepare_flush(self, session, flush_context, instances):
+        """Place new sharded objects and number them before the flush picks their connections"""
+        new = [obj for obj in session.new if _table_name(type(obj)) in SHARDED_TABLES]
+        # Rooms first: their children follow them through the `room` relationship
+        new.sort(key=lambda obj: _table_name(type(obj)) != 'room')
+        pending = {}
+        for obj in new:
+            state = inspect(obj)
+            if state.identity_token is None:
+                table = _table_name(type(obj))
+                room = obj.__dict__.get('room')
+                if table != 'room' and room is not None and inspect(room).identity_token is not None:
+                    state.identity_token = inspect(room).identity_token
+                else:
+                    column = SHARDED_TABLES[table]
+                    state.identity_token = self.shard_for_row(table, {column: getattr(obj, column)})
+            if obj.id is None:
+                pending.setdefault((state.identity_token, _table_name(type(obj))), []).append(obj)
+        for (location, table), objs in pending.items():
+            for obj, obj_id in zip(objs, self.allocate_ids(session, location, table, len(objs))):
+                obj.id = obj_id
+                if table == 'room':
+                    self._rooms.set(obj_id, location)
+
+    # Setup and rebalancing
+
+    def _tables(self):
+        from src.models.user import db
+        from src.models.shard import ShardFence, ShardSequence
+        return [db.metadata.tables[name] for name in SHARDED_TABLES] + [ShardSequence.__table__, ShardFence.__table__]
+
+    def bootstrap(self):
+        """Create the sharded tables on every shard, record pre-sharding users and seed the id sequences
+
+        Returns a list of the changes made. Idempotent; run it by `flask
+        bootstrap` before workers start and whenever a shard is added.
+        """
+        from src.models.room import Room
+        from src.models.shard import ShardSequence, UserShard
+        if not self.enabled:
+            return []
+        changes = []
+        for location, engine in self.engines.items():
+            with engine.begin() as connection:
+                changes += [f'{location}: {change}' for change in upgrade_schema(connection, None, self._tables())]
+        for location in self.locations():
+            with self._engine(location).begin() as connection:
+                for trigger in FENCE_TRIGGERS:
+                    connection.exec_driver_sql(trigger)
+
+        with self._engine(GLOBAL).begin() as connection:
+            # Rooms written before sharding stay where they are until rebalanced
+            unplaced = connection.execute(
+                select(Room.user_id).distinct().where(Room.user_id.not_in(select(UserShard.user_id)))
+            ).scalars().all()
+            if unplaced:
+                connection.execute(sqlite_insert(UserShard).on_conflict_do_nothing(), [
+                    {'user_id': user_id, 'shard': GLOBAL, 'pinned': False, 'moved_at': datetime.utcnow()}
+                    for user_id in unplaced
+                ])
+                changes.append(f'placed {len(unplaced)} existing users in {GLOBAL}')
+
+        # Every database numbers new rows past the largest id anywhere, so existing ids are never reissued
+        tables = self._tables()[:len(SHARDED_TABLES)]
+        starts = {table.name: 0 for table in tables}
+        for location in self.locations():
+            with self._engine(location).connect() as connection:
+                for table in tables:
+                    largest = connection.execute(select(func.max(table.c.id))).scalar() or 0
+                    starts[table.name] = max(starts[table.name], largest // ID_STRIDE + 1)
+        for location in self.locations():
+            with self._engine(location).begin() as connection:
+                for name, start in starts.items():
+                    statement = sqlite_insert(ShardSequence).values(name=name, next_value=start)
+                    connection.execute(statement.on_conflict_do_update(
+                        index_elements=['name'],
+                        set_={'next_value': func.max(ShardSequence.next_value, statement.excluded.next_value)}
+                    ))
+        return changes
+
+    def plan(self, drain=()):
+        """(user_id, from, to) for placed users off their ring shard, or on a drained or unknown one
+
+        Users placed by hand (`pinned`) stay unless their shard is drained or gone.
+        """
+        from src.models.shard import UserShard
+        ring = HashRing([name for name in self.engines if name not in drain])
+        with self._engine(GLOBAL).connect() as connection:
+            placements = connection.execute(select(UserShard.user_id, UserShard.shard, UserShard.pinned)).all()
+        moves = []
+        for user_id, shard, pinned in placements:
+            usable = shard in self.locations() and shard not in drain
+            target = ring.shard_for(user_id)
+            if target is not None and target != shard and (not usable or not pinned):
+                moves.append((user_id, shard, target))
+        return moves
+
+    def leftovers(self):
+        """(user_id, location, placed location) for rooms in a database other than their user's
+
+        These are copies left by an interrupted move, or rooms written to the
+        old database before `flask bootstrap` installed its fence triggers.
+        """
+        from src.models.room import Room
+        from src.models.shard import UserShard
+        with self._engine(GLOBAL).connect() as connection:
+            placements = dict(connection.execute(select(UserShard.user_id, UserShard.shard)).all())
+        found = []
+        for location in self.locations():
+            with self._engine(location).connect() as connection:
+                for user_id in connection.execute(select(Room.user_id).distinct()).scalars():
+                    placed = placements.get(user_id)
+                    if placed is not None and placed != location:
+                        found.append((user_id, location, placed))
+        return found
+
+    def _place(self, connection, user_id, shard, pinned=None):
+        from src.models.shard import UserShard
+        values = {'user_id': user_id, 'shard': shard, 'moved_at': datetime.utcnow()}
+        if pinned is not None:
+            values['pinned'] = pinned
+        statement = sqlite_insert(UserShard).values(**values)
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=['user_id'], set_={key: value for key, value in values.items() if key != 'user_id'}
+        ))
+
+    def move_user(self, user_id, source, target, pinned=None):
+        """Copy a user's rows from `source` to `target`, switch the placement, then delete them from `source`
+
+        The source database is write-locked for the duration, so no request
+        changes the user's rows mid-copy. If the user is already placed on
+        `target`, the rows are merged instead: rows the target already has
+        are kept. Returns the number of rows moved per table.
+
+        In the same transaction as the delete, the source gets ShardFence
+        records for the user and each moved room, and the target's records
+        for the user are cleared. Processes that have not yet seen the new
+        placement then fail to insert into the source, rather than writing
+        rows there that nothing reads.
+        """
+        from src.models.shard import UserShard
+        room, item, suggestion, sequence, fence = self._tables()
+        counts = {}
+        with self._engine(source).connect() as src:
+            with src.begin():
+                # An UPDATE takes the write lock now rather than at the first delete
+                src.execute(update(sequence).where(sequence.c.name == room.name).values(next_value=sequence.c.next_value))
+                rooms = [dict(row) for row in src.execute(select(room).where(room.c.user_id == user_id)).mappings()]
+                room_ids = [row['id'] for row in rooms]
+                children = {item: [], suggestion: []}
+                for table in children:
+                    for start in range(0, len(room_ids), LOOKUP_CHUNK_SIZE):
+                        chunk = room_ids[start:start + LOOKUP_CHUNK_SIZE]
+                        children[table] += [dict(row) for row in src.execute(
+                            select(table).where(table.c.room_id.in_(chunk))).mappings()]
+
+                # With the source being the global database, its locked connection is the only one that may write it
+                if source == GLOBAL:
+                    placed = src.execute(select(UserShard.shard).where(UserShard.user_id == user_id)).scalar()
+                else:
+                    with self._engine(GLOBAL).connect() as connection:
+                        placed = connection.execute(select(UserShard.shard).where(UserShard.user_id == user_id)).scalar()
+                merging = placed == target
+                with self._engine(target).begin() as dst:
+                    dst.execute(delete(fence).where(fence.c.user_id == user_id))
+                    if not merging:
+                        # Copies left by an interrupted move are stale; the source is authoritative
+                        user_rooms = select(room.c.id).where(room.c.user_id == user_id).scalar_subquery()
+                        for table in (item, suggestion):
+                            dst.execute(delete(table).where(table.c.room_id.in_(user_rooms)))
+                        dst.execute(delete(room).where(room.c.user_id == user_id))
+                    for table, rows in ((room, rooms), (item, children[item]), (suggestion, children[suggestion])):
+                        if rows:
+                            dst.execute(sqlite_insert(table).on_conflict_do_nothing(), rows)
+                        counts[table.name] = len(rows)
+
+                if not merging:
+                    if source == GLOBAL:
+                        self._place(src, user_id, target, pinned)
+                    else:
+                        with self._engine(GLOBAL).begin() as connection:
+                            self._place(connection, user_id, target, pinned)
+                    self.version.bump()
+
+                for table in (item, suggestion):
+                    for start in range(0, len(room_ids), LOOKUP_CHUNK_SIZE):
+                        src.execute(delete(table).where(table.c.room_id.in_(room_ids[start:start + LOOKUP_CHUNK_SIZE])))
+                src.execute(delete(room).where(room.c.user_id == user_id))
+                src.execute(delete(fence).where(fence.c.user_id == user_id))
+                src.execute(insert(fence), [
+                    {'user_id': user_id, 'room_id': room_id, 'moved_to': target} for room_id in [None, *room_ids]
+                ])
+        for room_id in room_ids:
+            self._rooms.set(room_id, target)
+        return counts
+
+class RoutingSession(ShardedSession, Session):
+    """Flask-SQLAlchemy session that runs each statement on the database holding its rows
+
+    Only statements and objects of the sharded tables go through the shard
+    choosers; everything else takes the plain session's path to the main
+    database. Without room shards that is every statement.
+    """
+
+    def __init__(self, db, **kwargs):
+        super().__init__(
+            shard_chooser=shard_map.shard_chooser,
+            identity_chooser=shard_map.identity_chooser,
+            execute_chooser=shard_map.execute_chooser,
+            shards=shard_map.binds(db),
+            db=db,
+            **kwargs
+        )
+        self._pinned_shard = None
+        # ShardedSession re-invokes every statement once per chosen shard; ShardMap.route only does so for sharded tables
+        event.remove(self, 'do_orm_execute', execute_and_instances)
+        if shard_map.enabled:
+            event.listen(self, 'do_orm_execute', shard_map.route, retval=True)
+            event.listen(self, 'before_flush', shard_map.prepare_flush)
+        else:
+            self.connection_callable = None
+
+    @contextmanager
+    def pinned(self, location):
+        """Send statements that name no database to `location`
+
+        The ORM's bulk INSERT, which `session.execute(insert(Model), rows)`
+        uses, refuses to run while the session picks a connection per object,
+        so that is switched off meanwhile.
+        """
+        self.connection_callable = None
+        self._pinned_shard = location
+        try:
+            yield
+        finally:
+            del self.connection_callable
+            self._pinned_shard = None
+
+    def connection_callable(self, mapper=None, instance=None, shard_id=None, **kw):
+        if shard_id is None and _table_name(mapper) not in SHARDED_TABLES:
+            shard_id = GLOBAL
+        return super().connection_callable(mapper, instance, shard_id=shard_id, **kw)
+
+    def get_bind(self, mapper=None, *, shard_id=None, instance=None, clause=None, **kw):
+        if shard_id is None:
+            if self._pinned_shard is not None:
+                shard_id = self._pinned_shard
+            elif not shard_map.enabled or _table_name(mapper) not in SHARDED_TABLES:
+                shard_id = GLOBAL
+        return super().get_bind(mapper, shard_id=shard_id, instance=instance, clause=clause, **kw)
+
+shard_map = ShardMap(os.environ.get(
+    'SHARD_MAP_VERSION_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'shard_map.version')
+))
@@ -0,0 +1,267 @@
+"""Vectorized spatial analysis of room item layouts
+
+Positions are in metres with `y` up, as the scanner reports them, so the
+floor plane is (x, z). A room's `dimensions` give its `width` along x and
+`length` along z, measured from the origin. An item's position may carry
+its footprint as `width` and `depth`; otherwise DEFAULT_FOOTPRINT is used.
+
+Like the rest of the suggestion rules, this module has no database or
+Flask imports so it can run in the job process pool.
+"""
+import math
+import numpy as np
+
+DEFAULT_FOOTPRINT = 0.4  # metres, for items detected without a size
+DENSITY_CELL = 0.5  # metres per side of a density grid cell
+FLOOR_RESOLUTION = 0.1  # metres per side of a free-floor raster cell
+ZONE_RADIUS = 1.0  # items closer than this belong to the same zone
+CROWDED_DISTANCE = 0.3  # an item whose nearest neighbour is closer than this is crowded
+HOTSPOT_ITEMS = 4  # items in one density cell that make it a clutter hotspot
+
+# Upper bounds on array entries computed at once: rooms x items x items for distances,
+# rooms x cells for the free-floor raster
+PAIRWISE_BUDGET = 4_000_000
+RASTER_BUDGET = 8_000_000
+
+class RoomLayout:
+    """Floor-plane item coordinates and footprints of one room as NumPy arrays"""
+
+    def __init__(self, points, footprints, width=None, length=None):
+        self.points = np.asarray(points, dtype=float).reshape(-1, 2)
+        self.footprints = np.asarray(footprints, dtype=float).reshape(-1, 2)
+        if len(self.points):
+            half = self.footprints / 2
+            low = np.minimum((self.points - half).min(axis=0), 0.0)
+            high = (self.points + half).max(axis=0)
+        else:
+            low = high = np.zeros(2)
+        # Rooms without (or with undersized) dimensions are bounded by their items
+        self.origin = low
+        self.extent = np.maximum(high, [width or 0.0, length or 0.0]) - low
+
+    @classmethod
+    def from_items(cls, dimensions, items):
+        """Build a layout from decoded room dimensions and item dicts, skipping unplaced items"""
+        points = []
+        footprints = []
+        for item in items:
+            position = item.get('position') or {}
+            x = _number(position.get('x'))
+            z = _number(position.get('z'))
+            if x is None or z is None:
+                continue
+            points.append((x, z))
+            footprints.append((
+                _number(position.get('width')) or DEFAULT_FOOTPRINT,
+                _number(position.get('depth')) or DEFAULT_FOOTPRINT
+            ))
+        dimensions = dimensions or {}
+        return cls(points, footprints, _number(dimensions.get('width')), _number(dimensions.get('length')))
+
+    def __len__(self):
+        return len(self.points)
+
+    @property
+    def floor_area(self):
+        return float(self.extent[0] * self.extent[1])
+
+def _number(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+def _grid_shape(layout, cell):
+    return tuple(np.maximum(np.ceil(layout.extent / cell), 1).astype(int))
+
+def density_grid(layout, cell=DENSITY_CELL):
+    """Items per square metre in each `cell`-sized square of the floor, indexed [x, z]"""
+    nx, nz = _grid_shape(layout, cell)
+    counts, _, _ = np.histogram2d(
+        layout.points[:, 0], layout.points[:, 1], bins=(nx, nz),
+        range=((layout.origin[0], layout.origin[0] + nx * cell), (layout.origin[1], layout.origin[1] + nz * cell))
+    )
+    return counts / (cell * cell)
+
+def free_floor_areas(layouts, resolution=FLOOR_RESOLUTION):
+    """Floor area in square metres not covered by any item footprint, per layout
+
+    Footprints are rasterized with a 2-D difference array, so overlapping
+    items are not double counted and the cost does not depend on how large
+    the footprints are. Rooms are padded to a common grid and rasterized
+    together, in batches of at most RASTER_BUDGET cells.
+    """
+    shapes = np.array([_grid_shape(layout, resolution) for layout in layouts]).reshape(-1, 2)
+    free = (shapes[:, 0] * shapes[:, 1]).astype(float)
+    for chunk in _chunks((shapes + 1).prod(axis=1), RASTER_BUDGET):
+        chunk = [index for index in chunk if len(layouts[index])]
+        if not chunk:
+            continue
+        nx, nz = shapes[chunk].max(axis=0)
+        room_cells = (nx + 1) * (nz + 1)
+        sizes = [len(layouts[index]) for index in chunk]
+        points = np.concatenate([layouts[index].points for index in chunk])
+        half = np.concatenate([layouts[index].footprints for index in chunk]) / 2
+        origins = np.repeat([layouts[index].origin for index in chunk], sizes, axis=0)
+        limits = np.repeat(shapes[chunk], sizes, axis=0)
+        base = np.repeat(np.arange(len(chunk)) * room_cells, sizes)
+
+        low = np.clip(np.floor((points - half - origins) / resolution).astype(int), 0, limits)
+        high = np.clip(np.ceil((points + half - origins) / resolution).astype(int), 0, limits)
+        # +1 at each footprint's low corner and past its far corner, -1 past each of its edges
+        added = np.concatenate((base + low[:, 0] * (nz + 1) + low[:, 1], base + high[:, 0] * (nz + 1) + high[:, 1]))
+        removed = np.concatenate((base + high[:, 0] * (nz + 1) + low[:, 1], base + low[:, 0] * (nz + 1) + high[:, 1]))
+        total = len(chunk) * room_cells
+        cover = (np.bincount(added, minlength=total) - np.bincount(removed, minlength=total)).reshape(len(chunk), nx + 1, nz + 1)
+        # Past its own grid a room's counts cancel to zero, so the padding is never covered
+        covered = cover.cumsum(axis=1).cumsum(axis=2) > 0
+        free[chunk] -= covered.sum(axis=(1, 2))
+    # The raster rounds the floor up to whole cells
+    return np.minimum(free * resolution * resolution, [layout.floor_area for layout in layouts])
+
+def _pairwise(layouts):
+    """Nearest-neighbour distances and zone labels for rooms of similar size at once
+
+    Points are padded with NaN into a (rooms, items, 2) array; NaN distances
+    compare false, so padding never becomes anyone's neighbour.
+    """
+    size = max(len(layout) for layout in layouts)
+    points = np.full((len(layouts), size, 2), np.nan)
+    for index, layout in enumerate(layouts):
+        points[index, :len(layout)] = layout.points
+
+    # Squared distances as |a|^2 + |b|^2 - 2ab, which turns the pairwise step into a matmul
+    points -= np.nanmean(points, axis=1, keepdims=True)
+    norms = (points * points).sum(axis=2)
+    squared = norms[:, :, None] + norms[:, None, :] - 2 * np.matmul(points, points.transpose(0, 2, 1))
+    np.maximum(squared, 0, out=squared)
+    diagonal = np.arange(size)
+    squared[:, diagonal, diagonal] = np.inf
+    with np.errstate(invalid='ignore'):
+        nearest = np.sqrt(np.where(np.isnan(squared), np.inf, squared).min(axis=2))
+        adjacent = squared <= ZONE_RADIUS * ZONE_RADIUS
+    adjacent[:, diagonal, diagonal] = True
+
+    # Connected components by min-label propagation with pointer jumping
+    labels = np.broadcast_to(diagonal, (len(layouts), size)).copy()
+    while True:
+        updated = np.where(adjacent, labels[:, None, :], size).min(axis=2)
+        updated = np.take_along_axis(updated, updated, axis=1)
+        if np.array_equal(updated, labels):
+            break
+        labels = updated
+    return nearest, labels
+
+def _chunks(costs, budget):
+    """Group indices, cheapest first, so that padding each group to its costliest member fits `budget`"""
+    chunk = []
+    for index in np.argsort(costs, kind='stable'):
+        if chunk and (len(chunk) + 1) * costs[index] > budget:
+            yield chunk
+            chunk = []
+        chunk.append(int(index))
+    if chunk:
+        yield chunk
+
+def analyze_rooms(layouts):
+    """Compute layout metrics for many rooms in one call, returning one dict per layout
+
+    Density is counted for all rooms with a single bincount; the free-floor
+    raster, distances and zones are computed per batch of similarly sized
+    rooms, so the Python overhead does not grow with the number of rooms.
+    """
+    if not layouts:
+        return []
+    results = [{'item_count': len(layout), 'floor_area': round(layout.floor_area, 2)} for layout in layouts]
+
+    # Clutter hotspots: flatten every room's density grid into one array of cells
+    shapes = np.array([_grid_shape(layout, DENSITY_CELL) for layout in layouts])
+    offsets = np.concatenate(([0], np.cumsum(shapes[:, 0] * shapes[:, 1])))
+    counts_per_room = np.array([len(layout) for layout in layouts])
+    if counts_per_room.sum():
+        room_index = np.repeat(np.arange(len(layouts)), counts_per_room)
+        points = np.concatenate([layout.points for layout in layouts])
+        origins = np.concatenate([np.broadcast_to(layout.origin, (len(layout), 2)) for layout in layouts])
+        cells = np.floor((points - origins) / DENSITY_CELL).astype(int)
+        cells = np.clip(cells, 0, shapes[room_index] - 1)
+        flat = offsets[room_index] + cells[:, 0] * shapes[room_index, 1] + cells[:, 1]
+        counts = np.bincount(flat, minlength=offsets[-1])
+    else:
+        counts = np.zeros(offsets[-1], dtype=int)
+    max_items = np.maximum.reduceat(counts, offsets[:-1])
+    hotspots = np.add.reduceat(counts >= HOTSPOT_ITEMS, offsets[:-1])
+
+    free_areas = free_floor_areas(layouts)
+    for index, layout in enumerate(layouts):
+        free = float(free_areas[index])
+        results[index].update({
+            'free_floor_area': round(free, 2),
+            'free_floor_ratio': round(free / layout.floor_area, 3) if layout.floor_area else 1.0,
+            'max_density': float(max_items[index]) / (DENSITY_CELL * DENSITY_CELL),
+            'hotspots': int(hotspots[index]),
+            'mean_nearest_distance': None,
+            'crowded_items': 0,
+            'zones': 0,
+            'stray_items': 0
+        })
+
+    for chunk in _chunks(counts_per_room ** 2, PAIRWISE_BUDGET):
+        chunk = [index for index in chunk if len(layouts[index])]
+        if not chunk:
+            continue
+        nearest, labels = _pairwise([layouts[index] for index in chunk])
+        for row, index in enumerate(chunk):
+            size = len(layouts[index])
+            room_nearest = nearest[row, :size]
+            zone_sizes = np.bincount(labels[row, :size])
+            zone_sizes = zone_sizes[zone_sizes > 0]
+            finite = room_nearest[np.isfinite(room_nearest)]
+            results[index].update({
+                'mean_nearest_distance': round(float(finite.mean()), 3) if len(finite) else None,
+                'crowded_items': int((room_nearest < CROWDED_DISTANCE).sum()),
+                'zones': int(len(zone_sizes)),
+                'stray_items': int((zone_sizes == 1).sum()) if size > 1 else 0
+            })
+    return results
+
+def analyze_room(layout):
+    return analyze_rooms([layout])[0]
+
+def spatial_suggestions(analysis):
+    """Suggestions derived from one room's layout metrics"""
+    suggestions = []
+
+    if analysis['hotspots']:
+        suggestions.append({
+            'type': 'clutter',
+            'title': 'Clear the most cluttered spots',
+            'description': f"{analysis['hotspots']} area(s) of the room have {HOTSPOT_ITEMS} or more items packed together",
+            'priority': 1
+        })
+
+    if analysis['item_count'] and analysis['free_floor_ratio'] < 0.4:
+        suggestions.append({
+            'type': 'layout',
+            'title': 'Free up floor space',
+            'description': f"Only {analysis['free_floor_ratio']:.0%} of the floor is clear; move items onto walls or shelves",
+            'priority': 1 if analysis['free_floor_ratio'] < 0.25 else 2
+        })
+
+    if analysis['item_count'] >= 4 and analysis['crowded_items'] / analysis['item_count'] > 0.3:
+        suggestions.append({
+            'type': 'spacing',
+            'title': 'Give items more room',
+            'description': f"{analysis['crowded_items']} items sit within {CROWDED_DISTANCE:g} m of another item",
+            'priority': 2
+        })
+
+    if analysis['stray_items'] >= 3:
+        suggestions.append({
+            'type': 'zoning',
+            'title': 'Group stray items into zones',
+            'description': f"{analysis['stray_items']} items sit on their own; keeping related items together makes them easier to find",
+            'priority': 3
+        })
+
+    return suggestions
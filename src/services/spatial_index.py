@@ -0,0 +1,179 @@
+import heapq
+import itertools
+import json
+import math
+from src.models.user import db
+from src.models.room import Room, RoomItem
+from src.utils.cache import TTLCache
+
+INDEX_CELL_SIZE = 0.5  # metres per side of a grid cell
+
+def item_point(position):
+    """(x, y, z) of a decoded item position, or None if the item is not placed"""
+    try:
+        x, z = float(position['x']), float(position['z'])
+        y = float(position.get('y') or 0.0)
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return None
+    return (x, y, z) if all(map(math.isfinite, (x, y, z))) else None
+
+class GridIndex:
+    """Uniform 3-D grid over item positions supporting incremental updates
+
+    Each occupied cell holds the ids of the items inside it. Range queries
+    visit only the cells overlapping the query; k-nearest visits occupied
+    cells in order of their distance to the query point and stops once no
+    unvisited cell can hold a closer item.
+    """
+
+    def __init__(self, cell_size=INDEX_CELL_SIZE):
+        self.cell_size = cell_size
+        self._points = {}
+        self._cells = {}
+
+    def __len__(self):
+        return len(self._points)
+
+    def copy(self):
+        index = GridIndex(self.cell_size)
+        index._points = dict(self._points)
+        index._cells = {cell: set(ids) for cell, ids in self._cells.items()}
+        return index
+
+    def _cell(self, point):
+        return tuple(math.floor(coordinate / self.cell_size) for coordinate in point)
+
+    def insert(self, item_id, point):
+        self.remove(item_id)
+        if point is None:
+            return
+        self._points[item_id] = point
+        self._cells.setdefault(self._cell(point), set()).add(item_id)
+
+    def remove(self, item_id):
+        point = self._points.pop(item_id, None)
+        if point is not None:
+            cell = self._cell(point)
+            self._cells[cell].discard(item_id)
+            if not self._cells[cell]:
+                del self._cells[cell]
+
+    def _cells_between(self, low, high):
+        """Id sets of the occupied cells overlapping the box [low, high]; bounds may be infinite"""
+        if all(map(math.isfinite, (*low, *high))):
+            low_cell, high_cell = self._cell(low), self._cell(high)
+            if math.prod(h - l + 1 for l, h in zip(low_cell, high_cell)) <= len(self._cells):
+                ranges = (range(l, h + 1) for l, h in zip(low_cell, high_cell))
+                return [self._cells[cell] for cell in itertools.product(*ranges) if cell in self._cells]
+        # Sparse grid or open-ended box: cheaper to test the occupied cells than to enumerate the range
+        size = self.cell_size
+        return [
+            ids for cell, ids in self._cells.items()
+            if all(c * size <= h and (c + 1) * size >= l for c, l, h in zip(cell, low, high))
+        ]
+
+    def within_box(self, low, high):
+        """Ids of items inside the axis-aligned box [low, high], ordered by id"""
+        return sorted(
+            item_id
+            for ids in self._cells_between(low, high)
+            for item_id in ids
+            if all(l <= c <= h for c, l, h in zip(self._points[item_id], low, high))
+        )
+
+    def within_radius(self, center, radius):
+        """(id, distance) of items within `radius` of `center`, nearest first"""
+        low = tuple(c - radius for c in center)
+        high = tuple(c + radius for c in center)
+        matches = []
+        for ids in self._cells_between(low, high):
+            for item_id in ids:
+                distance = math.dist(center, self._points[item_id])
+                if distance <= radius:
+                    matches.append((item_id, distance))
+        return sorted(matches, key=lambda match: (match[1], match[0]))
+
+    def _cell_distance(self, point, cell):
+        """Lower bound on the distance from `point` to anything in `cell`"""
+        gaps = []
+        for coordinate, index in zip(point, cell):
+            low = index * self.cell_size
+            gaps.append(max(low - coordinate, 0.0, coordinate - low - self.cell_size))
+        return math.hypot(*gaps)
+
+    def nearest(self, point, k):
+        """(id, distance) of the `k` items closest to `point`, nearest first"""
+        cells = [(self._cell_distance(point, cell), cell) for cell in self._cells]
+        heapq.heapify(cells)
+        best = []  # max-heap of (-distance, -id) holding the k best so far
+        while cells:
+            bound, cell = heapq.heappop(cells)
+            if len(best) == k and bound > -best[0][0]:
+                break
+            for item_id in self._cells[cell]:
+                candidate = (-math.dist(point, self._points[item_id]), -item_id)
+                if len(best) < k:
+                    heapq.heappush(best, candidate)
+                elif candidate > best[0]:
+                    heapq.heapreplace(best, candidate)
+        return [(-negative_id, -negative_distance) for negative_distance, negative_id in sorted(best, reverse=True)]
+
+def item_positions_query(room_id):
+    """(id, position) of every item in the room, the rows a grid is built from"""
+    return db.session.query(RoomItem.id, RoomItem.position).filter_by(room_id=room_id)
+
+class RoomIndexCache:
+    """Per-process cache of room item grids, validated against `Room.updated_at`
+
+    Every item change bumps the room's `updated_at`, so a query checks the
+    room's current version with one primary-key lookup and rebuilds the grid
+    only when it moved. The process that made a change applies it to its
+    cached grid directly with `apply()`.
+    """
+
+    def __init__(self, maxsize=512, ttl=900):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.builds = 0
+
+    def get(self, room_id):
+        """Return the room's grid, or None if the room does not exist"""
+        version = db.session.query(Room.updated_at).filter_by(id=room_id).scalar()
+        if version is None:
+            self._cache.invalidate(room_id)
+            return None
+        entry = self._cache.get(room_id)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+
+        index = GridIndex()
+        for row in item_positions_query(room_id):
+            index.insert(row.id, item_point(json.loads(row.position)) if row.position else None)
+        self.builds += 1
+        self._cache.set(room_id, (version, index))
+        return index
+
+    def apply(self, room_id, previous_version, version, positions, deleted_ids=()):
+        """Apply committed item changes to a cached grid and move it to `version`
+
+        `positions` maps item id -> encoded position JSON for added and updated
+        items. A grid cached at any version other than `previous_version` has
+        missed some other change, so it is dropped instead.
+        """
+        entry = self._cache.get(room_id)
+        if entry is None:
+            return
+        if entry[0] != previous_version:
+            self._cache.invalidate(room_id)
+            return
+        # Update a copy, so requests already querying the old grid are not disturbed
+        index = entry[1].copy()
+        for item_id in deleted_ids:
+            index.remove(item_id)
+        for item_id, position in positions.items():
+            index.insert(item_id, item_point(json.loads(position)) if position else None)
+        self._cache.set(room_id, (version, index))
+
+    def stats(self):
+        return dict(self._cache.stats(), builds=self.builds)
+
+room_indexes = RoomIndexCache()
@@ -0,0 +1,155 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+from flask import Response, current_app, request, send_file
+
+logger = logging.getLogger(__name__)
+
+# Content-hashed build output never changes under the same name, so clients may keep it for good
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# index.html names the current hashed assets, so it must be revalidated on every load
+INDEX_CACHE_CONTROL = 'no-cache'
+ASSET_CACHE_CONTROL = 'public, max-age=3600'
+
+# Vite puts every hashed file under assets/; other bundlers add a hex hash to the name, e.g. main.3f2a9c1b.js
+IMMUTABLE_DIRS = ('assets/',)
+HASHED_NAME = re.compile(r'[.-][0-9a-f]{8,}\.[A-Za-z0-9]+$')
+
+COMPRESSIBLE_TYPES = (
+    'application/javascript', 'application/json', 'application/manifest+json', 'application/wasm',
+    'application/xml', 'image/svg+xml', 'image/vnd.microsoft.icon', 'image/x-icon', 'text/'
+)
+COMPRESS_MIN_SIZE = 1024  # bytes; smaller files gain less than the gzip header costs
+
+class StaticAsset:
+    """One file of the static folder: its headers, strong ETag and, if small enough, its bytes"""
+
+    def __init__(self, name, path, data=None, size=None, digest=None):
+        self.name = name
+        self.path = path
+        self.mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        self.size = len(data) if data is not None else size
+        self.etag = digest
+        self.data = data
+        self.gzipped = None
+        if name == 'index.html':
+            self.cache_control = INDEX_CACHE_CONTROL
+        elif name.startswith(IMMUTABLE_DIRS) or HASHED_NAME.search(name):
+            self.cache_control = IMMUTABLE_CACHE_CONTROL
+        else:
+            self.cache_control = ASSET_CACHE_CONTROL
+
+    @property
+    def compressible(self):
+        return self.mimetype.startswith(COMPRESSIBLE_TYPES) and self.size >= COMPRESS_MIN_SIZE
+
+    def compress(self, level=9):
+        compressed = gzip.compress(self.data, compresslevel=level, mtime=0)
+        # Keep the variant only if it is worth the client's decompression
+        if len(compressed) < self.size * 0.9:
+            self.gzipped = compressed
+
+class StaticAssets:
+    """Manifest of the static folder, built once, that serves files and the SPA fallback
+
+    At startup every file is hashed for a strong ETag. Files up to
+    `max_file_size` are kept in memory, smallest first, until
+    `memory_budget` bytes are held, together with a precompressed gzip
+    variant; index.html is always held. Requests are answered from the
+    manifest: in-memory files never touch the filesystem and unknown paths
+    get the cached index.html. Files changed after startup are picked up
+    by `reload()` (or a restart); with the app in debug mode the manifest
+    is rebuilt on every request.
+    """
+
+    def __init__(self, max_file_size=512 * 1024, memory_budget=64 * 1024 * 1024):
+        self.max_file_size = max_file_size
+        self.memory_budget = memory_budget
+        self.root = None
+        self.assets = {}
+
+    def init_app(self, app):
+        self.root = app.static_folder
+        self.reload()
+
+    def reload(self):
+        """Rebuild the manifest from the static folder"""
+        assets = {}
+        files = []
+        if self.root and os.path.isdir(self.root):
+            for directory, _, names in os.walk(self.root):
+                for filename in names:
+                    path = os.path.join(directory, filename)
+                    name = os.path.relpath(path, self.root).replace(os.sep, '/')
+                    files.append((os.path.getsize(path), name, path))
+
+        held = 0
+        for size, name, path in sorted(files):
+            if name == 'index.html' or (size <= self.max_file_size and held + size <= self.memory_budget):
+                with open(path, 'rb') as f:
+                    data = f.read()
+                asset = StaticAsset(name, path, data=data, digest=_strong_etag(hashlib.sha256(data)))
+                if asset.compressible:
+                    asset.compress()
+                held += asset.size + len(asset.gzipped or b'')
+            else:
+                digest = hashlib.sha256()
+                with open(path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b''):
+                        digest.update(chunk)
+                asset = StaticAsset(name, path, size=size, digest=_strong_etag(digest))
+            assets[name] = asset
+
+        self.assets = assets
+        logger.info('Static manifest: %d files, %d bytes in memory', len(assets), held)
+        return self.assets
+
+    def serve(self, path):
+        """Response for a GET of `path` below the static root, falling back to index.html"""
+        if current_app.debug:
+            self.reload()
+        asset = self.assets.get(path) if path else None
+        if asset is None:
+            asset = self.assets.get('index.html')
+            if asset is None:
+                return "index.html not found", 404
+
+        if asset.data is None:
+            # Too large to hold: stream it from disk, still with the manifest's ETag and caching
+            response = send_file(asset.path, mimetype=asset.mimetype, etag=asset.etag.strip('"'), conditional=True)
+            response.headers['Cache-Control'] = asset.cache_control
+            return response
+
+        data, etag = asset.data, asset.etag
+        headers = {'Cache-Control': asset.cache_control}
+        if asset.gzipped is not None:
+            headers['Vary'] = 'Accept-Encoding'
+            if 'gzip' in request.accept_encodings:
+                # The encoded bytes differ, so they get their own strong ETag
+                data, etag = asset.gzipped, etag[:-1] + '-gzip"'
+                headers['Content-Encoding'] = 'gzip'
+        headers['ETag'] = etag
+
+        if request.if_none_match and request.if_none_match.contains_weak(etag.strip('"')):
+            return Response(status=304, headers=headers)
+        return Response(data, mimetype=asset.mimetype, headers=headers)
+
+    def stats(self):
+        in_memory = [asset for asset in self.assets.values() if asset.data is not None]
+        return {
+            'files': len(self.assets),
+            'in_memory': len(in_memory),
+            'memory_bytes': sum(asset.size + len(asset.gzipped or b'') for asset in in_memory),
+            'gzipped': sum(1 for asset in in_memory if asset.gzipped is not None)
+        }
+
+def _strong_etag(digest):
+    return f'"{digest.hexdigest()[:32]}"'
+
+static_assets = StaticAssets(
+    max_file_size=int(os.environ.get('STATIC_MAX_FILE_BYTES', 512 * 1024)),
+    memory_budget=int(os.environ.get('STATIC_MEMORY_BUDGET_BYTES', 64 * 1024 * 1024))
+)
@@ -0,0 +1,118 @@
+import json
+from sqlalchemy import delete, insert
+from sqlalchemy.ext.horizontal_shard import set_shard_id
+from src.models.user import db
+from src.models.room import Room, RoomItem, OrganizationSuggestion
+from src.services.jobs import job_queue
+from src.services.sharding import shard_map
+from src.services.recommendations import SUGGESTION_CATEGORY_RULES, recommendation_index
+from src.services.suggestions import suggest_for_rooms
+
+REGENERATE_CHUNK_SIZE = 1000
+ROOMS_PER_TASK = 100
+
+def load_rooms(room_ids):
+    """Return (room_id, items, dimensions) triples in the shape the suggestion rules expect"""
+    items = {room_id: [] for room_id in room_ids}
+    rows = db.session.query(RoomItem.room_id, RoomItem.name, RoomItem.category, RoomItem.position).filter(
+        RoomItem.room_id.in_(room_ids)
+    ).order_by(RoomItem.id)
+    for row in rows:
+        items[row.room_id].append({
+            'name': row.name,
+            'category': row.category,
+            'position': json.loads(row.position) if row.position else None
+        })
+    dimensions = {
+        row.id: json.loads(row.dimensions) if row.dimensions else None
+        for row in db.session.query(Room.id, Room.dimensions).filter(Room.id.in_(room_ids))
+    }
+    return [(room_id, items[room_id], dimensions.get(room_id)) for room_id in room_ids]
+
+def implemented_suggestions_query(room_ids):
+    """(room_id, suggestion_type) of the rooms' implemented suggestions"""
+    return db.session.query(OrganizationSuggestion.room_id, OrganizationSuggestion.suggestion_type).filter(
+        OrganizationSuggestion.room_id.in_(room_ids),
+        OrganizationSuggestion.is_implemented == True
+    )
+
+def replace_suggestions(results):
+    """Swap the open suggestions of each room for freshly generated ones
+
+    Implemented suggestions are kept, and no new suggestion of an
+    already-implemented type is added for that room.
+    """
+    room_ids = [room_id for room_id, _ in results]
+    implemented = set(implemented_suggestions_query(room_ids))
+    db.session.execute(delete(OrganizationSuggestion).where(
+        OrganizationSuggestion.room_id.in_(room_ids),
+        OrganizationSuggestion.is_implemented == False
+    ))
+
+    rows = [
+        {
+            'room_id': room_id,
+            'suggestion_type': suggestion['type'],
+            'title': suggestion['title'],
+            'description': suggestion['description'],
+            'priority': suggestion['priority']
+        }
+        for room_id, suggestions in results
+        for suggestion in suggestions
+        if (room_id, suggestion['type']) not in implemented
+    ]
+    if rows:
+        db.session.execute(insert(OrganizationSuggestion), rows)
+    return len(rows)
+
+@job_queue.handler('room_suggestions')
+def generate_room_suggestions(job, room_id):
+    """Regenerate one room's suggestions and resolve its product recommendations"""
+    if not db.session.query(Room.id).filter_by(id=room_id).first():
+        return {'room_id': room_id, 'suggestions': 0, 'recommended_product_ids': []}
+
+    created = replace_suggestions(suggest_for_rooms(load_rooms([room_id])))
+    suggestions = OrganizationSuggestion.query.filter_by(room_id=room_id).all()
+    recommendations = recommendation_index.recommend(suggestions)
+    return {
+        'room_id': room_id,
+        'suggestions': created,
+        'recommended_product_ids': [recommendation['product_id'] for recommendation in recommendations]
+    }
+
+@job_queue.handler('regenerate_suggestions')
+def regenerate_all_suggestions(job, user_id=None):
+    """Regenerate suggestions for every room (or one user's rooms) across a process pool
+
+    Rooms are read in keyset-ordered chunks, one room database (see
+    src.services.sharding) after another; each chunk's rules run in the
+    process pool in `ROOMS_PER_TASK` slices and its suggestions are replaced
+    and committed before the next chunk is read.
+    """
+    queries = []
+    for location in shard_map.locations():
+        rooms = db.session.query(Room.id).options(set_shard_id(location))
+        if user_id is not None:
+            rooms = rooms.filter(Room.user_id == user_id)
+        queries.append(rooms)
+    total = sum(rooms.count() for rooms in queries)
+    pool = job_queue.process_pool()
+
+    done = created = 0
+    for rooms in queries:
+        last_id = 0
+        while True:
+            room_ids = [row.id for row in rooms.filter(Room.id > last_id).order_by(Room.id).limit(REGENERATE_CHUNK_SIZE)]
+            if not room_ids:
+                break
+            rooms_data = load_rooms(room_ids)
+            tasks = [rooms_data[start:start + ROOMS_PER_TASK] for start in range(0, len(rooms_data), ROOMS_PER_TASK)]
+            results = [result for batch in pool.map(suggest_for_rooms, tasks) for result in batch]
+            created += replace_suggestions(results)
+            done += len(room_ids)
+            last_id = room_ids[-1]
+            job_queue.progress(job, rooms=done, total=total, suggestions=created)
+
+    # Warm the recommendation index for every category the new suggestions can point at
+    recommendation_index.ranked({rule[0] for rule in SUGGESTION_CATEGORY_RULES.values()})
+    return {'rooms': done, 'total': total, 'suggestions': created}
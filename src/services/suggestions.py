@@ -0,0 +1,69 @@
+"""Organization suggestion rules
+
+Pure functions with no database or Flask imports, so the bulk regeneration
+job can run them in a pool of worker processes.
+"""
+from src.services.spatial import RoomLayout, analyze_rooms, spatial_suggestions
+
+def generate_organization_suggestions(room_id, items):
+    """Generate AI-powered organization suggestions based on room items"""
+    suggestions = []
+    
+    # Analyze items by category
+    categories = {}
+    for item in items:
+        category = item.get('category', 'unknown')
+        if category not in categories:
+            categories[category] = []
+        categories[category].append(item)
+    
+    # Storage suggestions
+    if len(items) > 3:
+        suggestions.append({
+            'type': 'storage',
+            'title': 'Add storage bins for loose items',
+            'description': 'This will help reduce clutter and make items easier to find',
+            'priority': 1
+        })
+    
+    # Furniture suggestions
+    if 'storage' not in categories or len(categories.get('storage', [])) < 2:
+        suggestions.append({
+            'type': 'furniture',
+            'title': 'Consider a bookshelf for better organization',
+            'description': 'Vertical storage maximizes space efficiency',
+            'priority': 2
+        })
+    
+    # Organization suggestions
+    if 'furniture' in categories and len(categories['furniture']) > 2:
+        suggestions.append({
+            'type': 'organization',
+            'title': 'Use drawer organizers for small items',
+            'description': 'Keep frequently used items easily accessible',
+            'priority': 2
+        })
+    
+    # Lighting suggestions
+    if 'lighting' not in categories:
+        suggestions.append({
+            'type': 'lighting',
+            'title': 'Improve lighting for better visibility',
+            'description': 'Good lighting makes organization and daily tasks easier',
+            'priority': 3
+        })
+    
+    return suggestions
+
+
+def suggest_for_rooms(rooms):
+    """Run the rules for a batch of (room_id, items, dimensions) triples
+
+    Category rules run per room; the layout analysis for the whole batch
+    runs in one vectorized call. Returns (room_id, suggestions) pairs.
+    """
+    analyses = analyze_rooms([RoomLayout.from_items(dimensions, items) for _, items, dimensions in rooms])
+    return [
+        (room_id, generate_organization_suggestions(room_id, items) + spatial_suggestions(analysis))
+        for (room_id, items, _), analysis in zip(rooms, analyses)
+    ]
@@ -0,0 +1,45 @@
+import hashlib
+from datetime import timezone
+from flask import Response, request
+
+# Rooms are per-user and change often: clients may store them but must revalidate
+ROOM_CACHE_CONTROL = 'private, no-cache'
+# The catalog only changes on imports, so shared caches may serve it briefly
+CATALOG_CACHE_CONTROL = 'public, max-age=60, stale-while-revalidate=300'
+
+def make_etag(*parts):
+    """Weak ETag from version parts plus the query string, which selects the representation"""
+    digest = hashlib.sha1(repr((parts, request.query_string)).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+def _utc(moment):
+    if moment is None:
+        return None
+    moment = moment.replace(microsecond=0)
+    return moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment
+
+def not_modified(etag, last_modified=None, cache_control=None):
+    """Return a 304 response if the request's validators still match, otherwise None
+
+    Call this before loading or serializing the resource. If-None-Match takes
+    precedence over If-Modified-Since, as RFC 9110 requires.
+    """
+    if request.if_none_match:
+        matched = request.if_none_match.contains_weak(etag.removeprefix('W/').strip('"'))
+    elif request.if_modified_since and last_modified is not None:
+        matched = _utc(last_modified) <= request.if_modified_since
+    else:
+        matched = False
+
+    if not matched:
+        return None
+    response = Response(status=304)
+    return with_validators(response, etag, last_modified, cache_control)
+
+def with_validators(response, etag, last_modified=None, cache_control=None):
+    response.headers['ETag'] = etag
+    if last_modified is not None:
+        response.last_modified = _utc(last_modified)
+    if cache_control:
+        response.headers['Cache-Control'] = cache_control
+    return response
@@ -0,0 +1,70 @@
+from sqlalchemy import inspect
+from sqlalchemy.orm import defer, load_only
+
+def project(fields, getters):
+    """Build a dict from {name: getter}, only calling getters for the requested fields"""
+    if fields is None:
+        return {name: getter() for name, getter in getters.items()}
+    return {name: getter() for name, getter in getters.items() if name in fields}
+
+class FieldSet:
+    """Sparse fieldset parsed from `?fields=` / `?include=`
+
+    `only=None` selects every field except `exclude`. Dotted names such as
+    `items.name` select fields of a nested serializer.
+    """
+
+    def __init__(self, only=None, exclude=()):
+        self.only = None if only is None else set(only)
+        self.exclude = set(exclude)
+        self._roots = None if only is None else {name.split('.', 1)[0] for name in self.only}
+
+    @classmethod
+    def from_request(cls, args, deferred=()):
+        """Parse request args; `deferred` fields are left out unless explicitly asked for"""
+        include = _split(args.get('include'))
+        fields = _split(args.get('fields'))
+        if fields:
+            return cls(only=fields | include)
+        return cls(exclude=set(deferred) - include)
+
+    def __contains__(self, name):
+        if name in self.exclude:
+            return False
+        return self._roots is None or name in self._roots
+
+    def apply(self, data):
+        """Project an already-serialized dict, e.g. one taken from a cache"""
+        return {name: value for name, value in data.items() if name in self}
+
+    def nested(self, name):
+        """Return the fieldset for a nested serializer, e.g. `items` of a room"""
+        if self.only is None:
+            return FieldSet()
+        prefix = name + '.'
+        sub = {field[len(prefix):] for field in self.only if field.startswith(prefix)}
+        return FieldSet(only=sub) if sub else FieldSet()
+
+    def load_options(self, model):
+        """Loader options that keep unrequested columns out of the SELECT
+
+        A model may map a field onto extra backing columns with a
+        `field_columns` dict, e.g. {'scan_data': ('scan_ref',)}.
+        """
+        mapper = inspect(model)
+        if self.only is None:
+            deferred = [getattr(model, attr.key) for attr in mapper.column_attrs if attr.key in self.exclude]
+            return [defer(*deferred)] if deferred else []
+        backing = {
+            column for field, columns in getattr(model, 'field_columns', {}).items()
+            if field in self for column in columns
+        }
+        selected = [
+            getattr(model, attr.key) for attr in mapper.column_attrs
+            if attr.key in self or attr.key in backing
+            or any(column.primary_key or column.foreign_keys for column in attr.columns)
+        ]
+        return [load_only(*selected)]
+
+def _split(value):
+    return {part.strip() for part in value.split(',') if part.strip()} if value else set()
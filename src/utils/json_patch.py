@@ -0,0 +1,117 @@
+import copy
+
+def merge_patch(target, patch):
+    """Apply an RFC 7386 JSON merge patch and return the result"""
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = merge_patch(result.get(key), value)
+    return result
+
+def apply_json_patch(document, operations):
+    """Apply an RFC 6902 JSON Patch and return the result
+
+    Raises ValueError when an operation is malformed, a path does not exist
+    or a `test` operation fails; the input document is never modified.
+    """
+    if not isinstance(operations, list):
+        raise ValueError('JSON Patch must be a list of operations')
+    document = copy.deepcopy(document)
+    for operation in operations:
+        op = operation.get('op')
+        path = operation.get('path')
+        if path is None:
+            raise ValueError(f'JSON Patch operation is missing a path: {operation}')
+        if op == 'add':
+            document = _add(document, path, copy.deepcopy(_value(operation)))
+        elif op == 'remove':
+            document, _ = _remove(document, path)
+        elif op == 'replace':
+            document, _ = _remove(document, path)
+            document = _add(document, path, copy.deepcopy(_value(operation)))
+        elif op == 'move':
+            document, value = _remove(document, _from(operation))
+            document = _add(document, path, value)
+        elif op == 'copy':
+            document = _add(document, path, copy.deepcopy(_get(document, _from(operation))))
+        elif op == 'test':
+            if _get(document, path) != _value(operation):
+                raise ValueError(f'JSON Patch test failed at {path}')
+        else:
+            raise ValueError(f'Unsupported JSON Patch operation: {op}')
+    return document
+
+def _value(operation):
+    if 'value' not in operation:
+        raise ValueError(f"JSON Patch operation is missing 'value': {operation}")
+    return operation['value']
+
+def _from(operation):
+    if 'from' not in operation:
+        raise ValueError(f"JSON Patch operation is missing 'from': {operation}")
+    return operation['from']
+
+def _tokens(path):
+    if path == '':
+        return []
+    if not path.startswith('/'):
+        raise ValueError(f'Invalid JSON Pointer: {path}')
+    return [token.replace('~1', '/').replace('~0', '~') for token in path[1:].split('/')]
+
+def _index(container, token, allow_end=False):
+    if allow_end and token == '-':
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token.startswith('0')):
+        raise ValueError(f'Invalid array index: {token}')
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise ValueError(f'Array index out of range: {token}')
+    return index
+
+def _parent(document, path):
+    tokens = _tokens(path)
+    if not tokens:
+        return None, None
+    container = document
+    for token in tokens[:-1]:
+        container = _child(container, token)
+    return container, tokens[-1]
+
+def _child(container, token):
+    if isinstance(container, list):
+        return container[_index(container, token)]
+    if isinstance(container, dict) and token in container:
+        return container[token]
+    raise ValueError(f'Path segment not found: {token}')
+
+def _get(document, path):
+    value = document
+    for token in _tokens(path):
+        value = _child(value, token)
+    return value
+
+def _add(document, path, value):
+    container, token = _parent(document, path)
+    if token is None:
+        return value
+    if isinstance(container, list):
+        container.insert(_index(container, token, allow_end=True), value)
+    elif isinstance(container, dict):
+        container[token] = value
+    else:
+        raise ValueError(f'Cannot add to a scalar at {path}')
+    return document
+
+def _remove(document, path):
+    container, token = _parent(document, path)
+    if token is None:
+        return None, document
+    if isinstance(container, list):
+        return document, container.pop(_index(container, token))
+    if isinstance(container, dict) and token in container:
+        return document, container.pop(token)
+    raise ValueError(f'Path not found: {path}')
@@ -0,0 +1,9 @@
+from flask.json.provider import DefaultJSONProvider
+from src.utils.raw_json import dumps_with_raw
+
+class RawJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that writes RawJSON values straight into the response body"""
+
+    def dumps(self, obj, **kwargs):
+        default = kwargs.pop('default', self.default)
+        return dumps_with_raw(obj, dumps=super().dumps, default=default, **kwargs)
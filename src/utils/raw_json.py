@@ -0,0 +1,47 @@
+import json
+import re
+import uuid
+
+class RawJSON:
+    """Already-encoded JSON text that is spliced into a response without re-parsing"""
+
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+    def loads(self):
+        return json.loads(self.text)
+
+    def __repr__(self):
+        return f'<RawJSON {len(self.text)} chars>'
+
+def encode_json(value):
+    """Encode a value for storage in a JSON Text column (compact, validated once here)"""
+    return json.dumps(value, separators=(',', ':'))
+
+def raw_or_none(text):
+    return RawJSON(text) if text else None
+
+def dumps_with_raw(obj, dumps=json.dumps, default=None, **kwargs):
+    """Serialize `obj` with `dumps`, splicing any RawJSON values in verbatim
+
+    Each RawJSON is first encoded as a unique placeholder string, then the
+    placeholders are replaced with the stored text, so large payloads are
+    only copied rather than decoded and re-encoded.
+    """
+    fragments = []
+    token = uuid.uuid4().hex
+
+    def splice_default(o):
+        if isinstance(o, RawJSON):
+            fragments.append(o.text)
+            return f'{token}:{len(fragments) - 1}'
+        if default is None:
+            raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+        return default(o)
+
+    encoded = dumps(obj, default=splice_default, **kwargs)
+    if not fragments:
+        return encoded
+    return re.sub(f'"{token}:(\\d+)"', lambda m: fragments[int(m.group(1))], encoded)
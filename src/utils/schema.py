@@ -0,0 +1,33 @@
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateColumn
+
+def upgrade_schema(connection, metadata, tables=None):
+    """Bring an existing database up to `metadata` (or just `tables`) without dropping anything
+
+    Creates missing tables, adds missing (nullable) columns with ALTER TABLE and
+    creates missing indexes. Returns a list of the changes made.
+    """
+    changes = []
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+
+    for table in metadata.sorted_tables if tables is None else tables:
+        if table.name not in existing_tables:
+            table.create(connection)
+            changes.append(f'created table {table.name}')
+            continue
+
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns:
+                ddl = CreateColumn(column).compile(dialect=connection.dialect)
+                connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {ddl}')
+                changes.append(f'added column {table.name}.{column.name}')
+
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(connection)
+                changes.append(f'created index {index.name}')
+
+    return changes
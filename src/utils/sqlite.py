@@ -0,0 +1,77 @@
+import os
+import re
+import sqlite3
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+
+# Applied to every new SQLite connection; override one with SQLITE_<NAME>, e.g. SQLITE_CACHE_SIZE
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',  # readers and the writer no longer block each other
+    'synchronous': 'NORMAL',  # with WAL, only checkpoints fsync; a crash can lose the last commits but not corrupt
+    'busy_timeout': 5000,  # ms to wait for the write lock instead of failing with "database is locked"
+    'mmap_size': 268435456,  # read up to 256 MB of the file through the page cache of the OS
+    'cache_size': -65536,  # 64 MB page cache per connection (negative values are KiB)
+    'temp_store': 'MEMORY',
+}
+
+def sqlite_pragmas():
+    return {name: os.environ.get(f'SQLITE_{name.upper()}', value) for name, value in SQLITE_PRAGMAS.items()}
+
+def engine_options():
+    """SQLALCHEMY_ENGINE_OPTIONS for one gunicorn worker process
+
+    Each worker has its own pool; keep DB_POOL_SIZE + DB_MAX_OVERFLOW at or
+    above the worker's thread count so requests never wait for a connection.
+    """
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        # Pooled connections move between threads; each is still used by one thread at a time
+        'connect_args': {'check_same_thread': False, 'timeout': 5},
+    }
+
+@event.listens_for(Engine, 'connect')
+def _apply_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in sqlite_pragmas().items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+@event.listens_for(Pool, 'connect')
+def _remember_pid(dbapi_connection, connection_record):
+    connection_record.info['pid'] = os.getpid()
+
+@event.listens_for(Pool, 'checkout')
+def _reject_inherited_connections(dbapi_connection, connection_record, connection_proxy):
+    # A connection opened before gunicorn forked belongs to the parent; make the pool open a new one
+    pid = os.getpid()
+    if connection_record.info.get('pid') != pid:
+        connection_record.dbapi_connection = connection_proxy.dbapi_connection = None
+        raise exc.DisconnectionError(
+            f"Connection record belongs to pid {connection_record.info.get('pid')}, checked out in pid {pid}"
+        )
+
+def explain_query_plan(connection, statement):
+    """Return the detail lines of SQLite's EXPLAIN QUERY PLAN for a SQLAlchemy statement"""
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={'render_postcompile': True})
+    params = compiled.construct_params()
+    positional = tuple(params[name] for name in compiled.positiontup) if compiled.positiontup else ()
+    rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled.string}', positional).fetchall()
+    return [row[-1] for row in rows]
+
+def full_scans(plan, tables):
+    """Plan lines that read a whole table or index of `tables` rather than searching it
+
+    Scans of subqueries and CTEs are not reported; their inner plan lines are.
+    Virtual tables report every lookup as a SCAN; one whose index string is
+    not empty (e.g. `INDEX 0:M4` for an FTS5 MATCH) is searching its index.
+    """
+    return [
+        line for line in plan
+        if line.startswith('SCAN ') and line.split()[1] in tables
+        and not re.search(r' VIRTUAL TABLE INDEX \d+:\S', line)
+    ]
@@ -0,0 +1,26 @@
+import io
+
+class _ReadOnlyStream(io.RawIOBase):
+    """io adapter for objects that only implement read(size)"""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        chunk = self._stream.read(len(target))
+        target[:len(chunk)] = chunk
+        return len(chunk)
+
+def binary_reader(stream):
+    """Return `stream` as a buffered binary file object that io.TextIOWrapper accepts
+
+    Werkzeug passes the WSGI input through unwrapped when the server marks it
+    terminated, and gunicorn's input object has read() but none of the io
+    methods such as readable().
+    """
+    if isinstance(stream, io.IOBase):
+        return stream
+    return io.BufferedReader(_ReadOnlyStream(stream))
@@ -0,0 +1,42 @@
+import os
+import tempfile
+import pytest
+
+# The service singletons read their file locations when first imported, so point them away from src/database first
+_state_dir = tempfile.mkdtemp(prefix='roomscan-tests-')
+for name, filename in (
+    ('CATALOG_VERSION_PATH', 'catalog.version'),
+    ('SHARD_MAP_VERSION_PATH', 'shard_map.version'),
+    ('CLICK_SPOOL_PATH', 'click_spool.ndjson'),
+    ('SCAN_BLOB_DIR', 'blobs'),
+):
+    os.environ.setdefault(name, os.path.join(_state_dir, filename))
+
+from src.main import create_app
+from src.models.user import db
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Build an app on a fresh database in `tmp_path` and run `flask bootstrap` on it"""
+    def make(shards=0, **config):
+        app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'app.db'}",
+            'ROOM_SHARDS': [f"sqlite:///{tmp_path / f'rooms-{index}.db'}" for index in range(shards)],
+            **config
+        })
+        result = app.test_cli_runner().invoke(args=['bootstrap'])
+        assert result.exit_code == 0, result.output
+        return app
+    return make
+
+@pytest.fixture
+def app(make_app):
+    app = make_app()
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
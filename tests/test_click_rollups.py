@@ -0,0 +1,135 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import func, insert
+from src.models.user import db
+from src.models.product import Product, AffiliateClick, ClickRollup
+from src.services.click_rollups import backfill_click_rollups, click_analytics, click_counts, roll_up_clicks
+
+NOW = datetime.utcnow()
+
+@pytest.fixture
+def products(app):
+    products = [
+        Product(name='Shelf', merchant='acme', affiliate_link='https://example.com/1'),
+        Product(name='Basket', merchant='acme', affiliate_link='https://example.com/2'),
+        Product(name='Hook', merchant='hooks', affiliate_link='https://example.com/3'),
+    ]
+    db.session.add_all(products)
+    db.session.commit()
+    return [product.id for product in products]
+
+def _click(product_id, age):
+    return {'product_id': product_id, 'timestamp': NOW - age}
+
+def _insert(clicks):
+    db.session.execute(insert(AffiliateClick), clicks)
+    db.session.commit()
+
+def _history(products):
+    """Clicks spread over the last few days, on hour and day boundaries and in the current hour"""
+    shelf, basket, hook = products
+    ages = [timedelta(minutes=5), timedelta(minutes=70), timedelta(hours=5, minutes=1), timedelta(days=1),
+            timedelta(days=2, hours=3), timedelta(days=3, minutes=17), timedelta(days=6), timedelta(days=40)]
+    clicks = [_click(shelf, age) for age in ages]
+    clicks += [_click(basket, age) for age in ages[::2]]
+    clicks += [_click(hook, age + timedelta(seconds=30)) for age in ages[1::3]]
+    return clicks
+
+def _summed(start):
+    counts = click_counts(start)
+    return dict(db.session.query(counts.c.product_id, func.sum(counts.c.click_count)).group_by(counts.c.product_id))
+
+def _raw(start):
+    return dict(db.session.query(AffiliateClick.product_id, func.count()).filter(
+        AffiliateClick.timestamp >= start
+    ).group_by(AffiliateClick.product_id))
+
+def _rollups(granularity):
+    return {
+        (row.bucket_start, row.product_id): row.click_count
+        for row in ClickRollup.query.filter_by(granularity=granularity)
+    }
+
+def test_roll_up_buckets_clicks_by_hour_and_day(products):
+    shelf, basket, _ = products
+    hour = (NOW - timedelta(days=1)).replace(hour=10, minute=0, second=0, microsecond=0)
+    _insert([
+        {'product_id': shelf, 'timestamp': hour + timedelta(minutes=1)},
+        {'product_id': shelf, 'timestamp': hour + timedelta(minutes=59)},
+        {'product_id': shelf, 'timestamp': hour + timedelta(minutes=60)},
+        {'product_id': basket, 'timestamp': hour},
+    ])
+
+    assert roll_up_clicks() == 4
+    db.session.commit()
+
+    day = hour.replace(hour=0)
+    assert _rollups('hour') == {(hour, shelf): 2, (hour + timedelta(hours=1), shelf): 1, (hour, basket): 1}
+    assert _rollups('day') == {(day, shelf): 3, (day, basket): 1}
+
+def test_roll_up_only_adds_clicks_past_the_watermark(products):
+    shelf = products[0]
+    _insert([_click(shelf, timedelta(hours=2))] * 3)
+    assert roll_up_clicks() == 3
+    db.session.commit()
+
+    assert roll_up_clicks() == 0
+    _insert([_click(shelf, timedelta(hours=2))] * 2)
+    assert roll_up_clicks(max_clicks=1) == 1
+    assert roll_up_clicks() == 1
+    db.session.commit()
+
+    assert sum(_rollups('hour').values()) == 5
+    assert sum(_rollups('day').values()) == 5
+
+@pytest.mark.parametrize('age', [
+    timedelta(hours=1), timedelta(hours=7, minutes=13), timedelta(days=1), timedelta(days=3, minutes=1),
+    timedelta(days=30), timedelta(days=30, hours=11, minutes=59),
+])
+def test_click_counts_match_raw_clicks(products, age):
+    clicks = _history(products)
+    _insert(clicks[:len(clicks) // 2])
+    roll_up_clicks()
+    db.session.commit()
+    # The rest is newer than the watermark and read from AffiliateClick
+    _insert(clicks[len(clicks) // 2:])
+
+    start = NOW - age
+    assert _summed(start) == _raw(start)
+
+def test_backfill_rebuilds_the_incremental_rollups(products):
+    clicks = _history(products)
+    for start in range(0, len(clicks), 4):
+        _insert(clicks[start:start + 4])
+        roll_up_clicks()
+        db.session.commit()
+    incremental = _rollups('hour'), _rollups('day')
+
+    progress = []
+    assert backfill_click_rollups(chunk_size=5, progress=progress.append) == len(clicks)
+
+    assert (_rollups('hour'), _rollups('day')) == incremental
+    assert progress == list(range(5, len(clicks), 5)) + [len(clicks)]
+
+def test_click_analytics_groups_by_product_and_merchant(products):
+    _insert(_history(products))
+    roll_up_clicks()
+    db.session.commit()
+
+    assert click_analytics(7) == [
+        {'product_name': 'Shelf', 'merchant': 'acme', 'click_count': 7},
+        {'product_name': 'Basket', 'merchant': 'acme', 'click_count': 4},
+        {'product_name': 'Hook', 'merchant': 'hooks', 'click_count': 2},
+    ]
+    assert click_analytics(7, group_by='merchant') == [
+        {'merchant': 'acme', 'click_count': 11},
+        {'merchant': 'hooks', 'click_count': 2},
+    ]
+
+def test_flushed_clicks_are_rolled_up_in_the_same_transaction(app, products):
+    from src.services.clicks import click_buffer
+
+    click_buffer.flush([_click(products[0], timedelta(minutes=3))] * 2)
+
+    assert sum(_rollups('hour').values()) == 2
+    assert _summed(NOW - timedelta(hours=1)) == {products[0]: 2}
@@ -0,0 +1,65 @@
+import json
+from src.models.user import db
+from src.models.product import Product, AffiliateClick
+from src.services.clicks import ClickBuffer
+
+def test_click_id_is_the_public_id_of_the_stored_click(app, client, tmp_path, monkeypatch):
+    product = Product(name='Shelf', affiliate_link='https://example.com/shelf')
+    db.session.add(product)
+    db.session.commit()
+    buffer = ClickBuffer(spool_path=str(tmp_path / 'spool.ndjson'))
+    buffer.init_app(app)
+    monkeypatch.setattr('src.routes.product.click_buffer', buffer)
+    monkeypatch.setattr(buffer, '_ensure_worker', lambda: None)
+
+    responses = [client.post(f'/api/products/{product.id}/click', json={'user_id': 1}).get_json() for _ in range(2)]
+    assert buffer.flush(buffer._drain(10, 0.1)) == 2
+
+    assert responses[0]['affiliate_link'] == 'https://example.com/shelf'
+    click_ids = [response['click_id'] for response in responses]
+    assert click_ids[0] != click_ids[1]
+    assert sorted(click.public_id for click in AffiliateClick.query) == sorted(click_ids)
+
+def test_spooled_clicks_keep_their_public_id(app, tmp_path, monkeypatch):
+    product = Product(name='Shelf', affiliate_link='https://example.com/shelf')
+    db.session.add(product)
+    db.session.commit()
+    buffer = ClickBuffer(spool_path=str(tmp_path / 'spool.ndjson'), maxsize=1)
+    buffer.init_app(app)
+    monkeypatch.setattr(buffer, '_ensure_worker', lambda: None)
+
+    # The queue holds one click, so the second goes to the spool and is replayed by the flush
+    row = {'product_id': product.id, 'timestamp': product.created_at}
+    queued, spooled = buffer.enqueue(row), buffer.enqueue(row)
+    buffer.flush(buffer._drain(10, 0.1))
+
+    assert sorted(click.public_id for click in AffiliateClick.query) == sorted([queued, spooled])
+
+def test_non_integer_ids_are_rejected(app, client):
+    product = Product(name='Shelf', affiliate_link='https://example.com/shelf')
+    db.session.add(product)
+    db.session.commit()
+
+    for body in ({'room_id': {'a': 1}}, {'user_id': '7'}, {'user_id': True}):
+        response = client.post(f'/api/products/{product.id}/click', json=body)
+        assert response.status_code == 400, body
+
+def test_rows_the_database_rejects_are_dead_lettered(app, tmp_path):
+    product = Product(name='Shelf', affiliate_link='https://example.com/shelf')
+    db.session.add(product)
+    db.session.commit()
+    spool = tmp_path / 'spool.ndjson'
+    buffer = ClickBuffer(spool_path=str(spool))
+    buffer.init_app(app)
+    good = {'product_id': product.id, 'timestamp': product.created_at, 'public_id': 'good'}
+    # Written by a version that did not validate ids at enqueue time
+    bad = dict(good, room_id={'a': 1}, public_id='bad')
+    buffer._spool([bad])
+
+    assert buffer.flush([good]) == 1
+    assert buffer.flush([dict(good, public_id='later')]) == 1
+
+    assert sorted(click.public_id for click in AffiliateClick.query) == ['good', 'later']
+    assert not spool.exists()
+    dead = (tmp_path / 'spool.ndjson.dead').read_text().splitlines()
+    assert [json.loads(line)['public_id'] for line in dead] == ['bad']
@@ -0,0 +1,50 @@
+import time
+from sqlalchemy import insert
+from src.models.user import db
+from src.models.product import Product, AffiliateClick
+from src.models.room import Room, RoomItem
+from src.services.co_clicks import CoClickIndex
+
+def _catalog():
+    products = [Product(name=name, affiliate_link=f'https://example.com/{name}') for name in ('a', 'b', 'c')]
+    db.session.add_all(products)
+    db.session.commit()
+    ids = [product.id for product in products]
+    db.session.execute(insert(AffiliateClick), [
+        {'user_id': user_id, 'product_id': ids[column]}
+        for user_id, columns in ((1, (0, 1)), (2, (0, 1)), (3, (0, 2)))
+        for column in columns
+    ])
+    db.session.commit()
+    return ids
+
+def test_requests_do_not_wait_for_the_first_build(app, monkeypatch):
+    ids = _catalog()
+    index = CoClickIndex(refresh_interval=3600)
+    index.init_app(app)
+    building = []
+    monkeypatch.setattr(index, 'refresh', lambda full=False: building.append(full))
+    monkeypatch.setattr(index, '_ensure_worker', lambda: None)
+
+    assert index.also_clicked(ids[0]) == []
+    assert building == []
+
+def test_background_thread_builds_the_first_snapshot(app):
+    ids = _catalog()
+    room = Room(name='Den', user_id=1, dimensions='{}')
+    db.session.add(room)
+    db.session.commit()
+    db.session.add(RoomItem(room_id=room.id, name='Shelf', category='storage'))
+    db.session.commit()
+    index = CoClickIndex(refresh_interval=3600)
+    index.init_app(app)
+
+    index.current()
+    deadline = time.monotonic() + 5
+    while index.snapshot is None:
+        assert time.monotonic() < deadline, 'snapshot was not built'
+        time.sleep(0.01)
+
+    assert [product_id for product_id, _ in index.also_clicked(ids[0])] == [ids[1], ids[2]]
+    assert index.recommend_for_room(room.id) != []
+    assert index.recommend_for_room(room.id + 1000) is None
@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta
+from werkzeug.http import http_date
+from src.models.user import db
+from src.models.room import Room
+from src.models.product import Product
+
+def _room():
+    room = Room(name='Den', user_id=1, dimensions='{}')
+    db.session.add(room)
+    db.session.commit()
+    return room.id
+
+def _product():
+    product = Product(name='Shelf', affiliate_link='https://example.com/shelf')
+    db.session.add(product)
+    db.session.commit()
+    return product.id
+
+def test_room_revalidates_until_it_changes(client):
+    room_id = _room()
+    first = client.get(f'/api/rooms/{room_id}')
+    etag = first.headers['ETag']
+
+    assert first.headers['Cache-Control'] == 'private, no-cache'
+    assert 'Last-Modified' in first.headers
+    cached = client.get(f'/api/rooms/{room_id}', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.data == b''
+    assert cached.headers['ETag'] == etag
+
+    client.patch(f'/api/rooms/{room_id}', json={'name': 'Study'})
+
+    changed = client.get(f'/api/rooms/{room_id}', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.get_json()['name'] == 'Study'
+    assert changed.headers['ETag'] != etag
+
+def test_query_string_selects_a_different_representation(client):
+    room_id = _room()
+    etag = client.get(f'/api/rooms/{room_id}').headers['ETag']
+
+    response = client.get(f'/api/rooms/{room_id}', query_string={'fields': 'id'}, headers={'If-None-Match': etag})
+
+    assert response.status_code == 200
+    assert response.get_json() == {'id': room_id}
+
+def test_if_modified_since(client):
+    room_id = _room()
+    last_modified = client.get(f'/api/rooms/{room_id}').headers['Last-Modified']
+    earlier = http_date(datetime.utcnow() - timedelta(days=1))
+
+    assert client.get(f'/api/rooms/{room_id}', headers={'If-Modified-Since': last_modified}).status_code == 304
+    assert client.get(f'/api/rooms/{room_id}', headers={'If-Modified-Since': earlier}).status_code == 200
+    # If-None-Match wins over If-Modified-Since
+    response = client.get(f'/api/rooms/{room_id}', headers={
+        'If-None-Match': 'W/"stale"', 'If-Modified-Since': last_modified
+    })
+    assert response.status_code == 200
+
+def test_room_list_etag_covers_deletions(client):
+    room_ids = [_room(), _room()]
+    etag = client.get('/api/rooms', query_string={'user_id': 1}).headers['ETag']
+    assert client.get('/api/rooms', query_string={'user_id': 1}, headers={'If-None-Match': etag}).status_code == 304
+
+    db.session.delete(db.session.get(Room, room_ids[0]))
+    db.session.commit()
+
+    response = client.get('/api/rooms', query_string={'user_id': 1}, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert [room['id'] for room in response.get_json()] == room_ids[1:]
+
+def test_missing_room_is_404_not_304(client):
+    assert client.get('/api/rooms/999', headers={'If-None-Match': '*'}).status_code == 404
+
+def test_catalog_etags_change_with_the_catalog(client):
+    product_id = _product()
+    listing = client.get('/api/products')
+    single = client.get(f'/api/products/{product_id}')
+
+    assert listing.headers['Cache-Control'].startswith('public')
+    for path, response in (('/api/products', listing), (f'/api/products/{product_id}', single)):
+        assert client.get(path, headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+    db.session.get(Product, product_id).name = 'Oak Shelf'
+    db.session.commit()
+
+    for path, response in (('/api/products', listing), (f'/api/products/{product_id}', single)):
+        changed = client.get(path, headers={'If-None-Match': response.headers['ETag']})
+        assert changed.status_code == 200
+        assert 'Oak Shelf' in changed.get_data(as_text=True)
+
+def test_personalized_listing_is_not_validated(client):
+    room_id = _room()
+    _product()
+
+    response = client.get('/api/products', query_string={'room_id': room_id})
+
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
@@ -0,0 +1,136 @@
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+import pytest
+from src.models.user import db
+from src.models.job import Job
+from src.services.jobs import MAX_ATTEMPTS, JobQueue
+
+@pytest.fixture
+def queue(app):
+    queue = JobQueue(max_workers=2, stale_after=60, heartbeat_interval=0.05)
+    queue.init_app(app)
+    ran = []
+
+    @queue.handler('record')
+    def record(job, **payload):
+        ran.append(job.id)
+        return payload
+
+    queue.ran = ran
+    yield queue
+    queue.shutdown()
+
+def _job(status='queued', started=None, heartbeat=None, kind='record'):
+    job = Job(kind=kind, status=status, payload='{"n": 1}', started_at=started, heartbeat_at=heartbeat)
+    db.session.add(job)
+    db.session.commit()
+    return job.id
+
+def _status(job_id):
+    db.session.commit()  # ends the read transaction and expires what it loaded
+    return db.session.get(Job, job_id)
+
+def _finish(job_ids, timeout=5):
+    """Wait for dispatched jobs; shutdown() would cancel the ones not yet started"""
+    deadline = time.monotonic() + timeout
+    while any(_status(job_id).status in ('queued', 'running') for job_id in job_ids):
+        assert time.monotonic() < deadline, 'jobs did not finish'
+        time.sleep(0.01)
+
+def test_resume_runs_queued_jobs_and_requeues_only_stale_ones(queue):
+    now = datetime.utcnow()
+    queued = _job()
+    stale = _job('running', started=now - timedelta(hours=1), heartbeat=now - timedelta(minutes=2))
+    # Claimed before heartbeats existed: the start time stands in for the heartbeat
+    legacy = _job('running', started=now - timedelta(hours=1))
+    # Started long ago but still beating: its process is alive
+    alive = _job('running', started=now - timedelta(hours=1), heartbeat=now - timedelta(seconds=5))
+    done = _job('succeeded', started=now - timedelta(hours=1))
+
+    assert queue.resume() == 3
+    _finish([queued, stale, legacy])
+
+    assert sorted(queue.ran) == sorted([queued, stale, legacy])
+    for job_id in (queued, stale, legacy):
+        job = _status(job_id)
+        assert job.status == 'succeeded'
+        assert job.attempts == 1
+        assert json.loads(job.result) == {'n': 1}
+    assert _status(alive).status == 'running'
+    assert _status(done).status == 'succeeded'
+
+def test_a_job_is_claimed_once(queue):
+    job_id = _job()
+
+    assert queue.run(job_id) is True
+    assert queue.run(job_id) is False
+    assert queue.ran == [job_id]
+
+def test_failed_jobs_record_the_error(queue):
+    @queue.handler('fail')
+    def fail(job, **payload):
+        raise RuntimeError('boom')
+
+    job_id = _job(kind='fail')
+    queue.run(job_id)
+
+    job = _status(job_id)
+    assert job.status == 'failed'
+    assert job.error == 'boom'
+    assert job.finished_at is not None
+
+def test_running_jobs_keep_their_heartbeat_fresh(app, queue):
+    started = threading.Event()
+    release = threading.Event()
+
+    @queue.handler('wait')
+    def wait(job, **payload):
+        started.set()
+        release.wait(5)
+
+    job_id = _job(kind='wait')
+    queue.dispatch([job_id])
+    assert started.wait(5)
+    first = _status(job_id).heartbeat_at
+    time.sleep(0.3)
+    later = _status(job_id).heartbeat_at
+    release.set()
+    _finish([job_id])
+
+    assert later > first
+    assert _status(job_id).status == 'succeeded'
+
+def test_progress_refreshes_the_heartbeat(queue):
+    @queue.handler('steps')
+    def steps(job, **payload):
+        before = job.heartbeat_at
+        queue.progress(job, done=1)
+        assert job.heartbeat_at > before
+        return {'done': 2}
+
+    job_id = _job(kind='steps')
+    queue.run(job_id)
+
+    assert _status(job_id).status == 'succeeded'
+    assert json.loads(_status(job_id).result) == {'done': 2}
+
+def test_heartbeat_interval_must_be_shorter_than_stale_after():
+    with pytest.raises(ValueError):
+        JobQueue(stale_after=60, heartbeat_interval=60)
+
+def test_jobs_that_keep_going_stale_are_failed(queue):
+    now = datetime.utcnow()
+    job_id = _job('running', started=now - timedelta(hours=1), heartbeat=now - timedelta(minutes=2))
+    job = db.session.get(Job, job_id)
+    job.attempts = MAX_ATTEMPTS
+    db.session.commit()
+
+    assert queue.resume() == 0
+
+    job = _status(job_id)
+    assert job.status == 'failed'
+    assert str(MAX_ATTEMPTS) in job.error
+    assert job.finished_at is not None
+    assert queue.ran == []
@@ -0,0 +1,74 @@
+import pytest
+from src.utils.json_patch import apply_json_patch, merge_patch
+
+def test_merge_patch_replaces_removes_and_recurses():
+    target = {'a': 1, 'b': {'c': 2, 'd': 3}, 'e': [1, 2]}
+
+    result = merge_patch(target, {'a': None, 'b': {'c': 20, 'x': None}, 'e': [3], 'f': {'g': None}})
+
+    assert result == {'b': {'c': 20, 'd': 3}, 'e': [3], 'f': {}}
+    assert target == {'a': 1, 'b': {'c': 2, 'd': 3}, 'e': [1, 2]}
+
+def test_merge_patch_with_a_non_object_replaces_the_target():
+    assert merge_patch({'a': 1}, [1, 2]) == [1, 2]
+    assert merge_patch('text', {'a': 1}) == {'a': 1}
+
+@pytest.mark.parametrize('operations, expected', [
+    ([{'op': 'add', 'path': '/items/1', 'value': 'x'}], {'items': ['a', 'x', 'b'], 'meta': {'n': 1}}),
+    ([{'op': 'add', 'path': '/items/-', 'value': 'x'}], {'items': ['a', 'b', 'x'], 'meta': {'n': 1}}),
+    ([{'op': 'add', 'path': '/meta/m', 'value': 2}], {'items': ['a', 'b'], 'meta': {'n': 1, 'm': 2}}),
+    ([{'op': 'remove', 'path': '/items/0'}], {'items': ['b'], 'meta': {'n': 1}}),
+    ([{'op': 'replace', 'path': '/meta/n', 'value': 5}], {'items': ['a', 'b'], 'meta': {'n': 5}}),
+    ([{'op': 'move', 'from': '/meta/n', 'path': '/count'}], {'items': ['a', 'b'], 'meta': {}, 'count': 1}),
+    ([{'op': 'copy', 'from': '/items', 'path': '/meta/items'}],
+     {'items': ['a', 'b'], 'meta': {'n': 1, 'items': ['a', 'b']}}),
+    ([{'op': 'test', 'path': '/meta/n', 'value': 1}, {'op': 'remove', 'path': '/meta'}], {'items': ['a', 'b']}),
+    ([{'op': 'replace', 'path': '', 'value': [1]}], [1]),
+])
+def test_apply_json_patch(operations, expected):
+    document = {'items': ['a', 'b'], 'meta': {'n': 1}}
+
+    assert apply_json_patch(document, operations) == expected
+    assert document == {'items': ['a', 'b'], 'meta': {'n': 1}}
+
+def test_pointer_escapes():
+    document = {'a/b': 1, 'm~n': 2}
+
+    result = apply_json_patch(document, [
+        {'op': 'replace', 'path': '/a~1b', 'value': 10},
+        {'op': 'remove', 'path': '/m~0n'},
+    ])
+
+    assert result == {'a/b': 10}
+
+def test_added_values_are_copied():
+    value = {'nested': []}
+
+    result = apply_json_patch({}, [{'op': 'add', 'path': '/a', 'value': value}])
+    result['a']['nested'].append(1)
+
+    assert value == {'nested': []}
+
+@pytest.mark.parametrize('operations', [
+    {'op': 'add', 'path': '/a', 'value': 1},
+    [{'op': 'add', 'value': 1}],
+    [{'op': 'add', 'path': '/a'}],
+    [{'op': 'move', 'path': '/a'}],
+    [{'op': 'frobnicate', 'path': '/a'}],
+    [{'op': 'add', 'path': 'a', 'value': 1}],
+    [{'op': 'remove', 'path': '/missing'}],
+    [{'op': 'replace', 'path': '/missing', 'value': 1}],
+    [{'op': 'add', 'path': '/missing/a', 'value': 1}],
+    [{'op': 'add', 'path': '/items/3', 'value': 'x'}],
+    [{'op': 'remove', 'path': '/items/2'}],
+    [{'op': 'remove', 'path': '/items/01'}],
+    [{'op': 'remove', 'path': '/items/-'}],
+    [{'op': 'add', 'path': '/items/0/x', 'value': 1}],
+    [{'op': 'test', 'path': '/items', 'value': ['b', 'a']}],
+])
+def test_invalid_patches_raise_value_error(operations):
+    document = {'items': ['a', 'b']}
+
+    with pytest.raises(ValueError):
+        apply_json_patch(document, operations)
+    assert document == {'items': ['a', 'b']}
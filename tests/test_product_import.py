@@ -0,0 +1,118 @@
+import io
+import json
+from src.models.user import db
+from src.models.product import Product
+from src.services.product_import import ProductImporter, iter_feed
+
+CSV_FEED = '''sku,merchant,name,affiliate_link,price,category
+A1,acme,Shelf,https://example.com/a1,19.99,storage
+A2,acme,Basket,https://example.com/a2,,storage
+A3,acme,,https://example.com/a3,5,storage
+A4,acme,Hook,https://example.com/a4,cheap,storage
+'''
+
+def _ndjson(*rows):
+    return '\n'.join(row if isinstance(row, str) else json.dumps(row) for row in rows) + '\n'
+
+def _import(client, body, mimetype='application/x-ndjson', **args):
+    response = client.post('/api/products/import', data=body, content_type=mimetype, query_string=args)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+def _products():
+    db.session.expire_all()
+    return {(product.merchant, product.sku): product for product in Product.query}
+
+def test_csv_rows_are_validated_and_inserted(client):
+    summary = _import(client, CSV_FEED, mimetype='text/csv')
+
+    assert summary['imported'] == 2
+    assert summary['error_count'] == 2
+    assert summary['errors'] == [{'line': 4, 'error': 'missing name'}, {'line': 5, 'error': "invalid price 'cheap'"}]
+    products = _products()
+    assert set(products) == {('acme', 'A1'), ('acme', 'A2')}
+    assert products['acme', 'A1'].price == 19.99
+    assert products['acme', 'A2'].price is None
+
+def test_upsert_keeps_ids_and_deactivates_missing_products_of_the_same_merchants(client):
+    _import(client, _ndjson(
+        {'sku': 'A1', 'merchant': 'acme', 'name': 'Shelf', 'affiliate_link': 'https://example.com/a1', 'price': 10},
+        {'sku': 'A2', 'merchant': 'acme', 'name': 'Basket', 'affiliate_link': 'https://example.com/a2'},
+        {'sku': 'B1', 'merchant': 'other', 'name': 'Lamp', 'affiliate_link': 'https://example.com/b1'},
+    ))
+    ids = {key: product.id for key, product in _products().items()}
+
+    summary = _import(client, _ndjson(
+        {'sku': 'A1', 'merchant': 'acme', 'name': 'Oak Shelf', 'affiliate_link': 'https://example.com/a1', 'price': 12},
+        {'sku': 'A3', 'merchant': 'acme', 'name': 'Hook', 'affiliate_link': 'https://example.com/a3'},
+    ))
+
+    assert (summary['imported'], summary['deactivated']) == (2, 1)
+    products = _products()
+    assert products['acme', 'A1'].id == ids['acme', 'A1']
+    assert (products['acme', 'A1'].name, products['acme', 'A1'].price) == ('Oak Shelf', 12)
+    assert products['acme', 'A2'].is_active is False
+    assert products['acme', 'A3'].is_active is True
+    # Merchants absent from the feed are left alone
+    assert products['other', 'B1'].is_active is True
+
+def test_missing_products_can_be_kept(client):
+    row = {'merchant': 'acme', 'name': 'Shelf', 'affiliate_link': 'https://example.com/a'}
+    _import(client, _ndjson(dict(row, sku='A1'), dict(row, sku='A2')))
+
+    summary = _import(client, _ndjson(dict(row, sku='A1')), deactivate_missing='false')
+
+    assert summary['deactivated'] == 0
+    assert all(product.is_active for product in _products().values())
+
+def test_ndjson_errors_are_reported_per_line(client):
+    summary = _import(client, _ndjson(
+        '{"sku": "A1", "merchant": "acme", "name": "Shelf", "affiliate_link": "https://example.com/a1"}',
+        'not json',
+        '[1, 2]',
+        '{"sku": "A2", "merchant": "acme", "name": "Bin", "affiliate_link": "x", "price": -1}',
+    ))
+
+    assert summary['imported'] == 1
+    assert [error['line'] for error in summary['errors']] == [2, 3, 4]
+
+def test_repeated_skus_in_one_batch_keep_the_last_row(app):
+    importer = ProductImporter(batch_size=10)
+    for line_number, name in enumerate(('First', 'Second'), start=1):
+        importer.add(line_number, {'sku': 'A1', 'merchant': 'acme', 'name': name, 'affiliate_link': 'x'})
+    summary = importer.finish()
+
+    assert summary['imported'] == 1
+    assert [product.name for product in _products().values()] == ['Second']
+
+def test_batches_report_progress(app):
+    progress = []
+    importer = ProductImporter(batch_size=2, progress=lambda imported, errors: progress.append((imported, errors)))
+    for number in range(5):
+        importer.add(number + 1, {'sku': f'A{number}', 'merchant': 'acme', 'name': 'Shelf', 'affiliate_link': 'x'})
+    importer.add(6, {'sku': 'bad'})
+    importer.finish()
+
+    assert progress == [(2, 0), (4, 0), (5, 1)]
+
+def test_feeds_are_read_from_streams_without_io_methods():
+    class ServerInput:
+        """Like gunicorn's request body: read() only"""
+        def __init__(self, data):
+            self._buffer = io.BytesIO(data)
+
+        def read(self, size=-1):
+            return self._buffer.read(size)
+
+    rows = list(iter_feed(ServerInput(CSV_FEED.encode('utf-8')), 'csv'))
+
+    assert [line for line, _ in rows] == [2, 3, 4, 5]
+    assert rows[0][1]['name'] == 'Shelf'
+
+def test_imports_show_up_in_the_cached_listing(client):
+    row = {'sku': 'A1', 'merchant': 'acme', 'name': 'Shelf', 'affiliate_link': 'https://example.com/a1'}
+    assert client.get('/api/products').get_json() == []
+
+    _import(client, _ndjson(row))
+
+    assert [product['name'] for product in client.get('/api/products').get_json()] == ['Shelf']
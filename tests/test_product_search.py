@@ -0,0 +1,71 @@
+import pytest
+from src.models.user import db
+from src.models.product import Product
+from src.services.product_search import match_expression
+
+@pytest.fixture
+def catalog(app):
+    products = {
+        'shelf': Product(name='Oak Bookshelf', description='Five shelves of solid oak', category='storage',
+                         merchant='IKEA', price=120.0, affiliate_link='https://example.com/shelf'),
+        'bins': Product(name='Stacking Bins', description='Plastic bins that fit any bookshelf', category='storage',
+                        merchant='Target', price=15.0, affiliate_link='https://example.com/bins'),
+        'lamp': Product(name='Café Lamp', description='Brass desk lamp', category='lighting',
+                        merchant='IKEA', price=40.0, affiliate_link='https://example.com/lamp'),
+        'old': Product(name='Retired Bookshelf', category='storage', merchant='IKEA', price=60.0,
+                       is_active=False, affiliate_link='https://example.com/old'),
+    }
+    db.session.add_all(products.values())
+    db.session.commit()
+    return {key: product.id for key, product in products.items()}
+
+def _search(client, **args):
+    response = client.get('/api/products/search', query_string=args)
+    assert response.status_code == 200
+    return [product['id'] for product in response.get_json()]
+
+def test_match_expression_quotes_words_and_prefixes_the_last():
+    assert match_expression('Oak book') == '"oak" "book"*'
+    assert match_expression('"; DROP TABLE product') == '"drop" "table" "product"*'
+    assert match_expression(' -- ') is None
+
+def test_name_matches_rank_above_description_matches(client, catalog):
+    assert _search(client, q='bookshelf') == [catalog['shelf'], catalog['bins']]
+
+def test_prefix_and_diacritic_insensitive_matching(client, catalog):
+    assert _search(client, q='book') == [catalog['shelf'], catalog['bins']]
+    assert _search(client, q='cafe') == [catalog['lamp']]
+    assert _search(client, q='ikea lam') == [catalog['lamp']]
+
+def test_filters(client, catalog):
+    assert _search(client, q='bookshelf', merchant='Target') == [catalog['bins']]
+    assert _search(client, q='bookshelf', max_price=100) == [catalog['bins']]
+    assert _search(client, q='bookshelf', min_price=100) == [catalog['shelf']]
+    assert set(_search(client, q='bookshelf', include_inactive='true')) == {
+        catalog['shelf'], catalog['bins'], catalog['old']
+    }
+
+def test_limit_offset_and_empty_queries(client, catalog):
+    assert _search(client, q='bookshelf', limit=1) == [catalog['shelf']]
+    assert _search(client, q='bookshelf', limit=1, offset=1) == [catalog['bins']]
+    assert _search(client, q='!!') == []
+
+def test_index_follows_updates_and_deletes(client, catalog):
+    lamp = db.session.get(Product, catalog['lamp'])
+    lamp.name = 'Reading Light'
+    db.session.delete(db.session.get(Product, catalog['bins']))
+    db.session.commit()
+
+    assert _search(client, q='lamp') == [catalog['lamp']]  # still in the description
+    assert _search(client, q='reading') == [catalog['lamp']]
+    assert _search(client, q='stacking') == []
+
+def test_rebuild_command_indexes_existing_products(app, client, catalog):
+    db.session.execute(db.text("INSERT INTO product_fts(product_fts) VALUES ('delete-all')"))
+    db.session.commit()
+    assert _search(client, q='oak') == []
+
+    result = app.test_cli_runner().invoke(args=['rebuild-product-search'])
+
+    assert result.exit_code == 0, result.output
+    assert _search(client, q='oak') == [catalog['shelf']]
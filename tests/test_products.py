@@ -0,0 +1,23 @@
+from src.models.user import db
+from src.models.product import Product
+
+def _add_products(count):
+    db.session.add_all([
+        Product(name=f'Product {index}', category='storage', affiliate_link=f'https://example.com/{index}')
+        for index in range(count)
+    ])
+    db.session.commit()
+
+def test_limit_is_clamped(client):
+    _add_products(105)
+
+    assert len(client.get('/api/products', query_string={'limit': 1000}).get_json()) == 100
+    assert len(client.get('/api/products', query_string={'limit': -5}).get_json()) == 1
+
+def test_fields_are_applied_to_the_cached_page(client):
+    _add_products(3)
+
+    full = client.get('/api/products').get_json()
+    narrow = client.get('/api/products', query_string={'fields': 'id,name'}).get_json()
+
+    assert narrow == [{'id': product['id'], 'name': product['name']} for product in full]
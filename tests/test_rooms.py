@@ -0,0 +1,107 @@
+from urllib.parse import parse_qs, urlsplit
+from src.models.user import db
+from src.models.room import Room
+
+def _add_rooms(user_id, count):
+    rooms = [Room(name=f'Room {index}', user_id=user_id, dimensions='{}') for index in range(count)]
+    db.session.add_all(rooms)
+    db.session.commit()
+    return [room.id for room in rooms]
+
+def _pages(client, **args):
+    """Follow X-Next-Cursor from the first page, returning each page's room ids"""
+    pages = []
+    cursor = None
+    while True:
+        query = dict(args, **({'cursor': cursor} if cursor is not None else {}))
+        response = client.get('/api/rooms', query_string=query)
+        assert response.status_code == 200
+        pages.append([room['id'] for room in response.get_json()])
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            assert 'Link' not in response.headers
+            return pages
+
+def test_cursor_walks_every_room_once(client):
+    room_ids = _add_rooms(1, 7)
+    _add_rooms(2, 3)
+
+    pages = _pages(client, user_id=1, limit=3)
+
+    assert pages == [room_ids[0:3], room_ids[3:6], room_ids[6:7]]
+
+def test_no_cursor_when_the_page_is_exactly_full(client):
+    room_ids = _add_rooms(1, 4)
+
+    assert _pages(client, user_id=1, limit=4) == [room_ids]
+
+def test_link_header_repeats_the_query_with_the_next_cursor(client):
+    room_ids = _add_rooms(1, 3)
+
+    response = client.get('/api/rooms', query_string={'user_id': 1, 'limit': 2, 'fields': 'id,name'})
+
+    cursor = response.headers['X-Next-Cursor']
+    assert cursor == str(room_ids[1])
+    link, rel = response.headers['Link'].split('; ')
+    assert rel == 'rel="next"'
+    url = urlsplit(link.strip('<>'))
+    assert url.path == '/api/rooms'
+    assert parse_qs(url.query) == {'user_id': ['1'], 'limit': ['2'], 'fields': ['id,name'], 'cursor': [cursor]}
+
+def test_rooms_deleted_behind_the_cursor_do_not_shift_later_pages(client):
+    room_ids = _add_rooms(1, 4)
+    first = client.get('/api/rooms', query_string={'user_id': 1, 'limit': 2})
+    cursor = first.headers['X-Next-Cursor']
+
+    db.session.delete(db.session.get(Room, room_ids[0]))
+    db.session.commit()
+    second = client.get('/api/rooms', query_string={'user_id': 1, 'limit': 2, 'cursor': cursor})
+
+    assert [room['id'] for room in second.get_json()] == room_ids[2:4]
+
+def test_limit_is_clamped(client):
+    _add_rooms(1, 2)
+
+    response = client.get('/api/rooms', query_string={'user_id': 1, 'limit': 0})
+
+    assert len(response.get_json()) == 1
+    assert 'X-Next-Cursor' in response.headers
+
+def test_patch_applies_scan_patch_after_the_merge_patch(client):
+    room_id, = _add_rooms(1, 1)
+
+    response = client.patch(f'/api/rooms/{room_id}', json={
+        'scan_data': {'walls': [{'id': 1}], 'floor': 'oak'},
+        'scan_patch': [{'op': 'add', 'path': '/walls/-', 'value': {'id': 2}}, {'op': 'remove', 'path': '/floor'}],
+    })
+
+    assert response.status_code == 200
+    assert client.get(f'/api/rooms/{room_id}').get_json()['scan_data'] == {'walls': [{'id': 1}, {'id': 2}]}
+
+def test_failed_scan_patch_changes_nothing(client):
+    room_id, = _add_rooms(1, 1)
+    client.patch(f'/api/rooms/{room_id}', json={'scan_data': {'floor': 'oak'}})
+
+    response = client.patch(f'/api/rooms/{room_id}', json={
+        'name': 'Renamed',
+        'scan_patch': [{'op': 'test', 'path': '/floor', 'value': 'tile'}],
+    })
+
+    assert response.status_code == 400
+    room = client.get(f'/api/rooms/{room_id}').get_json()
+    assert room['name'] == 'Room 0'
+    assert room['scan_data'] == {'floor': 'oak'}
+
+def test_updates_that_affect_suggestions_regenerate_them(client):
+    room_id, = _add_rooms(1, 1)
+
+    put = client.put(f'/api/rooms/{room_id}', json={'dimensions': {'width': 4, 'length': 5}})
+    patched_dimensions = client.patch(f'/api/rooms/{room_id}', json={'dimensions': {'height': 3}})
+    patched_items = client.patch(f'/api/rooms/{room_id}', json={'items': {'add': [{'name': 'Box', 'category': 'storage'}]}})
+    renamed = client.patch(f'/api/rooms/{room_id}', json={'name': 'Den'})
+
+    for response in (put, patched_dimensions, patched_items):
+        assert response.status_code == 200
+        job = client.get(f"/api/jobs/{response.headers['X-Suggestions-Job']}").get_json()
+        assert job['kind'] == 'room_suggestions'
+    assert 'X-Suggestions-Job' not in renamed.headers
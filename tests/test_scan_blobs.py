@@ -0,0 +1,42 @@
+import os
+import time
+import pytest
+from src.models.user import db
+from src.models.room import Room
+from src.services.blob_store import scan_store
+
+@pytest.fixture(autouse=True)
+def blob_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(scan_store, 'root', str(tmp_path / 'blobs'))
+
+def _age(digest, seconds):
+    past = time.time() - seconds
+    os.utime(scan_store.path(digest), (past, past))
+
+def test_prune_keeps_referenced_and_recent_blobs(app):
+    room = Room(name='Den', user_id=1, dimensions='{}')
+    room.set_scan_data('{"walls": 4}')
+    db.session.add(room)
+    db.session.commit()
+    orphan = scan_store.put(b'{"walls": 3}')
+    in_flight = scan_store.put(b'{"walls": 5}')
+    for digest in (room.scan_ref, orphan):
+        _age(digest, 2 * 3600)
+
+    result = app.test_cli_runner().invoke(args=['prune-scans'])
+
+    assert 'Removed 1 unreferenced scan blobs' in result.output
+    assert scan_store.exists(room.scan_ref)
+    assert scan_store.exists(in_flight)
+    assert not scan_store.exists(orphan)
+
+def test_storing_an_existing_blob_refreshes_its_age(app):
+    digest = scan_store.put(b'{"walls": 6}')
+    _age(digest, 2 * 3600)
+
+    assert scan_store.put(b'{"walls": 6}') == digest
+
+    assert time.time() - scan_store.modified_at(digest) < 60
+    result = app.test_cli_runner().invoke(args=['prune-scans'])
+    assert scan_store.exists(digest)
+    assert 'Removed 0' in result.output
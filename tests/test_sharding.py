@@ -0,0 +1,157 @@
+import time
+import pytest
+from sqlalchemy import exc, insert, select
+from src.models.user import db
+from src.models.room import Room, RoomItem
+from src.models.job import Job
+from src.models.shard import ShardFence, UserShard
+from src.services.sharding import GLOBAL, ID_STRIDE, shard_map
+
+@pytest.fixture
+def client(make_app):
+    app = make_app(shards=2)
+    with app.app_context():
+        yield app.test_client()
+        db.session.remove()
+
+def _create_room(client, user_id, items=1):
+    response = client.post('/api/rooms', json={
+        'name': f'Room of {user_id}', 'user_id': user_id,
+        'items': [{'name': f'Item {index}', 'category': 'storage'} for index in range(items)],
+    })
+    assert response.status_code in (200, 201), response.get_json()
+    _settle()
+    return response.get_json()['id']
+
+def _settle(timeout=5):
+    """Wait for the suggestion jobs room writes queue, which write to the shards too"""
+    deadline = time.monotonic() + timeout
+    with shard_map._engine(GLOBAL).connect() as connection:
+        while connection.execute(select(Job.id).where(Job.status.in_(['queued', 'running']))).first():
+            assert time.monotonic() < deadline, 'jobs did not finish'
+            time.sleep(0.01)
+
+def _rooms(client, user_id):
+    response = client.get('/api/rooms', query_string={'user_id': user_id, 'fields': 'id,items'})
+    return {room['id']: len(room['items']) for room in response.get_json()}
+
+def _user_ids(location):
+    with shard_map._engine(location).connect() as connection:
+        return set(connection.execute(select(Room.user_id)).scalars())
+
+def _fences(location):
+    with shard_map._engine(location).connect() as connection:
+        return set(connection.execute(select(ShardFence.user_id, ShardFence.room_id, ShardFence.moved_to)).all())
+
+def _other(location):
+    return next(shard for shard in shard_map.engines if shard != location)
+
+def test_rooms_are_written_to_their_users_shard(client):
+    room_id = _create_room(client, 1, items=2)
+    placed = db.session.get(UserShard, 1).shard
+
+    assert placed in shard_map.engines
+    assert _user_ids(placed) == {1}
+    assert _user_ids(_other(placed)) == set()
+    assert room_id % ID_STRIDE == shard_map._index(placed)
+    assert _rooms(client, 1) == {room_id: 2}
+
+def test_move_user_copies_the_rows_and_switches_the_placement(client):
+    room_ids = [_create_room(client, 1, items=2), _create_room(client, 1, items=1)]
+    _create_room(client, 2)
+    source = shard_map.shard_for_user(1)
+    target = _other(source)
+
+    counts = shard_map.move_user(1, source, target)
+
+    assert (counts['room'], counts['room_item']) == (2, 3)
+    db.session.expire_all()
+    assert db.session.get(UserShard, 1).shard == target
+    assert 1 in _user_ids(target)
+    assert 1 not in _user_ids(source)
+    assert _rooms(client, 1) == {room_ids[0]: 2, room_ids[1]: 1}
+    # The moved rooms keep their ids, and new ones are numbered by the target without colliding
+    new_room = _create_room(client, 1)
+    assert new_room not in room_ids
+    assert new_room % ID_STRIDE == shard_map._index(target)
+
+def test_move_user_fences_the_source(client):
+    room_id = _create_room(client, 1)
+    source = shard_map.shard_for_user(1)
+    target = _other(source)
+
+    shard_map.move_user(1, source, target)
+
+    assert _fences(source) == {(1, None, target), (1, room_id, target)}
+    # A process that has not seen the new placement yet writes to the source, and the triggers refuse it
+    with shard_map._engine(source).begin() as connection:
+        with pytest.raises(exc.IntegrityError, match='shard fence'):
+            connection.execute(insert(Room).values(id=ID_STRIDE * 1000, name='stale', user_id=1))
+    with shard_map._engine(source).begin() as connection:
+        with pytest.raises(exc.IntegrityError, match='shard fence'):
+            connection.execute(insert(RoomItem).values(id=ID_STRIDE * 1000, room_id=room_id, name='stale', category='storage'))
+    assert 1 not in _user_ids(source)
+
+def test_stale_placement_fails_instead_of_writing_to_the_old_shard(client):
+    _create_room(client, 1)
+    source = shard_map.shard_for_user(1)
+    shard_map.move_user(1, source, _other(source))
+    shard_map._users.set(1, source)
+
+    response = client.post('/api/rooms', json={'name': 'Late', 'user_id': 1})
+
+    assert response.status_code == 400
+    assert 'shard fence' in response.get_json()['error']
+    assert 1 not in _user_ids(source)
+
+def test_moving_back_lifts_the_fence(client):
+    room_id = _create_room(client, 1)
+    source = shard_map.shard_for_user(1)
+    target = _other(source)
+
+    shard_map.move_user(1, source, target)
+    shard_map.move_user(1, target, source)
+
+    assert _fences(source) == set()
+    assert _fences(target) == {(1, None, source), (1, room_id, source)}
+    assert _rooms(client, 1) == {room_id: 1}
+    new_room = _create_room(client, 1)
+    assert _rooms(client, 1) == {room_id: 1, new_room: 1}
+
+def test_move_user_merges_leftovers_into_the_placed_shard(client):
+    room_id = _create_room(client, 1, items=2)
+    placed = shard_map.shard_for_user(1)
+    # A copy left in the global database by an interrupted move, with one extra item
+    with shard_map._engine(placed).connect() as connection:
+        room = dict(connection.execute(select(Room.__table__).where(Room.id == room_id)).mappings().one())
+    with shard_map._engine(GLOBAL).begin() as connection:
+        connection.execute(insert(Room.__table__), room)
+        connection.execute(insert(RoomItem.__table__).values(id=ID_STRIDE * 1000, room_id=room_id, name='Leftover', category='storage'))
+    assert shard_map.leftovers() == [(1, GLOBAL, placed)]
+
+    counts = shard_map.move_user(1, GLOBAL, placed)
+
+    assert counts['room'] == 1
+    assert shard_map.leftovers() == []
+    assert 1 not in _user_ids(GLOBAL)
+    assert _rooms(client, 1) == {room_id: 3}
+    db.session.expire_all()
+    assert db.session.get(UserShard, 1).shard == placed
+
+def test_rebalance_moves_users_placed_off_their_ring_shard(make_app):
+    app = make_app(shards=2)
+    with app.app_context():
+        client = app.test_client()
+        room_id = _create_room(client, 7)
+        ring = shard_map.shard_for_user(7)
+        shard_map.move_user(7, ring, _other(ring))
+        assert shard_map.plan() == [(7, _other(ring), ring)]
+
+        result = app.test_cli_runner().invoke(args=['rebalance-shards'])
+
+        assert result.exit_code == 0, result.output
+        assert 'Done: 1 users moved, 0 leftover placements merged' in result.output
+        assert shard_map.plan() == []
+        assert _user_ids(ring) == {7}
+        assert _rooms(client, 7) == {room_id: 1}
+        db.session.remove()
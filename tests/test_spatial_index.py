@@ -0,0 +1,145 @@
+import math
+import random
+from datetime import datetime
+import pytest
+from src.models.user import db
+from src.models.room import Room, RoomItem
+from src.services.spatial_index import GridIndex, item_point, room_indexes
+
+def _random_points(rng, count, spread):
+    return {item_id: tuple(rng.uniform(-spread, spread) for _ in range(3)) for item_id in range(1, count + 1)}
+
+@pytest.mark.parametrize('count, spread', [(0, 1), (1, 1), (40, 0.4), (300, 3), (200, 50)])
+def test_grid_queries_match_brute_force(count, spread):
+    rng = random.Random(count)
+    points = _random_points(rng, count, spread)
+    index = GridIndex()
+    for item_id, point in points.items():
+        index.insert(item_id, point)
+
+    for _ in range(20):
+        center = tuple(rng.uniform(-spread, spread) for _ in range(3))
+        by_distance = sorted((math.dist(center, point), item_id) for item_id, point in points.items())
+
+        k = rng.randint(1, 10)
+        assert [item_id for item_id, _ in index.nearest(center, k)] == [item_id for _, item_id in by_distance[:k]]
+
+        radius = rng.uniform(0, spread)
+        assert [item_id for item_id, _ in index.within_radius(center, radius)] == [
+            item_id for distance, item_id in by_distance if distance <= radius
+        ]
+
+        low = tuple(c - rng.uniform(0, spread) for c in center)
+        high = tuple(c + rng.uniform(0, spread) for c in center)
+        assert index.within_box(low, high) == sorted(
+            item_id for item_id, point in points.items() if all(l <= c <= h for c, l, h in zip(point, low, high))
+        )
+
+def test_open_ended_boxes():
+    index = GridIndex()
+    index.insert(1, (0.0, 0.0, 0.0))
+    index.insert(2, (5.0, 1.0, -3.0))
+
+    assert index.within_box((1.0, -math.inf, -math.inf), (math.inf, math.inf, math.inf)) == [2]
+    assert index.within_box((-math.inf,) * 3, (math.inf,) * 3) == [1, 2]
+
+def test_updates_move_and_remove_items():
+    index = GridIndex()
+    index.insert(1, (0.0, 0.0, 0.0))
+    index.insert(2, (1.0, 0.0, 0.0))
+
+    index.insert(1, (10.0, 0.0, 0.0))
+    index.remove(2)
+    index.insert(3, None)
+
+    assert len(index) == 1
+    assert index.nearest((0.0, 0.0, 0.0), 5) == [(1, 10.0)]
+    assert index.within_radius((0.0, 0.0, 0.0), 2.0) == []
+
+def test_copies_are_independent():
+    index = GridIndex()
+    index.insert(1, (0.0, 0.0, 0.0))
+    copy = index.copy()
+    copy.remove(1)
+
+    assert len(index) == 1
+
+@pytest.mark.parametrize('position, point', [
+    ({'x': 1, 'z': 2}, (1.0, 0.0, 2.0)),
+    ({'x': '1.5', 'y': 0.5, 'z': 2}, (1.5, 0.5, 2.0)),
+    ({'x': 1}, None),
+    ({'x': 'left', 'z': 2}, None),
+    ({'x': float('nan'), 'z': 2}, None),
+    (None, None),
+    ([1, 2, 3], None),
+])
+def test_item_point(position, point):
+    assert item_point(position) == point
+
+@pytest.fixture
+def room(client):
+    response = client.post('/api/rooms', json={'name': 'Den', 'user_id': 1, 'items': [
+        {'name': 'Lamp', 'category': 'lighting', 'position': {'x': 0, 'y': 1, 'z': 0}},
+        {'name': 'Shelf', 'category': 'storage', 'position': {'x': 2, 'z': 0}},
+        {'name': 'Rug', 'category': 'decor', 'position': {'x': 5, 'z': 5}},
+        {'name': 'Box', 'category': 'storage'},
+    ]})
+    room = response.get_json()
+    return room['id'], {item['name']: item['id'] for item in room['items']}
+
+def _names(response):
+    assert response.status_code == 200, response.get_json()
+    return [item['name'] for item in response.get_json()]
+
+def test_proximity_routes(client, room):
+    room_id, _ = room
+    base = f'/api/rooms/{room_id}/items'
+
+    nearby = client.get(f'{base}/nearby', query_string={'x': 0, 'z': 0, 'radius': 2.5})
+    assert _names(nearby) == ['Lamp', 'Shelf']
+    assert [item['distance'] for item in nearby.get_json()] == [1.0, 2.0]
+    assert _names(client.get(f'{base}/nearest', query_string={'x': 4, 'z': 4, 'k': 2})) == ['Rug', 'Shelf']
+    assert _names(client.get(f'{base}/within', query_string={'min_x': 1, 'max_x': 6})) == ['Shelf', 'Rug']
+    assert client.get(f'{base}/nearest', query_string={'x': 0, 'z': 0, 'fields': 'name'}).get_json()[0] == {
+        'name': 'Lamp', 'distance': 1.0
+    }
+
+def test_proximity_routes_reject_bad_input(client, room):
+    room_id, _ = room
+    base = f'/api/rooms/{room_id}/items'
+
+    assert client.get(f'{base}/nearby', query_string={'x': 0, 'radius': 1}).status_code == 400
+    assert client.get(f'{base}/nearby', query_string={'x': 0, 'z': 0, 'radius': -1}).status_code == 400
+    assert client.get(f'{base}/within', query_string={'min_x': 2, 'max_x': 1}).status_code == 400
+    assert client.get('/api/rooms/999/items/nearest', query_string={'x': 0, 'z': 0}).status_code == 404
+
+def test_own_changes_update_the_cached_grid_without_a_rebuild(client, room):
+    room_id, items = room
+    nearest = f'/api/rooms/{room_id}/items/nearest'
+    client.get(nearest, query_string={'x': 0, 'z': 0})
+    builds = room_indexes.builds
+
+    client.patch(f'/api/rooms/{room_id}', json={'items': {
+        'update': [{'id': items['Rug'], 'position': {'x': 0.5, 'z': 0}}],
+        'delete': [items['Lamp']],
+        'add': [{'name': 'Chair', 'category': 'furniture', 'position': {'x': 9, 'z': 9}}],
+    }})
+
+    assert _names(client.get(nearest, query_string={'x': 0, 'z': 0, 'k': 3})) == ['Rug', 'Shelf', 'Chair']
+    assert room_indexes.builds == builds
+
+def test_changes_from_elsewhere_rebuild_the_grid(client, room):
+    room_id, items = room
+    nearest = f'/api/rooms/{room_id}/items/nearest'
+    client.get(nearest, query_string={'x': 0, 'z': 0})
+    builds = room_indexes.builds
+
+    # Another worker process moved the rug: the row changed, and so did the room's version
+    db.session.get(RoomItem, items['Rug']).position = '{"x": 0.1, "z": 0}'
+    db.session.get(Room, room_id).updated_at = datetime.utcnow()
+    db.session.commit()
+
+    assert _names(client.get(nearest, query_string={'x': 0, 'z': 0, 'k': 1})) == ['Rug']
+    assert room_indexes.builds == builds + 1
+    client.get(nearest, query_string={'x': 0, 'z': 0, 'k': 1})
+    assert room_indexes.builds == builds + 1